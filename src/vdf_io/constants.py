@@ -2,3 +2,8 @@ INT_MAX = 2**63 - 10
 ID_COLUMN = "id"
 DISK_SPACE_LIMIT = 1e8  # 100 MB
 DEFAULT_BATCH_SIZE = 10_000
+DEFAULT_MAX_FILE_SIZE = 1024  # in MB
+DEFAULT_PREFETCH = 4
+IMPORT_JOURNAL_FILE = "VDF_IMPORT_JOURNAL.jsonl"
+EXPORT_STATE_FILE = "VDF_EXPORT_STATE.json"
+DEFAULT_CHECKPOINT_INTERVAL = 300  # in seconds
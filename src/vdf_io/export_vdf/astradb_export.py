@@ -1,7 +1,7 @@
 import argparse
+import base64
 import json
 import os
-import sys
 from typing import Dict, List
 from astrapy.db import AstraDB
 from tqdm import tqdm
@@ -9,7 +9,6 @@ from cassandra.cluster import Cluster
 from cassandra.auth import PlainTextAuthProvider
 from cassandra.query import SimpleStatement
 
-from vdf_io.constants import DISK_SPACE_LIMIT
 from vdf_io.meta_types import NamespaceMeta
 from vdf_io.names import DBNames
 from vdf_io.util import (
@@ -173,12 +172,25 @@ class ExportAstraDB(ExportVDB):
             count_query = f"SELECT COUNT(*) FROM {index_name}"
             count = self.session.execute(count_query, timeout=100.0).one()
             tqdm.write(f"Total rows in {index_name}: {count[0]}")
+            namespace_meta = self.completed_namespace_meta(index_name)
+            if namespace_meta is not None:
+                index_metas[index_name] = [namespace_meta]
+                continue
             tqdm.write(f"Exporting collection: {index_name}")
             namespace_metas = []
             vectors_directory = self.create_vec_dir(index_name)
-            pbar = tqdm(desc="Exporting data", unit="documents", total=count[0])
             no_queries_run = True
             exported_count = 0
+            checkpoint = self.get_checkpoint(index_name)
+            if checkpoint is not None:
+                self.paging_state = base64.b64decode(checkpoint["cursor"])
+                exported_count = checkpoint["exported_count"]
+            pbar = tqdm(
+                desc="Exporting data",
+                unit="documents",
+                total=count[0],
+                initial=exported_count,
+            )
             vectors = {}
             metadatas = {}
             while no_queries_run or self.paging_state:
@@ -196,19 +208,16 @@ class ExportAstraDB(ExportVDB):
                         if k not in ["_id", "$vector", "vector"]
                     }
                     pbar.update(1)
-                    if (
-                        sys.getsizeof(vectors) + sys.getsizeof(metadatas)
-                        > DISK_SPACE_LIMIT
-                    ):
-                        tqdm.write("Flushing to parquet files on disk")
-                        exported_count += self.save_vectors_to_parquet(
-                            vectors, metadatas, vectors_directory
-                        )
-            vectors_added = self.save_vectors_to_parquet(
-                vectors, metadatas, vectors_directory
-            )
-            exported_count += vectors_added
-            tqdm.write("Flushing to parquet files on disk")
+                exported_count += self.save_vectors_to_parquet(
+                    vectors, metadatas, vectors_directory
+                )
+                if self.paging_state:
+                    self.checkpoint(
+                        index_name,
+                        vectors_directory,
+                        base64.b64encode(self.paging_state).decode(),
+                        exported_count,
+                    )
             sample_doc = rows[0]
             if "$vector" in sample_doc:
                 dims = len(sample_doc["$vector"])
@@ -227,6 +236,7 @@ class ExportAstraDB(ExportVDB):
                     distance=self.args.get("distance_metric"),
                 )
             ]
+            self.complete_namespace(index_name, namespace_metas[0])
             index_metas[index_name] = namespace_metas
         self.file_structure.append(os.path.join(self.vdf_directory, "VDF_META.json"))
         internal_metadata = self.get_basic_vdf_meta(index_metas)
@@ -258,6 +268,11 @@ class ExportAstraDB(ExportVDB):
         index_metas: Dict[str, List[NamespaceMeta]] = {}
         self.total_imported_count = 0
         for index_name in index_names:
+            namespace_meta = self.completed_namespace_meta(index_name)
+            if namespace_meta is not None:
+                self.total_imported_count += namespace_meta.exported_vector_count
+                index_metas[index_name] = [namespace_meta]
+                continue
             tqdm.write(f"Exporting collection: {index_name}")
             namespace_metas = []
             vectors_directory = self.create_vec_dir(index_name)
@@ -267,8 +282,12 @@ class ExportAstraDB(ExportVDB):
             ids = []
             vectors = {}
             metadatas = {}
-            pbar = tqdm(desc="Exporting data", unit="documents")
             exported_count = 0
+            checkpoint = self.get_checkpoint(index_name)
+            if checkpoint is not None:
+                next_page_state = checkpoint["cursor"]
+                exported_count = tot_docs = checkpoint["exported_count"]
+            pbar = tqdm(desc="Exporting data", unit="documents", initial=tot_docs)
             while True:
                 search_results = collection.find(
                     sort=None, options={"pageState": next_page_state}
@@ -294,14 +313,14 @@ class ExportAstraDB(ExportVDB):
                         for doc in search_results["data"]["documents"]
                     }
                 )
-                # if getsizeof of vectors and metadata is too large, save to parquet
-                if sys.getsizeof(vectors) + sys.getsizeof(metadatas) > DISK_SPACE_LIMIT:
-                    tqdm.write("Flushing to parquet files on disk")
-                    exported_count += self.save_vectors_to_parquet(
-                        vectors, metadatas, vectors_directory
-                    )
+                exported_count += self.save_vectors_to_parquet(
+                    vectors, metadatas, vectors_directory
+                )
                 if search_results["data"]["nextPageState"] is None:
                     break
+                self.checkpoint(
+                    index_name, vectors_directory, next_page_state, exported_count
+                )
             exported_count += self.save_vectors_to_parquet(
                 vectors, metadatas, vectors_directory
             )
@@ -321,6 +340,7 @@ class ExportAstraDB(ExportVDB):
                     distance=self.args.get("distance_metric"),
                 )
             ]
+            self.complete_namespace(index_name, namespace_metas[0])
             self.total_imported_count += exported_count
             index_metas[index_name] = namespace_metas
         self.file_structure.append(os.path.join(self.vdf_directory, "VDF_META.json"))
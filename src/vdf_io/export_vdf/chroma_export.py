@@ -1,14 +1,158 @@
+import argparse
 import json
 import os
-import sys
+import pickle
+import sqlite3
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
+import numpy as np
+import pyarrow as pa
 import chromadb
 
-from vdf_io.constants import DEFAULT_BATCH_SIZE, DISK_SPACE_LIMIT
+from vdf_io.constants import DEFAULT_BATCH_SIZE, ID_COLUMN
 from vdf_io.names import DBNames
 from vdf_io.util import expand_shorthand_path, set_arg_from_input
-from vdf_io.export_vdf.vdb_export_cls import ExportVDB
+from vdf_io.export_vdf.vdb_export_cls import ExportVDB, to_arrow_array
+
+DEFAULT_THREADS = 4
+INCLUDE_FIELDS = ["metadatas", "documents", "embeddings", "uris"]
+# ids are listed in large pages of ids only
+ID_PAGE_SIZE = 100_000
+SQLITE_FILE = "chroma.sqlite3"
+DOCUMENT_KEY = "chroma:document"
+URI_KEY = "chroma:uri"
+# operations of the embeddings_queue table
+DELETE_OPERATION = 3
+# persistence version, offsetLevel0, max_elements, cur_element_count,
+# size_data_per_element, label_offset, offsetData, maxlevel, enterpoint_node,
+# maxM, maxM0, M, mult, ef_construction
+HNSW_HEADER_FORMAT = "<iQQQQQQiIQQQdQ"
+HNSW_PERSISTENCE_VERSION = 1
+
+
+def page_to_record_batch(page):
+    """
+    Build a RecordBatch with id, vector and metadata columns from the result
+    of a collection.get(), one column at a time
+    """
+    ids = page["ids"]
+    embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+    columns = {
+        ID_COLUMN: to_arrow_array(ids),
+        "vector": pa.ListArray.from_arrays(
+            pa.array(
+                np.arange(
+                    0, embeddings.size + 1, max(1, embeddings.shape[1]), dtype=np.int32
+                )
+            ),
+            pa.array(embeddings.ravel()),
+        ),
+    }
+    metadatas = [metadata or {} for metadata in page["metadatas"]]
+    extra_columns = {"document": page["documents"]}
+    for key in ("uris", "data"):
+        if page.get(key) is not None:
+            extra_columns[key.rstrip("s")] = page[key]
+    keys = dict.fromkeys(key for metadata in metadatas for key in metadata)
+    for key in keys:
+        if key in extra_columns:
+            continue
+        # Check for duplicate column names and rename as necessary
+        col_name = f"metadata_{key}" if key in columns else str(key)
+        columns[col_name] = to_arrow_array(
+            [metadata.get(key) for metadata in metadatas]
+        )
+    for key, values in extra_columns.items():
+        columns[key] = to_arrow_array(values)
+    return pa.RecordBatch.from_arrays(
+        list(columns.values()), names=list(columns.keys())
+    )
+
+
+class PersistedState:
+    """
+    Stand-in for the classes pickled by Chroma, keeping their attributes
+    """
+
+
+class PersistedStateUnpickler(pickle.Unpickler):
+    """
+    Load index_metadata.pickle without chromadb, refusing any other classes
+    """
+
+    def find_class(self, module, name):
+        if module.split(".")[0] == "chromadb":
+            return PersistedState
+        if module in ("builtins", "collections", "copyreg"):
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"Unexpected class {module}.{name}")
+
+
+class HnswSegmentReader:
+    """
+    Reads vectors straight from the files of a persisted Chroma HNSW segment.
+
+    data_level0.bin holds one fixed size element per vector (links, float32
+    vector, uint64 label) and is memory-mapped; index_metadata.pickle maps
+    embedding ids to labels.
+    """
+
+    def __init__(self, segment_directory):
+        self.id_to_label = {}
+        self.max_seq_id = None
+        self.num_elements = 0
+        metadata_path = os.path.join(segment_directory, "index_metadata.pickle")
+        if not os.path.isfile(metadata_path):
+            # nothing was flushed to the index yet
+            return
+        with open(metadata_path, "rb") as f:
+            state = PersistedStateUnpickler(f).load()
+        self.id_to_label = state.id_to_label
+        self.max_seq_id = getattr(state, "max_seq_id", None)
+        with open(os.path.join(segment_directory, "header.bin"), "rb") as f:
+            header = struct.unpack(
+                HNSW_HEADER_FORMAT, f.read(struct.calcsize(HNSW_HEADER_FORMAT))
+            )
+        if header[0] != HNSW_PERSISTENCE_VERSION:
+            raise ValueError(
+                f"Unsupported HNSW persistence version {header[0]} in '{segment_directory}'"
+            )
+        self.num_elements, element_size, label_offset, data_offset = header[3:7]
+        self.dims = (label_offset - data_offset) // 4
+        self.data_offset = data_offset
+        if self.num_elements == 0:
+            return
+        self.elements = np.memmap(
+            os.path.join(segment_directory, "data_level0.bin"),
+            dtype=np.uint8,
+            mode="r",
+            shape=(self.num_elements, element_size),
+        )
+        labels = np.ascontiguousarray(
+            self.elements[:, label_offset : label_offset + 8]
+        ).view(np.uint64)[:, 0]
+        self.label_order = np.argsort(labels)
+        self.sorted_labels = labels[self.label_order]
+
+    def get_vectors(self, embedding_ids):
+        """
+        Return {embedding_id: float32 vector} for the ids stored in the index
+        """
+        ids = [id for id in embedding_ids if id in self.id_to_label]
+        if not ids or self.num_elements == 0:
+            return {}
+        labels = np.array([self.id_to_label[id] for id in ids], dtype=np.uint64)
+        positions = np.searchsorted(self.sorted_labels, labels)
+        positions = np.minimum(positions, len(self.sorted_labels) - 1)
+        found = self.sorted_labels[positions] == labels
+        rows = self.label_order[positions[found]]
+        vectors = np.ascontiguousarray(
+            self.elements[rows, self.data_offset : self.data_offset + 4 * self.dims]
+        ).view(np.float32)
+        return dict(zip((id for id, ok in zip(ids, found) if ok), vectors))
 
 
 class ExportChroma(ExportVDB):
@@ -37,6 +181,25 @@ class ExportChroma(ExportVDB):
             help="Batch size for exporting data",
             default=DEFAULT_BATCH_SIZE,
         )
+        parser_chroma.add_argument(
+            "--threads",
+            type=int,
+            help=(
+                "Number of pages fetched concurrently from a Chroma server"
+                f" (default: {DEFAULT_THREADS})"
+            ),
+            default=DEFAULT_THREADS,
+        )
+        parser_chroma.add_argument(
+            "--direct_read",
+            type=bool,
+            help=(
+                "Read the SQLite tables and vector files of --persistent_path"
+                " directly instead of going through the Chroma client (default: False)"
+            ),
+            default=False,
+            action=argparse.BooleanOptionalAction,
+        )
 
     @classmethod
     def export_vdb(cls, args):
@@ -96,15 +259,27 @@ class ExportChroma(ExportVDB):
 
     def __init__(self, args):
         super().__init__(args)
-        if self.args.get("host_port") is not None:
+        self.direct_read = (
+            self.args.get("host_port") is None
+            and self.args.get("persistent_path") is not None
+            and self.args.get("direct_read") is True
+        )
+        # read-only connection to the SQLite file of a persistent store
+        self.db = None
+        if self.args.get("persistent_path") is not None:
+            self.persistent_path = expand_shorthand_path(
+                self.args.get("persistent_path")
+            )
+        if self.direct_read:
+            self.db = self.connect_sqlite()
+        elif self.args.get("host_port") is not None:
             host_port = self.args.get("host_port")
             self.client = chromadb.HttpClient(
                 host=host_port.split(":")[0], port=int(host_port.split(":")[1])
             )
         elif self.args.get("persistent_path") is not None:
-            self.client = chromadb.PersistentClient(
-                path=expand_shorthand_path(self.args.get("persistent_path"))
-            )
+            self.client = chromadb.PersistentClient(path=self.persistent_path)
+            self.db = self.connect_sqlite()
         else:
             self.client = chromadb.CloudClient(
                 tenant=self.args.get("tenant"),
@@ -112,7 +287,19 @@ class ExportChroma(ExportVDB):
                 api_key=self.args.get("api_key"),
             )
 
+    def connect_sqlite(self):
+        return sqlite3.connect(
+            f"file:{os.path.join(self.persistent_path, SQLITE_FILE)}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+        )
+
     def get_all_index_names(self):
+        if self.direct_read:
+            return [
+                row[0]
+                for row in self.db.execute("SELECT name FROM collections ORDER BY name")
+            ]
         return [coll.name for coll in self.client.list_collections()]
 
     def get_index_names(self):
@@ -123,46 +310,18 @@ class ExportChroma(ExportVDB):
     def get_data(self):
         batch_size = self.args.get("batch_size") or DEFAULT_BATCH_SIZE
         index_metas = {}
-        for i, collection_name in tqdm(
-            enumerate(self.get_index_names()), desc="Exporting collections"
+        for collection_name in tqdm(
+            self.get_index_names(), desc="Exporting collections"
         ):
-            dims = -1
-            col = self.client.get_collection(collection_name)
             vectors_directory = self.create_vec_dir(collection_name)
-            existing_count = col.count()
-            total = 0
-            for j in tqdm(
-                range(0, existing_count, batch_size),
-                desc=f"Exporting {collection_name} collection",
-            ):
-                batch = col.get(
-                    include=["metadatas", "documents", "embeddings"],
-                    limit=batch_size,
-                    offset=j,
+            if self.direct_read:
+                existing_count, total, dims, distance = self.read_persisted_collection(
+                    collection_name, vectors_directory, batch_size
+                )
+            else:
+                existing_count, total, dims, distance = self.fetch_collection(
+                    collection_name, vectors_directory, batch_size
                 )
-                vectors = {}
-                metadata = {}
-                chroma_ids = batch["ids"]
-                embeddings = batch["embeddings"]
-                chroma_metadatas = batch["metadatas"]
-                uris = batch["uris"]
-                data = batch["data"]
-                documents = batch["documents"]
-                dims = len(embeddings[0])
-                for idx, chroma_id in enumerate(chroma_ids):
-                    vectors[chroma_id] = embeddings[idx]
-                    metadata[chroma_id] = chroma_metadatas[idx]
-                    metadata[chroma_id]["document"] = documents[idx]
-                    if uris is not None and len(uris) > idx:
-                        metadata[chroma_id]["uri"] = uris[idx]
-                    if data is not None and len(data) > idx:
-                        metadata[chroma_id]["data"] = data[idx]
-                if sys.getsizeof(vectors) + sys.getsizeof(metadata) > DISK_SPACE_LIMIT:
-                    # save_vectors_to_parquet
-                    total += self.save_vectors_to_parquet(
-                        vectors, metadata, vectors_directory
-                    )
-            total += self.save_vectors_to_parquet(vectors, metadata, vectors_directory)
             namespace_metas = [
                 self.get_namespace_meta(
                     collection_name,
@@ -171,11 +330,7 @@ class ExportChroma(ExportVDB):
                     num_vectors_exported=total,
                     dim=dims,
                     vector_columns=["vector"],
-                    distance=(
-                        col.metadata.get("hnsw:space", "cosine")
-                        if (hasattr(col, "metadata") and col.metadata is not None)
-                        else "cosine"
-                    ),
+                    distance=distance,
                 )
             ]
             index_metas[collection_name] = namespace_metas
@@ -186,3 +341,258 @@ class ExportChroma(ExportVDB):
         with open(os.path.join(self.vdf_directory, "VDF_META.json"), "w") as json_file:
             json_file.write(meta_text)
         return True
+
+    def fetch_collection(self, collection_name, vectors_directory, batch_size):
+        """
+        Export a collection through the Chroma client.
+        Returns its count, the number of exported vectors, dims and distance.
+        """
+        dims = -1
+        col = self.client.get_collection(collection_name)
+        existing_count = col.count()
+        total = 0
+        include = INCLUDE_FIELDS
+        if getattr(col, "_data_loader", None) is not None:
+            include = include + ["data"]
+        # offset pages of full rows rescan the collection from the start, so
+        # only the ids are paged through and every page is fetched by its ids
+        id_pages = (
+            ids[j : j + batch_size]
+            for ids in self.list_ids(col)
+            for j in range(0, len(ids), batch_size)
+        )
+        pbar = tqdm(
+            total=existing_count, desc=f"Exporting {collection_name} collection"
+        )
+        for page in self.fetch_pages(col, id_pages, include):
+            if not page["ids"]:
+                continue
+            batch = page_to_record_batch(page)
+            dims = len(batch.column(1)[0])
+            total += self.save_record_batch_to_parquet(batch, vectors_directory)
+            pbar.update(batch.num_rows)
+        pbar.close()
+        distance = (
+            col.metadata.get("hnsw:space", "cosine")
+            if (hasattr(col, "metadata") and col.metadata is not None)
+            else "cosine"
+        )
+        return existing_count, total, dims, distance
+
+    def read_persisted_collection(self, collection_name, vectors_directory, batch_size):
+        """
+        Export a collection by reading the persistent directory directly: ids,
+        documents and metadata from the SQLite metadata segment, vectors from
+        the files of the HNSW segment, and vectors not flushed to the index
+        yet from the embeddings queue.
+        Returns its count, the number of exported vectors, dims and distance.
+        """
+        row = self.db.execute(
+            "SELECT id FROM collections WHERE name = ?", (collection_name,)
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Collection '{collection_name}' not found")
+        collection_id = row[0]
+        segments = dict(
+            self.db.execute(
+                "SELECT scope, id FROM segments WHERE collection = ?",
+                (collection_id,),
+            ).fetchall()
+        )
+        metadata_segment = segments["METADATA"]
+        reader = HnswSegmentReader(
+            os.path.join(self.persistent_path, segments["VECTOR"])
+        )
+        max_seq_id = reader.max_seq_id
+        if max_seq_id is None:
+            max_seq_id = self.persisted_max_seq_id(segments["VECTOR"])
+        pending_vectors = self.read_pending_vectors(collection_id, max_seq_id)
+        existing_count = self.db.execute(
+            "SELECT COUNT(*) FROM embeddings WHERE segment_id = ?",
+            (metadata_segment,),
+        ).fetchone()[0]
+        dims = -1
+        total = 0
+        pbar = tqdm(
+            total=existing_count, desc=f"Exporting {collection_name} collection"
+        )
+        for rows in self.embedding_rows(metadata_segment, batch_size):
+            metadatas = {row_id: {} for row_id, _ in rows}
+            for row_id, key, *values in self.db.execute(
+                "SELECT id, key, string_value, int_value, float_value, bool_value"
+                " FROM embedding_metadata WHERE id BETWEEN ? AND ?",
+                (rows[0][0], rows[-1][0]),
+            ):
+                if row_id in metadatas:
+                    metadatas[row_id][key] = metadata_value(*values)
+            embedding_ids = [embedding_id for _, embedding_id in rows]
+            vectors = reader.get_vectors(embedding_ids)
+            vectors.update(
+                (embedding_id, pending_vectors[embedding_id])
+                for embedding_id in embedding_ids
+                if embedding_id in pending_vectors
+            )
+            num_missing = sum(
+                embedding_id not in vectors for embedding_id in embedding_ids
+            )
+            if num_missing:
+                # the layout of the store is not the one this reader knows
+                raise RuntimeError(
+                    f"{num_missing} ids of '{collection_name}' have no vector in the"
+                    " persisted index or the embeddings queue, export it with --no-direct_read"
+                )
+            page = {
+                "ids": [],
+                "embeddings": [],
+                "metadatas": [],
+                "documents": [],
+                "uris": [],
+            }
+            for row_id, embedding_id in rows:
+                metadata = metadatas[row_id]
+                page["ids"].append(embedding_id)
+                page["embeddings"].append(vectors[embedding_id])
+                page["documents"].append(metadata.pop(DOCUMENT_KEY, None))
+                page["uris"].append(metadata.pop(URI_KEY, None))
+                page["metadatas"].append(
+                    {k: v for k, v in metadata.items() if not k.startswith("chroma:")}
+                )
+            pbar.update(len(rows))
+            batch = page_to_record_batch(page)
+            dims = len(page["embeddings"][0])
+            total += self.save_record_batch_to_parquet(batch, vectors_directory)
+        pbar.close()
+        row = self.db.execute(
+            "SELECT str_value FROM collection_metadata"
+            " WHERE collection_id = ? AND key = 'hnsw:space'",
+            (collection_id,),
+        ).fetchone()
+        distance = row[0] if row is not None else "cosine"
+        return existing_count, total, dims, distance
+
+    def persisted_max_seq_id(self, segment_id):
+        """
+        Last queue position flushed to a segment, kept in SQLite by newer
+        Chroma versions instead of index_metadata.pickle
+        """
+        try:
+            row = self.db.execute(
+                "SELECT seq_id FROM max_seq_id WHERE segment_id = ?", (segment_id,)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        if row is None:
+            return None
+        if isinstance(row[0], bytes):
+            return int.from_bytes(row[0], "big")
+        return row[0]
+
+    def read_pending_vectors(self, collection_id, max_seq_id):
+        """
+        Latest vectors written to the embeddings queue of a collection after
+        the HNSW segment was last persisted
+        """
+        if max_seq_id is None:
+            max_seq_id = -1
+        pending_vectors = {}
+        for embedding_id, operation, vector, encoding in self.db.execute(
+            "SELECT id, operation, vector, encoding FROM embeddings_queue"
+            " WHERE topic LIKE ? AND seq_id > ? ORDER BY seq_id",
+            (f"%{collection_id}", max_seq_id),
+        ):
+            if operation == DELETE_OPERATION:
+                pending_vectors.pop(embedding_id, None)
+            elif vector is not None:
+                dtype = np.int32 if encoding == "INT32" else np.float32
+                pending_vectors[embedding_id] = np.frombuffer(vector, dtype=dtype)
+        return pending_vectors
+
+    def embedding_rows(self, metadata_segment, page_size):
+        """
+        Yield pages of (row id, embedding id) of a metadata segment, keyset
+        paged over the integer primary key of the embeddings table
+        """
+        last_row_id = -1
+        while True:
+            rows = self.db.execute(
+                "SELECT id, embedding_id FROM embeddings"
+                " WHERE segment_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (metadata_segment, last_row_id, page_size),
+            ).fetchall()
+            if not rows:
+                return
+            yield rows
+            last_row_id = rows[-1][0]
+
+    def list_ids(self, col):
+        """
+        Yield the ids of a collection in pages of up to ID_PAGE_SIZE ids.
+
+        The ids of a persistent store are keyset paged in its SQLite file.
+        Other clients can only page with get(offset=...), which skips over all
+        earlier ids again for every page: listing the ids of a large remote
+        collection stays quadratic, divided by ID_PAGE_SIZE.
+        """
+        if self.db is not None:
+            try:
+                segment = self.db.execute(
+                    "SELECT id FROM segments WHERE collection = ? AND scope = 'METADATA'",
+                    (str(col.id),),
+                ).fetchone()
+            except sqlite3.OperationalError:
+                # not a SQLite layout this reader knows
+                segment = None
+            if segment is not None:
+                for rows in self.embedding_rows(segment[0], ID_PAGE_SIZE):
+                    yield [embedding_id for _, embedding_id in rows]
+                return
+        offset = 0
+        while True:
+            ids = col.get(include=[], limit=ID_PAGE_SIZE, offset=offset)["ids"]
+            if ids:
+                yield ids
+            if len(ids) < ID_PAGE_SIZE:
+                return
+            offset += len(ids)
+
+    def fetch_pages(self, col, id_pages, include=INCLUDE_FIELDS):
+        """
+        Fetch pages of ids, yielding the results in the order of id_pages.
+
+        Pages are fetched concurrently from a Chroma server; a persistent
+        client reads the next page while the current one is written.
+        """
+        threads = (
+            1
+            if self.args.get("host_port") is None
+            and self.args.get("persistent_path") is not None
+            else self.args.get("threads") or DEFAULT_THREADS
+        )
+        in_flight = deque()
+        executor = ThreadPoolExecutor(max_workers=threads)
+        try:
+            for page_ids in id_pages:
+                in_flight.append(
+                    executor.submit(col.get, ids=page_ids, include=include)
+                )
+                if len(in_flight) > threads:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def metadata_value(string_value, int_value, float_value, bool_value):
+    """
+    The value of a row of the embedding_metadata table
+    """
+    if string_value is not None:
+        return string_value
+    if int_value is not None:
+        return int_value
+    if float_value is not None:
+        return float_value
+    if bool_value is not None:
+        return bool(bool_value)
+    return None
@@ -1,12 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 import os
 import json
 import datetime
+import numpy as np
+import pyarrow as pa
 from tqdm import tqdm
-from pymilvus import connections, utility, Collection
+from pymilvus import connections, utility, Collection, DataType
 
 
-from vdf_io.export_vdf.vdb_export_cls import ExportVDB
+from vdf_io.constants import ID_COLUMN
+from vdf_io.export_vdf.vdb_export_cls import ExportVDB, to_arrow_array
 from vdf_io.meta_types import NamespaceMeta, VDFMeta
 from vdf_io.util import (
     get_author_name,
@@ -18,6 +22,35 @@ from vdf_io.names import DBNames
 
 
 MAX_FETCH_SIZE = 1_000
+DEFAULT_THREADS = 4
+INT64_MIN, INT64_MAX = -(2**63), 2**63 - 1
+
+
+def rows_to_record_batch(rows, id_field, vector_field, float_vector=True):
+    """
+    Build a RecordBatch with id, vector and metadata columns from the rows of
+    a Milvus query, one column at a time
+    """
+    columns = {ID_COLUMN: to_arrow_array([row[id_field] for row in rows])}
+    vectors = [row[vector_field] for row in rows]
+    if float_vector:
+        values = np.asarray(vectors, dtype=np.float32)
+        columns["vector"] = pa.ListArray.from_arrays(
+            pa.array(np.arange(0, values.size + 1, values.shape[1], dtype=np.int32)),
+            pa.array(values.ravel()),
+        )
+    else:
+        columns["vector"] = to_arrow_array(vectors)
+    # dynamic fields differ from row to row
+    keys = dict.fromkeys(
+        key for row in rows for key in row if key not in (id_field, vector_field)
+    )
+    for key in keys:
+        col_name = f"metadata_{key}" if key in columns else str(key)
+        columns[col_name] = to_arrow_array([row.get(key) for row in rows])
+    return pa.RecordBatch.from_arrays(
+        list(columns.values()), names=list(columns.keys())
+    )
 
 
 class ExportMilvus(ExportVDB):
@@ -38,6 +71,16 @@ class ExportMilvus(ExportVDB):
         parser_milvus.add_argument(
             "-c", "--collections", type=str, help="Names of collections to export"
         )
+        parser_milvus.add_argument(
+            "--threads",
+            type=int,
+            help=(
+                "Number of query iterators run concurrently over primary key ranges"
+                " or partitions, each into its own parquet files"
+                f" (default: {DEFAULT_THREADS})"
+            ),
+            default=DEFAULT_THREADS,
+        )
 
     @classmethod
     def export_vdb(cls, args):
@@ -115,6 +158,10 @@ class ExportMilvus(ExportVDB):
         return utility.list_collections()
 
     def get_data_for_collection(self, collection_name: str) -> List[NamespaceMeta]:
+        namespace_meta = self.completed_namespace_meta(collection_name)
+        if namespace_meta is not None:
+            self.args["exported_count"] += namespace_meta.exported_vector_count
+            return [namespace_meta]
         vectors_directory = self.create_vec_dir(collection_name)
 
         try:
@@ -127,35 +174,65 @@ class ExportMilvus(ExportVDB):
         dim = None
         id_field = collection.primary_field.name
         vector_field = None
+        float_vector = True
         all_fields = []
         for f in collection.schema.fields:
             all_fields.append(f.name)
             if f.dtype.value in [100, 101]:
                 dim = f.params["dim"]
                 vector_field = f.name
+                float_vector = f.dtype == DataType.FLOAT_VECTOR
 
-        num_vectors_exported = 0
-        pbar = tqdm(total=total, desc=f"Exporting {collection_name}")
-        query_iterator = collection.query_iterator(
-            batch_size=MAX_FETCH_SIZE, output_fields=all_fields
+        checkpoint = self.get_checkpoint(collection_name)
+        if checkpoint is not None:
+            parts = checkpoint["parts"]
+        else:
+            parts = self.get_parts(
+                collection, id_field, self.args.get("threads") or DEFAULT_THREADS
+            )
+            self.checkpoint(
+                collection_name,
+                vectors_directory,
+                None,
+                0,
+                force=True,
+                parts=parts,
+            )
+        part_checkpoints = [
+            self.get_checkpoint(f"{collection_name}/{i}") for i in range(len(parts))
+        ]
+        pbar = tqdm(
+            total=total,
+            initial=sum(
+                checkpoint["exported_count"]
+                for checkpoint in part_checkpoints
+                if checkpoint is not None
+            ),
+            desc=f"Exporting {collection_name}",
         )
-
-        while True:
-            res = query_iterator.next()
-            if len(res) == 0:
-                query_iterator.close()
-                break
-
-            vectors = {}
-            metadata = {}
-            for res_i in res:
-                k = res_i.pop(id_field)
-                vectors[k] = res_i.pop(vector_field)
-                metadata[k] = res_i
-            self.save_vectors_to_parquet(vectors, metadata, vectors_directory)
-
-            num_vectors_exported += len(res)
-            pbar.update(len(res))
+        with ThreadPoolExecutor(
+            max_workers=min(len(parts), self.args.get("threads") or DEFAULT_THREADS)
+        ) as executor:
+            futures = [
+                executor.submit(
+                    self.export_part,
+                    collection,
+                    vectors_directory,
+                    i,
+                    part,
+                    part_checkpoints[i],
+                    dict(
+                        id_field=id_field,
+                        vector_field=vector_field,
+                        float_vector=float_vector,
+                        output_fields=all_fields,
+                    ),
+                    pbar,
+                )
+                for i, part in enumerate(parts)
+            ]
+            num_vectors_exported = sum(future.result() for future in futures)
+        pbar.close()
 
         namespace_meta = NamespaceMeta(
             namespace="",
@@ -165,11 +242,129 @@ class ExportMilvus(ExportVDB):
             vector_columns=[vector_field],
             dimensions=dim,
             model_name=self.args.get("model_name"),
-            data_path="/".join(vectors_directory.split("/")[1:]),
+            data_path=os.path.relpath(vectors_directory, self.vdf_directory),
             metric=standardize_metric(
                 collection.indexes[0].params["metric_type"], self.DB_NAME_SLUG
             ),
         )
+        self.complete_namespace(collection_name, namespace_meta)
         self.args["exported_count"] += num_vectors_exported
 
         return [namespace_meta]
+
+    def get_parts(self, collection, id_field, num_parts):
+        """
+        Split a collection into parts that can be exported concurrently.
+
+        A collection with an int64 primary key is split into num_parts even
+        [start, end) key ranges between its smallest and largest key; the first
+        and the last range are open so that they also pick up keys inserted
+        meanwhile. Otherwise there is one part per non-empty partition.
+        """
+        if num_parts > 1 and collection.primary_field.dtype == DataType.INT64:
+            bounds = self.get_pk_bounds(collection, id_field)
+            if bounds is None:
+                return [dict(partition=None, start=None, end=None)]
+            first_pk, last_pk = bounds
+            step = max(1, -(-(last_pk + 1 - first_pk) // num_parts))
+            starts = list(range(first_pk, last_pk + 1, step))
+            ends = starts[1:] + [None]
+            starts[0] = None
+            return [
+                dict(partition=None, start=start, end=end)
+                for start, end in zip(starts, ends)
+            ]
+        partitions = [
+            partition.name
+            for partition in collection.partitions
+            if partition.num_entities > 0
+        ]
+        if len(partitions) <= 1:
+            return [dict(partition=None, start=None, end=None)]
+        return [dict(partition=name, start=None, end=None) for name in partitions]
+
+    def get_pk_bounds(self, collection, id_field):
+        """
+        Smallest and largest int64 primary key of a collection (None if it is
+        empty), found by binary search with single-row queries
+        """
+
+        def any_pk(expr):
+            rows = collection.query(expr=expr, output_fields=[id_field], limit=1)
+            return rows[0][id_field] if rows else None
+
+        high = any_pk(f"{id_field} >= {INT64_MIN}")
+        if high is None:
+            return None
+        low = INT64_MIN
+        while low < high:
+            mid = (low + high) // 2
+            pk = any_pk(f"{id_field} <= {mid}")
+            if pk is None:
+                low = mid + 1
+            else:
+                high = pk
+        first_pk = low
+        low, high = first_pk, INT64_MAX
+        while low < high:
+            mid = (low + high + 1) // 2
+            pk = any_pk(f"{id_field} >= {mid}")
+            if pk is None:
+                high = mid - 1
+            else:
+                low = pk
+        return first_pk, low
+
+    def export_part(
+        self, collection, vectors_directory, i, part, checkpoint, fields, pbar
+    ):
+        """
+        Drain a query iterator over one part of a collection into its own
+        Parquet shard
+        """
+        collection_name = collection.name
+        id_field = fields["id_field"]
+        key = f"{collection_name}/{i}"
+        num_vectors_exported = 0
+        conditions = []
+        if part["start"] is not None:
+            conditions.append(f"{id_field} >= {part['start']}")
+        if part["end"] is not None:
+            conditions.append(f"{id_field} < {part['end']}")
+        # the iterator pages through the part in primary key order,
+        # so the last exported key is the cursor to resume from
+        if checkpoint is not None:
+            if checkpoint["cursor"] is None:
+                return checkpoint["exported_count"]
+            num_vectors_exported = checkpoint["exported_count"]
+            conditions.append(f"{id_field} > {json.dumps(checkpoint['cursor'])}")
+        query_iterator = collection.query_iterator(
+            batch_size=MAX_FETCH_SIZE,
+            expr=" and ".join(conditions) or None,
+            output_fields=fields["output_fields"],
+            partition_names=[part["partition"]] if part["partition"] else None,
+        )
+        while True:
+            res = query_iterator.next()
+            if len(res) == 0:
+                query_iterator.close()
+                break
+            num_vectors_exported += self.save_record_batch_to_parquet(
+                rows_to_record_batch(
+                    res, id_field, fields["vector_field"], fields["float_vector"]
+                ),
+                vectors_directory,
+                shard=i,
+            )
+            pbar.update(len(res))
+            self.checkpoint(
+                key,
+                vectors_directory,
+                max(row[id_field] for row in res),
+                num_vectors_exported,
+                shard=i,
+            )
+        self.checkpoint(
+            key, vectors_directory, None, num_vectors_exported, force=True, shard=i
+        )
+        return num_vectors_exported
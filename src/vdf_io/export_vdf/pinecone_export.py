@@ -2,6 +2,11 @@ import argparse
 import datetime
 import os
 import json
+import string
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import itertools
 import numpy as np
 from tqdm import tqdm
 from halo import Halo
@@ -14,17 +19,77 @@ from vdf_io.names import DBNames
 from vdf_io.meta_types import NamespaceMeta, VDFMeta
 from vdf_io.util import (
     get_author_name,
+    prefetch,
+    prefetch_chain,
     set_arg_from_input,
     set_arg_from_password,
     standardize_metric,
 )
 from vdf_io.export_vdf.vdb_export_cls import ExportVDB
+from vdf_io.import_vdf.vdf_import_cls import BatchUploader
 
 PINECONE_MAX_K = 10_000
 MAX_TRIES_OVERALL = 150
 MAX_FETCH_SIZE = 1_000
 THREAD_POOL_SIZE = 30
+# new ids per query, as a fraction of PINECONE_MAX_K, below which a round of
+# random queries counts as stale
+MIN_DISCOVERY_RATE = 0.01
+DISCOVERY_PATIENCE = 5
 use_list_points_default = True
+ID_PREFIX_ALPHABETS = {
+    "hex": string.hexdigits,
+    "digits": string.digits,
+    "alphanumeric": string.digits + string.ascii_letters,
+}
+
+
+def parse_id_prefixes(list_prefixes):
+    """
+    Parse --list_prefixes, the name of an alphabet in ID_PREFIX_ALPHABETS or a
+    comma separated list of prefixes.
+
+    Prefixes that extend another one are dropped, so that the listings of the
+    remaining prefixes are disjoint and never return an id twice.
+    """
+    if not list_prefixes:
+        return []
+    prefixes = ID_PREFIX_ALPHABETS.get(list_prefixes, list_prefixes.split(","))
+    prefixes = sorted(set(prefix for prefix in prefixes if prefix))
+    return [
+        prefix
+        for prefix in prefixes
+        if not any(prefix != other and prefix.startswith(other) for other in prefixes)
+    ]
+
+
+def random_query_vectors(num_queries, range_min, range_max, stratified=False):
+    """
+    Draw num_queries query vectors within [range_min, range_max).
+
+    Stratified draws put exactly one query in each of num_queries equal slices
+    of every dimension (latin hypercube sampling), which spreads the queries of
+    a round over the whole range.
+    """
+    shape = (num_queries, len(range_min))
+    if stratified:
+        strata = np.argsort(np.random.rand(*shape), axis=0)
+        unit = (strata + np.random.rand(*shape)) / num_queries
+    else:
+        unit = np.random.rand(*shape)
+    return unit * (range_max - range_min) + range_min
+
+
+def batch_ids_from_pages(id_pages, batch_size):
+    """
+    Regroup pages of ids into lists of batch_size ids
+    """
+    ids = itertools.chain.from_iterable(id_pages)
+    while True:
+        batch = list(itertools.islice(ids, batch_size))
+        if not batch:
+            return
+        yield batch
 
 
 class ExportPinecone(ExportVDB):
@@ -77,6 +142,26 @@ class ExportPinecone(ExportVDB):
             default=use_list_points_default,
             action=argparse.BooleanOptionalAction,
         )
+        parser_pinecone.add_argument(
+            "--list_prefixes",
+            type=str,
+            help=(
+                "List ids concurrently by prefix, either an alphabet"
+                f" ({', '.join(ID_PREFIX_ALPHABETS)}) or comma separated prefixes."
+                " Ids matching none of the prefixes are not exported (default: None)"
+            ),
+            default=None,
+        )
+        parser_pinecone.add_argument(
+            "--stream_ids",
+            type=bool,
+            help=(
+                "Fetch vectors while their ids are being listed with list_points,"
+                " instead of collecting all ids first (default: True)"
+            ),
+            default=True,
+            action=argparse.BooleanOptionalAction,
+        )
         parser_pinecone.add_argument(
             "--subset",
             type=bool,
@@ -90,6 +175,12 @@ class ExportPinecone(ExportVDB):
             help="Name of namespace(s) to export (comma-separated)",
             default=None,
         )
+        parser_pinecone.add_argument(
+            "--threads",
+            type=int,
+            help=f"Number of concurrent requests to Pinecone (default: {THREAD_POOL_SIZE})",
+            default=THREAD_POOL_SIZE,
+        )
 
     @classmethod
     def export_vdb(cls, args):
@@ -199,53 +290,10 @@ class ExportPinecone(ExportVDB):
             tqdm.write(
                 f"Found {len(ids_to_mark)} vectors that have not been exported yet."
             )
-            # fetch the vectors and upsert them with the exported_vectorio flag with MAX_FETCH_SIZE at a time
-            mark_pbar = tqdm(total=len(ids_to_mark), desc="Step 1/3: Marking vectors")
-            mark_batch_size = MAX_FETCH_SIZE
-            i = 0
-            while i < len(ids_to_mark):
-                batch_ids = ids_to_mark[i : i + mark_batch_size]
-                try:
-                    data = self.index.fetch(batch_ids, namespace=namespace)
-                except Exception as e:
-                    tqdm.write(
-                        f"Error fetching vectors: {e}. Trying with a smaller batch size (--batch_size)"
-                    )
-                    mark_batch_size = mark_batch_size * 3 // 4
-                    if mark_batch_size < 1:
-                        raise Exception("Could not fetch vectors")
-                    continue
-                batch_vectors = data["vectors"]
-                # verify that the ids are the same
-                assert set(batch_ids) == set(batch_vectors.keys())
-                # add exported_vectorio flag to metadata
-                # Format the vectors for upsert
-                upsert_data = []
-                for id, vector_data in batch_vectors.items():
-                    if "metadata" not in vector_data:
-                        vector_data["metadata"] = {}
-                    vector_data["metadata"][marker_key] = True
-                    cur_vec = Vector(
-                        id=id,
-                        values=vector_data["values"],
-                        metadata=vector_data["metadata"],
-                    )
-                    if vector_data.get("sparseValues"):
-                        cur_vec.sparse_values = vector_data["sparseValues"]
-                    upsert_data.append(cur_vec)
-                # upsert the vectors
-                try:
-                    resp = self.index.upsert(vectors=upsert_data, namespace=namespace)
-                except Exception as e:
-                    tqdm.write(
-                        f"Error upserting vectors: {e}. Trying with a smaller batch size (--batch_size)"
-                    )
-                    mark_batch_size = mark_batch_size * 3 // 4
-                    if mark_batch_size < 1:
-                        raise Exception("Could not upsert vectors")
-                    continue
-                i += resp.upserted_count
-                mark_pbar.update(len(batch_ids))
+            # fetch the vectors and upsert them with the exported_vectorio flag
+            self.set_export_marker(
+                ids_to_mark, namespace, marker_key, True, "Step 1/3: Marking vectors"
+            )
             self.collected_ids_by_modifying = True
             tqdm.write(f"Marked {len(ids_to_mark)} vectors as exported.")
         else:
@@ -286,15 +334,17 @@ class ExportPinecone(ExportVDB):
         if self.args.get("use_list_points", use_list_points_default):
             try:
                 # Use list_points with implicit pagination to get all IDs
-                all_ids = []
-                with Halo(text="Collecting IDs using list_points", spinner="dots"):
-                    for ids in self.index.list(namespace=namespace):
-                        all_ids.extend(ids)
+                id_pages = self.list_id_pages(namespace)
+                if id_pages is not None:
+                    all_ids = []
+                    with Halo(text="Collecting IDs using list_points", spinner="dots"):
+                        for ids in id_pages:
+                            all_ids.extend(ids)
 
-                tqdm.write(
-                    f"Collected {len(all_ids)} IDs using list_points with implicit pagination."
-                )
-                return all_ids
+                    tqdm.write(
+                        f"Collected {len(all_ids)} IDs using list_points with implicit pagination."
+                    )
+                    return all_ids
             except Exception as e:
                 tqdm.write(
                     f"Error fetching IDs using list_points. Falling back to random search method: {e}"
@@ -378,52 +428,86 @@ class ExportPinecone(ExportVDB):
                         )
                     return [str(x) for x in all_ids]
         # random search method
+        return self.discover_ids_by_query(
+            namespace, num_dimensions, num_vectors, hash_value, all_ids
+        )
+
+    def discover_ids_by_query(
+        self, namespace, num_dimensions, num_vectors, hash_value, all_ids
+    ):
+        """
+        Collect ids with rounds of concurrent queries on random vectors.
+
+        Query vectors are drawn within the range of the vectors found so far,
+        alternating between uniform and stratified rounds. Discovery stops when
+        all vectors were found, after max_tries queries, or after
+        DISCOVERY_PATIENCE rounds in a row that found less than
+        MIN_DISCOVERY_RATE of the ids their queries could return.
+        """
+        # marking vectors changes the results of the next queries
+        threads = (
+            1
+            if self.args.get("modify_to_search")
+            else self.args.get("threads") or THREAD_POOL_SIZE
+        )
         max_tries = max((num_vectors // PINECONE_MAX_K) * 3, MAX_TRIES_OVERALL)
         try_count = 0
+        num_rounds = 0
+        stale_rounds = 0
         # -1s in each dimension are the min values
-        vector_range_min = np.array([-1] * num_dimensions)
-        vector_range_max = np.array([1] * num_dimensions)
-        with tqdm(
-            total=num_vectors, desc="Collecting IDs using random vector search"
-        ) as pbar:
-            while len(all_ids) < num_vectors:
-                # fetch 10 random vectors from all_ids
-                if len(all_ids) > 10:
-                    vector_range_min, vector_range_max = self.update_range(
-                        all_ids, vector_range_min, vector_range_max, namespace
-                    )
-                input_vector = (
-                    np.random.rand(num_dimensions)
-                    * (vector_range_max - vector_range_min)
-                    + vector_range_min
-                )
-                ids = self.get_ids_from_vector_query(
-                    input_vector.tolist(), namespace, all_ids, hash_value
+        vector_range_min = np.full(num_dimensions, -1.0)
+        vector_range_max = np.full(num_dimensions, 1.0)
+        query = partial(
+            self.get_ids_from_vector_query,
+            namespace=namespace,
+            all_ids=all_ids,
+            hash_value=hash_value,
+        )
+        with (
+            ThreadPoolExecutor(max_workers=threads) as executor,
+            tqdm(
+                total=num_vectors,
+                initial=len(all_ids),
+                desc="Collecting IDs using random vector search",
+            ) as pbar,
+        ):
+            while len(all_ids) < num_vectors and try_count < max_tries:
+                num_queries = min(threads, max_tries - try_count)
+                query_vectors = random_query_vectors(
+                    num_queries,
+                    vector_range_min,
+                    vector_range_max,
+                    stratified=num_rounds % 2 == 1,
                 )
-                prev_size = len(all_ids)
-                all_ids.update(ids)
-                if len(ids) == 0:
+                results = list(executor.map(query, query_vectors.tolist()))
+                try_count += num_queries
+                num_rounds += 1
+                if not any(results):
                     tqdm.write("No new ids found, exiting...")
                     break
-                new_ids = all_ids - set(ids)
-                if len(new_ids) > 0:
-                    # fetch 1 random vector from new_ids
-                    self.update_range_from_new_ids(
-                        vector_range_min, vector_range_max, new_ids, namespace
-                    )
-                curr_size = len(all_ids)
-                if curr_size > prev_size:
-                    tqdm.write(
-                        f"updating ids set with {curr_size - prev_size} new ids..."
+                new_ids = set().union(*results) - all_ids
+                all_ids.update(new_ids)
+                pbar.update(len(new_ids))
+                pbar.set_postfix(coverage=f"{len(all_ids) / max(1, num_vectors):.1%}")
+                if new_ids:
+                    # widen the range with vectors of the newly found ids
+                    vector_range_min, vector_range_max = self.update_range(
+                        new_ids, vector_range_min, vector_range_max, namespace
                     )
-                try_count += 1
-                if try_count > max_tries and len(all_ids) < num_vectors:
+                if len(new_ids) < MIN_DISCOVERY_RATE * num_queries * PINECONE_MAX_K:
+                    stale_rounds += 1
+                else:
+                    stale_rounds = 0
+                if stale_rounds >= DISCOVERY_PATIENCE:
                     tqdm.write(
-                        f"Could not collect all ids after {max_tries} random searches."
-                        " Please provide range of ids instead. Exporting the ids collected so far."
+                        f"Found few new ids in the last {stale_rounds} rounds of queries, stopping."
                     )
                     break
-                pbar.update(curr_size - prev_size)
+        if len(all_ids) < num_vectors:
+            tqdm.write(
+                f"Could not collect all ids after {try_count} random searches."
+                " Please provide range of ids instead. Exporting the ids collected so far."
+            )
         tqdm.write(
             f"Collected {len(all_ids)} ids out of {num_vectors} vectors in {try_count} tries."
         )
@@ -438,32 +522,53 @@ class ExportPinecone(ExportVDB):
 
         # unmark the vectors as exported
         marker_key = "exported_vectorio_" + hash_value
-        for i in tqdm(
-            range(0, len(all_ids), MAX_FETCH_SIZE), desc="Step 2/3: Unmarking vectors"
-        ):
-            batch_ids = all_ids[i : i + MAX_FETCH_SIZE]
-            data = self.index.fetch(batch_ids, namespace=namespace)
-            batch_vectors = data["vectors"]
-            # verify that the ids are the same
-            assert set(batch_ids) == set(batch_vectors.keys())
-            # add exported_vectorio flag to metadata
-            # Format the vectors for upsert
-            upsert_data = []
-            for id, vector_data in batch_vectors.items():
-                if "metadata" in vector_data:
-                    del vector_data["metadata"][marker_key]
-                cur_vec = Vector(
-                    id=id,
-                    values=vector_data["values"],
-                    metadata=vector_data["metadata"],
-                )
-                if vector_data.get("sparseValues"):
-                    cur_vec.sparse_values = vector_data["sparseValues"]
-                upsert_data.append(cur_vec)
-            # upsert the vectors
-            self.index.upsert(vectors=upsert_data, namespace=namespace)
+        self.set_export_marker(
+            all_ids, namespace, marker_key, False, "Step 2/3: Unmarking vectors"
+        )
         tqdm.write(f"Unmarked {len(all_ids)} vectors as exported.")
 
+    def set_export_marker(self, ids, namespace, marker_key, marked, desc):
+        """
+        Set (or remove) the marker_key flag in the metadata of ids.
+
+        Batches are fetched concurrently and re-upserted by a BatchUploader as
+        they arrive, so fetching and upserting overlap.
+        """
+
+        def marked_vectors():
+            id_batches = (
+                ids[i : i + MAX_FETCH_SIZE] for i in range(0, len(ids), MAX_FETCH_SIZE)
+            )
+            for _, batch_vectors in self.fetch_batches(id_batches, namespace):
+                for id, vector_data in batch_vectors.items():
+                    metadata = dict(vector_data.get("metadata") or {})
+                    if marked:
+                        metadata[marker_key] = True
+                    else:
+                        metadata.pop(marker_key, None)
+                    cur_vec = Vector(
+                        id=id, values=vector_data["values"], metadata=metadata
+                    )
+                    if vector_data.get("sparseValues"):
+                        cur_vec.sparse_values = vector_data["sparseValues"]
+                    yield cur_vec
+
+        def upsert_batch(batch):
+            return self.index.upsert(vectors=batch, namespace=namespace).upserted_count
+
+        uploader = BatchUploader(
+            upsert_batch,
+            MAX_FETCH_SIZE,
+            max_batch_size=MAX_FETCH_SIZE,
+            max_workers=self.args.get("threads") or THREAD_POOL_SIZE,
+            desc=desc,
+        )
+        uploader.upload(marked_vectors(), total=len(ids))
+        if uploader.failed_count:
+            raise Exception(
+                f"Could not update the export marker of {uploader.failed_count} vectors"
+            )
+
     def get_data(self):
         if "index" not in self.args or self.args["index"] is None:
             index_names = self.get_all_index_names()
@@ -511,71 +616,149 @@ class ExportPinecone(ExportVDB):
         for namespace in tqdm(namespaces_to_be_exported, desc="Fetching namespaces"):
             namespace_info = index_info["namespaces"][namespace]
             tqdm.write(f"Iterating namespace '{namespace}'")
-            vectors_directory = os.path.join(
-                self.vdf_directory,
-                index_name + ("_" + namespace if namespace else ""),
-                f"i{self.file_ctr}.parquet",
-            )
-            os.makedirs(vectors_directory, exist_ok=True)
-
-            all_ids = list(
-                self.get_all_ids_from_index(
-                    namespace=namespace,
-                    num_dimensions=index_info["dimension"],
-                    hash_value=self.hash_value,
+            checkpoint_key = f"{index_name}/{namespace}"
+            namespace_meta = self.completed_namespace_meta(checkpoint_key)
+            if namespace_meta is not None:
+                index_meta.append(namespace_meta)
+                self.args["exported_count"] += namespace_meta.exported_vector_count
+                continue
+            checkpoint = self.get_checkpoint(checkpoint_key)
+            id_pages = None
+            # extra state saved with every checkpoint of the namespace
+            namespace_state = {}
+            self.collected_ids_by_modifying = False
+            if checkpoint is not None:
+                vectors_directory = checkpoint["vectors_directory"]
+                i = checkpoint["cursor"]
+                total_size = checkpoint["exported_count"]
+                if checkpoint.get("ids_file") is not None:
+                    # the ids were collected by an earlier run
+                    namespace_state["ids_file"] = checkpoint["ids_file"]
+                    all_ids = self.load_state_file(checkpoint["ids_file"])
+                    # unmarking may not have finished, it is safe to repeat
+                    self.collected_ids_by_modifying = checkpoint.get("marked", False)
+                else:
+                    # list() pages ids in sorted order, the cursor is the last
+                    # fetched id, so ids inserted or deleted meanwhile before
+                    # it cannot shift the remaining ones
+                    last_id = i
+                    i = total_size
+                    id_pages = self.list_id_pages(namespace, after=last_id)
+                    if id_pages is None:
+                        raise Exception(
+                            f"Cannot resume, listing the ids of namespace '{namespace}' failed"
+                        )
+            else:
+                vectors_directory = os.path.join(
+                    self.vdf_directory,
+                    index_name + ("_" + namespace if namespace else ""),
+                    f"i{self.file_ctr}.parquet",
                 )
-            )
-            # unmark the vectors as exported
-            self.unmark_vectors_as_exported(all_ids, namespace, self.hash_value)
+                os.makedirs(vectors_directory, exist_ok=True)
+                i = 0
+                last_id = None
+                total_size = 0
+                if self.streams_ids():
+                    id_pages = self.list_id_pages(namespace)
+            if checkpoint is None and id_pages is not None:
+                self.checkpoint(
+                    checkpoint_key, vectors_directory, last_id, total_size, force=True
+                )
+            elif checkpoint is None:
+                all_ids = [
+                    str(x)
+                    for x in self.get_all_ids_from_index(
+                        namespace=namespace,
+                        num_dimensions=index_info["dimension"],
+                        hash_value=self.hash_value,
+                    )
+                ]
+                num_state_files = len(self.export_state.get("state_files", []))
+                namespace_state["ids_file"] = f"VDF_EXPORT_IDS_{num_state_files}.txt"
+                if self.collected_ids_by_modifying:
+                    namespace_state["marked"] = True
+                self.save_state_file(namespace_state["ids_file"], all_ids)
+                self.checkpoint(
+                    checkpoint_key,
+                    vectors_directory,
+                    i,
+                    total_size,
+                    force=True,
+                    **namespace_state,
+                )
+            unmarking = None
+            if id_pages is None and self.collected_ids_by_modifying:
+                # unmark the vectors as exported in the background, the marker
+                # is dropped from the metadata of vectors fetched meanwhile
+                unmarking = ThreadPoolExecutor(max_workers=1)
+                unmarked = unmarking.submit(
+                    self.unmark_vectors_as_exported,
+                    all_ids,
+                    namespace,
+                    self.hash_value,
+                )
+            marker_key = "exported_vectorio_" + self.hash_value
             # vectors is a dict of string to dict with keys id, values, metadata
             vectors = {}
             metadata = {}
-            batch_ctr = 1
-            total_size = 0
-            prev_total_size = 0
-            i = 0
-            fetch_size = MAX_FETCH_SIZE
-            pbar = tqdm(total=len(all_ids), desc="Final Step: Fetching vectors")
-            while i < len(all_ids):
-                batch_ids = all_ids[i : i + fetch_size]
-                try:
-                    # convert to strs
-                    batch_ids = [str(x) for x in batch_ids]
-                    data = self.index.fetch(batch_ids, namespace=namespace)
-                except Exception as e:
-                    if fetch_size < 1:
-                        raise Exception("Could not fetch vectors")
-                    tqdm.write(
-                        f"Error fetching vectors: {e}. Trying with a smaller batch size (--batch_size): {fetch_size}"
-                    )
-                    fetch_size = fetch_size * 3 // 4
-                    continue
-                batch_vectors = data["vectors"]
-                # verify that the ids are the same
-                # commenting out as some ids in range might not be present in DB
-                # assert set(batch_ids) == set(batch_vectors.keys())
+            if id_pages is not None:
+                # listing runs ahead of the fetch through a bounded queue
+                pbar = tqdm(
+                    total=namespace_info["vector_count"],
+                    initial=i,
+                    desc="Listing and fetching vectors",
+                )
+                id_batches = prefetch(
+                    batch_ids_from_pages(id_pages, MAX_FETCH_SIZE),
+                    depth=2 * (self.args.get("threads") or THREAD_POOL_SIZE),
+                )
+            else:
+                pbar = tqdm(
+                    total=len(all_ids), initial=i, desc="Final Step: Fetching vectors"
+                )
+                id_batches = (
+                    all_ids[j : j + MAX_FETCH_SIZE]
+                    for j in range(i, len(all_ids), MAX_FETCH_SIZE)
+                )
+            for batch_ids, batch_vectors in self.fetch_batches(id_batches, namespace):
+                # some ids in range might not be present in DB
                 metadata.update(
                     {
-                        k: v["metadata"] if "metadata" in v else {}
+                        k: {
+                            key: value
+                            for key, value in v["metadata"].items()
+                            if key != marker_key
+                        }
+                        if "metadata" in v
+                        else {}
                         for k, v in batch_vectors.items()
                     }
                 )
                 vectors.update({k: v["values"] for k, v in batch_vectors.items()})
-                # if size of vectors is greater than 1GB, save the vectors to a parquet file
-                if (vectors.__sizeof__() + metadata.__sizeof__()) > self.args[
-                    "max_file_size"
-                ] * 1024 * 1024:
-                    prev_total_size = total_size
-                    total_size += self.save_vectors_to_parquet(
-                        vectors, metadata, vectors_directory
-                    )
-                i += fetch_size
+                # the parquet writer flushes to disk based on buffered bytes
+                total_size += self.save_vectors_to_parquet(
+                    vectors, metadata, vectors_directory
+                )
+                i += len(batch_ids)
                 pbar.update(len(batch_ids))
-                batch_ctr += 1
-            total_size += self.save_vectors_to_parquet(
-                vectors, metadata, vectors_directory
-            )
-            pbar.update(total_size - prev_total_size)
+                self.checkpoint(
+                    checkpoint_key,
+                    vectors_directory,
+                    batch_ids[-1] if id_pages is not None else i,
+                    total_size,
+                    **namespace_state,
+                )
+            pbar.close()
+            if id_pages is not None and i < namespace_info["vector_count"]:
+                # ids matching none of the --list_prefixes are never listed
+                tqdm.write(
+                    f"Warning: listed {i} ids of the {namespace_info['vector_count']}"
+                    f" vectors of namespace '{namespace}', the rest were not exported"
+                )
+            if unmarking is not None:
+                unmarked.result()
+                unmarking.shutdown()
+            self.close_parquet_writer(vectors_directory)
             namespace_meta = NamespaceMeta(
                 namespace=namespace,
                 index_name=index_name,
@@ -584,7 +767,7 @@ class ExportPinecone(ExportVDB):
                 dimensions=index_info["dimension"],
                 model_name=self.args["model_name"],
                 vector_columns=["vector"],
-                data_path="/".join(vectors_directory.split("/")[1:]),
+                data_path=os.path.relpath(vectors_directory, self.vdf_directory),
                 metric=standardize_metric(
                     self.pc.describe_index(index_name).metric, self.DB_NAME_SLUG
                 ),
@@ -594,18 +777,108 @@ class ExportPinecone(ExportVDB):
                     else None
                 ),
             )
+            self.complete_namespace(checkpoint_key, namespace_meta)
             index_meta.append(namespace_meta)
             self.args["exported_count"] += total_size
         return index_meta
 
-    def update_range_from_new_ids(
-        self, vector_range_min, vector_range_max, new_ids, namespace
-    ):
-        # use update_range to update the range of the vectors
-        self.update_range(
-            new_ids, vector_range_min, vector_range_max, namespace, size=1
+    def streams_ids(self):
+        """
+        Whether the ids of a namespace are listed while its vectors are fetched,
+        instead of being collected up front
+        """
+        return (
+            self.args.get("stream_ids", True)
+            and self.args.get("use_list_points", use_list_points_default)
+            and self.args.get("id_range_start") is None
+            and self.args.get("id_range_end") is None
+            and not self.args.get("id_list_file")
         )
 
+    def list_id_pages(self, namespace, after=None):
+        """
+        Page through the ids of a namespace with list(), or return None when
+        the index does not support listing.
+
+        Ids come in sorted order, also across the sorted disjoint prefixes,
+        so resuming after an id skips the ones up to it.
+        """
+        prefixes = parse_id_prefixes(self.args.get("list_prefixes"))
+        if prefixes:
+            if after is not None:
+                # all ids of the prefixes sorting before after were fetched
+                prefixes = [
+                    prefix for prefix in prefixes if prefix >= after[: len(prefix)]
+                ]
+            # disjoint prefixes are listed concurrently and chained in order
+            pages = prefetch_chain(
+                [
+                    self.index.list(namespace=namespace, prefix=prefix)
+                    for prefix in prefixes
+                ],
+                workers=self.args.get("threads") or THREAD_POOL_SIZE,
+            )
+        else:
+            pages = iter(self.index.list(namespace=namespace))
+        if after is not None:
+            pages = ([id for id in page if id > after] for page in pages)
+        try:
+            first_page = next(pages, [])
+        except Exception as e:
+            tqdm.write(
+                f"Error fetching IDs using list_points. Falling back to random search method: {e}"
+            )
+            return None
+        return itertools.chain([first_page], pages)
+
+    def fetch_batches(self, id_batches, namespace):
+        """
+        Fetch batches of ids with a pool of concurrent requests, yielding
+        (batch_ids, vectors) in the order of id_batches
+        """
+        threads = self.args.get("threads") or THREAD_POOL_SIZE
+        in_flight = deque()
+        executor = ThreadPoolExecutor(max_workers=threads)
+        try:
+            for batch_ids in id_batches:
+                in_flight.append(
+                    (
+                        batch_ids,
+                        executor.submit(self.fetch_vectors, batch_ids, namespace),
+                    )
+                )
+                if len(in_flight) >= 2 * threads:
+                    batch_ids, future = in_flight.popleft()
+                    yield batch_ids, future.result()
+            while in_flight:
+                batch_ids, future = in_flight.popleft()
+                yield batch_ids, future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def fetch_vectors(self, ids, namespace):
+        """
+        Fetch the vectors of ids, splitting them into smaller requests on errors
+        """
+        vectors = {}
+        fetch_size = len(ids)
+        i = 0
+        while i < len(ids):
+            batch_ids = ids[i : i + fetch_size]
+            try:
+                data = self.index.fetch(batch_ids, namespace=namespace)
+            except Exception as e:
+                fetch_size = fetch_size * 3 // 4
+                if fetch_size < 1:
+                    raise Exception("Could not fetch vectors") from e
+                tqdm.write(
+                    f"Error fetching vectors: {e}. Trying with a smaller batch size: {fetch_size}"
+                )
+                continue
+            vectors.update(data["vectors"])
+            i += len(batch_ids)
+        return vectors
+
     def update_range(
         self, all_ids, vector_range_min, vector_range_max, namespace, size=10
     ):
@@ -1,5 +1,7 @@
 import argparse
 import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 from qdrant_client import QdrantClient
 import os
@@ -14,6 +16,16 @@ from vdf_io.util import set_arg_from_input, set_arg_from_password
 load_dotenv()
 
 MAX_FETCH_SIZE = 1_000
+DEFAULT_PARTITIONS = 4
+
+
+def point_id_key(point_id):
+    """
+    Sort key matching the order in which Qdrant scrolls point ids
+    """
+    if isinstance(point_id, int):
+        return (0, point_id)
+    return (1, uuid.UUID(point_id).int)
 
 
 class ExportQdrant(ExportVDB):
@@ -37,6 +49,15 @@ class ExportQdrant(ExportVDB):
             default=True,
             action=argparse.BooleanOptionalAction,
         )
+        parser_qdrant.add_argument(
+            "--partitions",
+            type=int,
+            help=(
+                "Number of disjoint point id ranges scrolled concurrently,"
+                f" each into its own parquet files (default: {DEFAULT_PARTITIONS})"
+            ),
+            default=DEFAULT_PARTITIONS,
+        )
 
     @classmethod
     def export_vdb(cls, args):
@@ -137,30 +158,60 @@ class ExportQdrant(ExportVDB):
             return self.try_scroll((fetch_size * 2) // 3, collection_name, next_offset)
 
     def get_data_for_collection(self, collection_name) -> List[NamespaceMeta]:
+        namespace_meta = self.completed_namespace_meta(collection_name)
+        if namespace_meta is not None:
+            self.args["exported_count"] += namespace_meta.exported_vector_count
+            return [namespace_meta]
         vectors_directory = self.create_vec_dir(collection_name)
 
-        total = self.client.get_collection(collection_name).vectors_count
+        collection_info = self.client.get_collection(collection_name)
+        total = collection_info.vectors_count
+        dim = collection_info.config.params.vectors.size
 
-        num_vectors_exported = 0
-        dim = self.client.get_collection(collection_name).config.params.vectors.size
-        next_offset = 0
-        records, next_offset, fetch_size = self.try_scroll(
-            MAX_FETCH_SIZE, collection_name, next_offset
-        )
-        num_vectors_exported += self.save_from_records(
-            records,
-            vectors_directory,
-        )
-        pbar = tqdm(total=total, desc=f"Exporting {collection_name}")
-        while next_offset is not None:
-            records, next_offset, fetch_size = self.try_scroll(
-                fetch_size, collection_name, next_offset
+        checkpoint = self.get_checkpoint(collection_name)
+        if checkpoint is not None:
+            partitions = checkpoint["partitions"]
+        else:
+            partitions = self.get_partitions(
+                collection_name, self.args.get("partitions") or DEFAULT_PARTITIONS
             )
-            num_vectors_exported += self.save_from_records(
-                records,
+            self.checkpoint(
+                collection_name,
                 vectors_directory,
+                None,
+                0,
+                force=True,
+                partitions=partitions,
             )
-            pbar.update(len(records))
+        partition_checkpoints = [
+            self.get_checkpoint(f"{collection_name}/{i}")
+            for i in range(len(partitions))
+        ]
+        pbar = tqdm(
+            total=total,
+            initial=sum(
+                checkpoint["exported_count"]
+                for checkpoint in partition_checkpoints
+                if checkpoint is not None
+            ),
+            desc=f"Exporting {collection_name}",
+        )
+        with ThreadPoolExecutor(max_workers=len(partitions)) as executor:
+            futures = [
+                executor.submit(
+                    self.export_partition,
+                    collection_name,
+                    vectors_directory,
+                    i,
+                    start,
+                    end,
+                    partition_checkpoints[i],
+                    pbar,
+                )
+                for i, (start, end) in enumerate(partitions)
+            ]
+            num_vectors_exported = sum(future.result() for future in futures)
+        pbar.close()
 
         namespace_meta = self.get_namespace_meta(
             collection_name,
@@ -168,17 +219,99 @@ class ExportQdrant(ExportVDB):
             total,
             num_vectors_exported,
             dim,
-            index_config=self.client.get_collection(
-                collection_name
-            ).config.model_dump(),
-            distance=self.client.get_collection(
-                collection_name
-            ).config.params.vectors.distance,
+            index_config=collection_info.config.model_dump(),
+            distance=collection_info.config.params.vectors.distance,
         )
+        self.complete_namespace(collection_name, namespace_meta)
         self.args["exported_count"] += num_vectors_exported
         return [namespace_meta]
 
-    def save_from_records(self, records, vectors_directory):
+    def get_partitions(self, collection_name, num_partitions):
+        """
+        Split the point ids of a collection into num_partitions disjoint
+        [start, end) ranges that can be scrolled concurrently.
+
+        Qdrant scrolls points in id order, integer ids before UUIDs. Integer ids
+        are split evenly between the smallest and the largest one, UUIDs by
+        their 128-bit value. The last range is open, so that it also picks up
+        the UUIDs of a collection with mixed ids.
+        """
+        records, _, _ = self.try_scroll(1, collection_name, None)
+        if not records or num_partitions <= 1:
+            return [(None, None)]
+        first_id = records[0].id
+        if isinstance(first_id, int):
+            # binary search for the largest integer id
+            low, high = first_id, 2**64
+            while high - low > 1:
+                mid = (low + high) // 2
+                records, _, _ = self.try_scroll(1, collection_name, mid)
+                if records and isinstance(records[0].id, int):
+                    low = records[0].id
+                else:
+                    high = mid
+            step = max(1, -(-(low + 1 - first_id) // num_partitions))
+            bounds = list(range(first_id, low + 1, step))
+        else:
+            bounds = [first_id] + [
+                str(uuid.UUID(int=(i * 2**128) // num_partitions))
+                for i in range(1, num_partitions)
+            ]
+            bounds = [
+                bound
+                for bound in bounds
+                if point_id_key(bound) >= point_id_key(first_id)
+            ]
+        return list(zip(bounds, bounds[1:] + [None]))
+
+    def export_partition(
+        self, collection_name, vectors_directory, i, start, end, checkpoint, pbar
+    ):
+        """
+        Scroll the points with start <= id < end into their own Parquet shard
+        """
+        key = f"{collection_name}/{i}"
+        next_offset = start
+        num_vectors_exported = 0
+        if checkpoint is not None:
+            next_offset = checkpoint["cursor"]
+            num_vectors_exported = checkpoint["exported_count"]
+            if next_offset is None:
+                return num_vectors_exported
+        fetch_size = MAX_FETCH_SIZE
+        while True:
+            records, next_offset, fetch_size = self.try_scroll(
+                fetch_size, collection_name, next_offset
+            )
+            if end is not None:
+                records = [
+                    record
+                    for record in records
+                    if point_id_key(record.id) < point_id_key(end)
+                ]
+                if next_offset is not None and point_id_key(
+                    next_offset
+                ) >= point_id_key(end):
+                    next_offset = None
+            num_vectors_exported += self.save_from_records(
+                records, vectors_directory, shard=i
+            )
+            pbar.update(len(records))
+            if next_offset is None:
+                break
+            self.checkpoint(
+                key,
+                vectors_directory,
+                next_offset,
+                num_vectors_exported,
+                shard=i,
+            )
+        self.checkpoint(
+            key, vectors_directory, None, num_vectors_exported, force=True, shard=i
+        )
+        return num_vectors_exported
+
+    def save_from_records(self, records, vectors_directory, shard=None):
         num_vectors_exported = 0
         vectors = {}
         metadata = {}
@@ -186,6 +319,6 @@ class ExportQdrant(ExportVDB):
             vectors[point.id] = point.vector
             metadata[point.id] = point.payload
         num_vectors_exported += self.save_vectors_to_parquet(
-            vectors, metadata, vectors_directory
+            vectors, metadata, vectors_directory, shard
         )
         return num_vectors_exported
@@ -1,10 +1,9 @@
 import json
 import os
-import sys
 from typing import Dict, List
 from tqdm import tqdm
 import turbopuffer as tpuf
-from vdf_io.constants import DISK_SPACE_LIMIT
+from vdf_io.constants import DEFAULT_BATCH_SIZE
 from vdf_io.meta_types import NamespaceMeta
 from vdf_io.names import DBNames
 from vdf_io.util import set_arg_from_input, set_arg_from_password
@@ -83,8 +82,7 @@ class ExportTurbopuffer(ExportVDB):
                 vectors[row.id] = row.vector
                 metadata[row.id] = row.attributes
                 pbar.update(1)
-                if sys.getsizeof(vectors) + sys.getsizeof(metadata) > DISK_SPACE_LIMIT:
-                    tqdm.write("Flushing to parquet files on disk")
+                if len(vectors) >= DEFAULT_BATCH_SIZE:
                     exported_count += self.save_vectors_to_parquet(
                         vectors, metadata, vectors_directory
                     )
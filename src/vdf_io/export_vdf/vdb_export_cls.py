@@ -1,15 +1,24 @@
 from __future__ import annotations
 import datetime
+import json
 from typing import List
-import pandas as pd
 import os
 import abc
+import threading
+import time
 import pyarrow.parquet as pq
 import pyarrow as pa
+from tqdm import tqdm
 
 from vdf_io.meta_types import NamespaceMeta, VDFMeta
 from vdf_io.util import extract_data_hash, get_author_name, standardize_metric
-from vdf_io.constants import ID_COLUMN
+from vdf_io.constants import (
+    DEFAULT_CHECKPOINT_INTERVAL,
+    DEFAULT_MAX_FILE_SIZE,
+    DISK_SPACE_LIMIT,
+    EXPORT_STATE_FILE,
+    ID_COLUMN,
+)
 
 
 class ExportVDB(abc.ABC):
@@ -23,13 +32,22 @@ class ExportVDB(abc.ABC):
     def __init__(self, args):
         self.file_structure = []
         self.file_ctr = 1
+        self.parquet_writers = {}
         self.hash_value = extract_data_hash(args)
         self.args = args
         self.args["hash_value"] = self.hash_value
         self.args["exported_count"] = 0
         self.timestamp_in_format = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.vdf_directory = f"vdf_{self.timestamp_in_format}_{self.hash_value}"
-        os.makedirs(self.vdf_directory, exist_ok=True)
+        self.lock = threading.RLock()
+        self.writer_files = {}
+        self.last_checkpoint_times = {}
+        self.export_state = {"namespaces": {}}
+        if self.args.get("resume"):
+            self.vdf_directory = os.path.normpath(self.args["resume"])
+            self.load_export_state()
+        else:
+            self.vdf_directory = f"vdf_{self.timestamp_in_format}_{self.hash_value}"
+            os.makedirs(self.vdf_directory, exist_ok=True)
 
     @abc.abstractmethod
     def get_index_names(self) -> List[str]:
@@ -64,39 +82,255 @@ class ExportVDB(abc.ABC):
     def export_vdb(cls, args):
         raise NotImplementedError()
 
-    def save_vectors_to_parquet(self, vectors, metadata, vectors_directory):
-        vectors_df = pd.DataFrame(list(vectors.items()), columns=[ID_COLUMN, "vector"])
+    def save_vectors_to_parquet(self, vectors, metadata, vectors_directory, shard=None):
+        """
+        Append vectors and their metadata to the Parquet writer of vectors_directory.
 
+        Rows are buffered as Arrow RecordBatches and streamed to disk in row groups;
+        the passed dicts are cleared so that callers can keep filling them.
+        Concurrent producers pass distinct shards to write separate files.
+        Returns the number of rows added.
+        """
+        if not vectors and not metadata:
+            return 0
+        batch = dicts_to_record_batch(vectors or {}, metadata or {})
+        self.save_record_batch_to_parquet(batch, vectors_directory, shard)
+        if vectors:
+            vectors.clear()
         if metadata:
-            metadata_list = [{**{ID_COLUMN: k}, **v} for k, v in metadata.items()]
-            metadata_df = pd.DataFrame.from_records(metadata_list)
+            metadata.clear()
+        return batch.num_rows
 
-            # Check for duplicate column names and rename as necessary
-            common_columns = set(vectors_df.columns) & set(metadata_df.columns) - {
-                ID_COLUMN
-            }
-            metadata_df.rename(
-                columns={col: f"metadata_{col}" for col in common_columns}, inplace=True
-            )
+    def save_record_batch_to_parquet(self, batch, vectors_directory, shard=None):
+        """
+        Append a RecordBatch with id, vector and metadata columns to the Parquet
+        writer of vectors_directory. Returns the number of rows added.
+        """
+        self.get_parquet_writer(vectors_directory, shard).write_batch(batch)
+        return batch.num_rows
 
-            df = vectors_df.merge(metadata_df, on=ID_COLUMN, how="outer")
-        else:
-            df = vectors_df
+    def get_parquet_writer(self, vectors_directory, shard=None) -> ParquetStreamWriter:
+        with self.lock:
+            writer_key = (vectors_directory, shard)
+            if writer_key not in self.parquet_writers:
+                max_file_size = (
+                    self.args.get("max_file_size") or DEFAULT_MAX_FILE_SIZE
+                ) * (1024 * 1024)
+                self.parquet_writers[writer_key] = ParquetStreamWriter(
+                    new_file_path=lambda: self.new_parquet_file_path(writer_key),
+                    max_file_size=max_file_size,
+                    on_file_closed=self.update_parquet_schema,
+                )
+            return self.parquet_writers[writer_key]
 
-        parquet_file = os.path.join(vectors_directory, f"{self.file_ctr}.parquet")
-        df.to_parquet(parquet_file)
-        if not hasattr(self, "parquet_schema"):
-            self.parquet_schema = pq.read_schema(parquet_file)
-        else:
-            self.parquet_schema = pa.unify_schemas(
-                [self.parquet_schema, pq.read_schema(parquet_file)]
+    def new_parquet_file_path(self, writer_key):
+        with self.lock:
+            parquet_file = os.path.join(writer_key[0], f"{self.file_ctr}.parquet")
+            self.file_structure.append(parquet_file)
+            self.writer_files.setdefault(writer_key, []).append(parquet_file)
+            self.file_ctr += 1
+            return parquet_file
+
+    def update_parquet_schema(self, schema):
+        with self.lock:
+            if not hasattr(self, "parquet_schema"):
+                self.parquet_schema = schema
+                return
+            unified_schema = unify_arrow_schemas([self.parquet_schema, schema])
+            if unified_schema is None:
+                tqdm.write(
+                    "Warning: Parquet files have incompatible schemas. Keeping the first one in VDF_META.json"
+                )
+                return
+            self.parquet_schema = unified_schema
+
+    def close_parquet_writer(self, vectors_directory, shard=None):
+        """
+        Flush buffered rows of vectors_directory to disk and close its current file.
+
+        Without a shard, the writers of all shards of vectors_directory are closed.
+        """
+        with self.lock:
+            writer_keys = [
+                writer_key
+                for writer_key in self.parquet_writers
+                if writer_key[0] == vectors_directory
+                and (shard is None or writer_key[1] == shard)
+            ]
+            writers = [self.parquet_writers.pop(key) for key in writer_keys]
+        for writer in writers:
+            writer.close()
+
+    def export_state_path(self):
+        return os.path.join(self.vdf_directory, EXPORT_STATE_FILE)
+
+    def load_export_state(self):
+        """
+        Restore the export state checkpointed in the --resume directory.
+
+        Parquet files written after the last checkpoint are incomplete (or hold
+        rows that will be fetched again), so they are deleted.
+        """
+        if not os.path.isfile(self.export_state_path()):
+            raise Exception(
+                f"Cannot resume, {EXPORT_STATE_FILE} not found in '{self.vdf_directory}'"
             )
-        self.file_structure.append(parquet_file)
-        self.file_ctr += 1
+        with open(self.export_state_path()) as f:
+            self.export_state = json.load(f)
+        self.file_ctr = self.export_state["file_ctr"]
+        self.file_structure = [
+            os.path.join(self.vdf_directory, file)
+            for checkpoint in self.export_state["namespaces"].values()
+            for file in checkpoint.get("files", [])
+        ]
+        durable_files = set(map(os.path.abspath, self.file_structure))
+        for root, _, files in os.walk(self.vdf_directory):
+            for file in files:
+                file_path = os.path.abspath(os.path.join(root, file))
+                if file.endswith(".parquet") and file_path not in durable_files:
+                    os.remove(file_path)
+        for file in self.file_structure:
+            self.update_parquet_schema(pq.read_schema(file))
+        tqdm.write(
+            f"Resuming export into '{self.vdf_directory}' from {len(self.file_structure)} files"
+        )
+
+    def save_export_state(self):
+        """
+        Write the export state atomically
+        """
+        with self.lock:
+            self.export_state["file_ctr"] = self.file_ctr
+            tmp_path = self.export_state_path() + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.export_state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.export_state_path())
+
+    def remove_export_state(self):
+        """
+        Drop the checkpoint files of a completed export
+        """
+        for state_file in self.export_state.get("state_files", []):
+            state_file_path = os.path.join(self.vdf_directory, state_file)
+            if os.path.isfile(state_file_path):
+                os.remove(state_file_path)
+        if os.path.isfile(self.export_state_path()):
+            os.remove(self.export_state_path())
+
+    def get_checkpoint(self, key):
+        """
+        Return the last checkpoint of namespace key (a dict with vectors_directory,
+        cursor and exported_count), or None when it has to be exported from scratch
+        """
+        checkpoint = self.export_state["namespaces"].get(key)
+        if checkpoint is None:
+            return None
+        return dict(
+            checkpoint,
+            vectors_directory=os.path.join(
+                self.vdf_directory, checkpoint["vectors_directory"]
+            ),
+        )
 
-        vectors = {}
-        metadata = {}
-        return len(df)
+    def checkpoint(
+        self,
+        key,
+        vectors_directory,
+        cursor,
+        exported_count,
+        force=False,
+        shard=None,
+        **extra,
+    ):
+        """
+        Record that all rows of key (a namespace, or a partition of one written
+        to its own shard) before cursor were exported.
+
+        cursor has to be JSON serializable. Checkpoints are made durable (by
+        closing the current Parquet file of the shard) at most every
+        --checkpoint_interval seconds per key, unless force is set.
+        """
+        interval = self.args.get("checkpoint_interval")
+        if interval is None:
+            interval = DEFAULT_CHECKPOINT_INTERVAL
+        last_checkpoint_time = self.last_checkpoint_times.setdefault(key, time.time())
+        if not force and time.time() - last_checkpoint_time < interval:
+            return
+        self.close_parquet_writer(vectors_directory, shard)
+        with self.lock:
+            files = self.export_state["namespaces"].get(key, {}).get("files", [])
+            files = files + [
+                os.path.relpath(file, self.vdf_directory)
+                for file in self.writer_files.pop((vectors_directory, shard), [])
+            ]
+            self.export_state["namespaces"][key] = {
+                "vectors_directory": os.path.relpath(
+                    vectors_directory, self.vdf_directory
+                ),
+                "cursor": cursor,
+                "exported_count": exported_count,
+                "files": files,
+                **extra,
+            }
+        self.save_export_state()
+        self.last_checkpoint_times[key] = time.time()
+
+    def complete_namespace(self, key, namespace_meta: NamespaceMeta):
+        """
+        Checkpoint a fully exported namespace along with its metadata, taking
+        over the files of the partition checkpoints of its directory
+        """
+        vectors_directory = os.path.join(self.vdf_directory, namespace_meta.data_path)
+        self.close_parquet_writer(vectors_directory)
+        with self.lock:
+            files = []
+            for other_key, checkpoint in list(self.export_state["namespaces"].items()):
+                if checkpoint["vectors_directory"] == namespace_meta.data_path:
+                    files.extend(checkpoint.get("files", []))
+                    del self.export_state["namespaces"][other_key]
+            for writer_key in list(self.writer_files):
+                if writer_key[0] == vectors_directory:
+                    files.extend(
+                        os.path.relpath(file, self.vdf_directory)
+                        for file in self.writer_files.pop(writer_key)
+                    )
+            self.export_state["namespaces"][key] = {
+                "vectors_directory": namespace_meta.data_path,
+                "cursor": None,
+                "exported_count": namespace_meta.exported_vector_count,
+                "files": files,
+                "namespace_meta": namespace_meta.model_dump(),
+            }
+        self.save_export_state()
+
+    def completed_namespace_meta(self, key):
+        """
+        Metadata of namespace key if an earlier run already exported all of it
+        """
+        checkpoint = self.export_state["namespaces"].get(key) or {}
+        if checkpoint.get("namespace_meta") is None:
+            return None
+        tqdm.write(f"Skipping '{key}', it was exported by an earlier run")
+        return NamespaceMeta(**checkpoint["namespace_meta"])
+
+    def save_state_file(self, name, lines):
+        """
+        Store a list of strings needed to resume (e.g. collected ids) next to
+        the export state; it is removed once the export completes
+        """
+        with open(os.path.join(self.vdf_directory, name), "w") as f:
+            f.writelines(f"{line}\n" for line in lines)
+            f.flush()
+            os.fsync(f.fileno())
+        state_files = self.export_state.setdefault("state_files", [])
+        if name not in state_files:
+            state_files.append(name)
+
+    def load_state_file(self, name):
+        with open(os.path.join(self.vdf_directory, name)) as f:
+            return [line.rstrip("\n") for line in f]
 
     def create_vec_dir(self, index_name):
         vectors_directory = os.path.join(self.vdf_directory, index_name)
@@ -124,6 +358,7 @@ class ExportVDB(abc.ABC):
         vector_columns=None,
         distance=None,
     ):
+        self.close_parquet_writer(vectors_directory)
         vec_cols = ["vector"] if vector_columns is None else vector_columns
         model_name = self.args.get("model_name", "NOT_PROVIDED")
         namespace_meta = NamespaceMeta(
@@ -147,7 +382,7 @@ class ExportVDB(abc.ABC):
                 }
                 for vec_col in vec_cols
             },
-            data_path="/".join(vectors_directory.split("/")[1:]),
+            data_path=os.path.relpath(vectors_directory, self.vdf_directory),
             schema_dict_str=(
                 self.parquet_schema.to_string()
                 if hasattr(self, "parquet_schema")
@@ -157,3 +392,163 @@ class ExportVDB(abc.ABC):
         )
 
         return namespace_meta
+
+
+class ParquetStreamWriter:
+    """
+    Streams Arrow RecordBatches into a sequence of size-bounded Parquet files.
+
+    Batches are buffered until their in-memory size (nbytes) reaches
+    row_group_bytes and are then written as one row group. Once the current
+    file grows beyond max_file_size bytes, the next row group goes to a new file
+    obtained from new_file_path().
+    """
+
+    def __init__(
+        self,
+        new_file_path,
+        max_file_size,
+        row_group_bytes=DISK_SPACE_LIMIT,
+        on_file_closed=None,
+    ):
+        self.new_file_path = new_file_path
+        self.max_file_size = max_file_size
+        self.row_group_bytes = min(row_group_bytes, max_file_size)
+        self.on_file_closed = on_file_closed
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.num_rows = 0
+        self.schema = None
+        self.file_path = None
+        self.sink = None
+        self.writer = None
+
+    def write_batch(self, batch: pa.RecordBatch):
+        if batch.num_rows == 0:
+            return
+        self.buffer.append(batch)
+        self.buffered_bytes += batch.nbytes
+        self.num_rows += batch.num_rows
+        if self.buffered_bytes >= self.row_group_bytes:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        batches, self.buffer, self.buffered_bytes = self.buffer, [], 0
+        schema = unify_arrow_schemas([batch.schema for batch in batches])
+        if schema is None:
+            # incompatible types across batches, write them one by one
+            for batch in batches:
+                self.write_row_group([batch], batch.schema)
+            return
+        self.write_row_group(batches, schema)
+
+    def write_row_group(self, batches, schema):
+        if self.writer is not None:
+            file_schema = unify_arrow_schemas([self.schema, schema])
+            if file_schema is not None and file_schema.equals(self.schema):
+                schema = self.schema
+            else:
+                # a Parquet file has a single schema, start a new one
+                self.close_file()
+        if self.writer is None:
+            self.open_file(schema)
+        table = pa.Table.from_batches(
+            [conform_record_batch(batch, schema) for batch in batches], schema=schema
+        )
+        self.writer.write_table(table, row_group_size=table.num_rows)
+        if self.sink.tell() >= self.max_file_size:
+            self.close_file()
+
+    def open_file(self, schema):
+        self.schema = schema
+        self.file_path = self.new_file_path()
+        self.sink = pa.OSFile(self.file_path, "wb")
+        self.writer = pq.ParquetWriter(self.sink, schema)
+
+    def close_file(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.sink.close()
+        if self.on_file_closed is not None:
+            self.on_file_closed(self.schema)
+        self.writer = None
+        self.sink = None
+        self.schema = None
+        self.file_path = None
+
+    def close(self):
+        self.flush()
+        self.close_file()
+
+
+def unify_arrow_schemas(schemas):
+    """
+    Unify Arrow schemas, promoting types where possible (e.g. null -> string,
+    int64 -> double). Returns None if the schemas cannot be unified.
+    """
+    try:
+        try:
+            return pa.unify_schemas(schemas, promote_options="permissive")
+        except TypeError as e:
+            if isinstance(e, pa.ArrowTypeError):
+                raise
+            # pyarrow < 14 has no promote_options
+            return pa.unify_schemas(schemas)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None
+
+
+def conform_record_batch(batch, schema):
+    """
+    Reorder and cast the columns of batch to schema, filling missing ones with nulls
+    """
+    if batch.schema.equals(schema):
+        return batch
+    arrays = []
+    for field in schema:
+        idx = batch.schema.get_field_index(field.name)
+        if idx == -1:
+            arrays.append(pa.nulls(batch.num_rows, type=field.type))
+            continue
+        column = batch.column(idx)
+        arrays.append(column if column.type == field.type else column.cast(field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def to_arrow_array(values):
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # mixed types in a column, store them as strings
+        return pa.array(
+            [
+                v if v is None or isinstance(v, str) else json.dumps(v, default=str)
+                for v in values
+            ],
+            type=pa.string(),
+        )
+
+
+def dicts_to_record_batch(vectors, metadata) -> pa.RecordBatch:
+    """
+    Build a RecordBatch with id, vector and metadata columns from
+    {id: vector} and {id: {key: value}} dicts (an outer join on id).
+    """
+    ids = list(vectors.keys())
+    ids.extend(k for k in metadata.keys() if k not in vectors)
+    columns = {
+        ID_COLUMN: to_arrow_array(ids),
+        "vector": to_arrow_array([vectors.get(k) for k in ids]),
+    }
+    metadata_rows = [metadata.get(k) or {} for k in ids]
+    metadata_keys = dict.fromkeys(key for row in metadata_rows for key in row)
+    for key in metadata_keys:
+        # Check for duplicate column names and rename as necessary
+        col_name = f"metadata_{key}" if key in columns else str(key)
+        columns[col_name] = to_arrow_array([row.get(key) for row in metadata_rows])
+    return pa.RecordBatch.from_arrays(
+        list(columns.values()), names=list(columns.keys())
+    )
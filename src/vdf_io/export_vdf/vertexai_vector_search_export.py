@@ -262,7 +262,8 @@ class ExportVertexAIVectorSearch(ExportVDB):
             # self.file_ctr,
             vectors_directory,
         )
-        pbar.update(len(vectors))
+        pbar.update(num_vectors_exported)
+        self.close_parquet_writer(vectors_directory)
 
         namespace_meta = {
             "index_name": index.display_name,
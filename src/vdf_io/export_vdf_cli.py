@@ -21,6 +21,7 @@ from sentry_sdk.integrations.opentelemetry import (
 )
 
 import vdf_io
+from vdf_io.constants import DEFAULT_CHECKPOINT_INTERVAL, DEFAULT_MAX_FILE_SIZE
 from vdf_io.export_vdf.vdb_export_cls import ExportVDB
 from vdf_io.scripts.check_for_updates import check_for_updates
 from vdf_io.scripts.push_to_hub_vdf import push_to_hub
@@ -62,9 +63,6 @@ warnings.simplefilter("ignore", DeprecationWarning)
 
 load_dotenv(find_dotenv(), override=True)
 
-DEFAULT_MAX_FILE_SIZE = 1024  # in MB
-
-
 if os.environ.get("DISABLE_TELEMETRY_VECTORIO", False) != "1":
     sentry_sdk.init(
         dsn="https://4826b78415eeaf0135c12416e222596d@o1284436.ingest.sentry.io/4506716331573248",
@@ -165,6 +163,7 @@ def run_export(span):
         time.strftime("%H:%M:%S", time.gmtime(t_end - t_start)),
     )
     span.set_attribute("export_time", t_end - t_start)
+    export_obj.remove_export_state()
     if args["push_to_hub"]:
         push_to_hub(export_obj, args)
 
@@ -185,6 +184,18 @@ def make_common_options(parser):
         help="Maximum file size in MB (default: 1024)",
         default=DEFAULT_MAX_FILE_SIZE,
     )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        help="VDF directory of an interrupted export to continue from its last checkpoint",
+        default=None,
+    )
+    parser.add_argument(
+        "--checkpoint_interval",
+        type=int,
+        help=f"Seconds between export checkpoints (default: {DEFAULT_CHECKPOINT_INTERVAL})",
+        default=DEFAULT_CHECKPOINT_INTERVAL,
+    )
 
     parser.add_argument(
         "--push_to_hub",
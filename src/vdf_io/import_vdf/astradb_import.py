@@ -2,13 +2,11 @@ import argparse
 from typing import Dict, List
 from dotenv import load_dotenv
 from tqdm import tqdm
-import concurrent.futures
 
 from astrapy.db import AstraDB
 from cassandra.cluster import Cluster
 from cassandra.auth import PlainTextAuthProvider
 
-from vdf_io.constants import INT_MAX
 from vdf_io.names import DBNames
 from vdf_io.import_vdf.vdf_import_cls import ImportVDB
 from vdf_io.meta_types import NamespaceMeta
@@ -49,6 +47,7 @@ class ImportAstraDB(ImportVDB):
             type=str,
             help="Path to the secure connect bundle",
         )
+        cls.add_upload_options(parser_astradb)
 
     @classmethod
     def import_vdb(cls, args):
@@ -108,7 +107,6 @@ class ImportAstraDB(ImportVDB):
 
     def upsert_data(self, via_cql=False):
         self.total_imported_count = 0
-        max_hit = False
         indexes_content: Dict[str, List[NamespaceMeta]] = self.vdf_meta["indexes"]
         index_names: List[str] = list(indexes_content.keys())
         if len(index_names) == 0:
@@ -177,20 +175,11 @@ class ImportAstraDB(ImportVDB):
                         final_data_path, parquet_file
                     )
 
-                    df = self.read_parquet_progress(parquet_file_path)
-                    if len(vectors) > (self.args.get("max_num_rows") or INT_MAX):
-                        max_hit = True
-                        break
-                    if len(vectors) + len(df) > (
-                        self.args.get("max_num_rows") or INT_MAX
-                    ):
-                        df = df.head(
-                            (self.args.get("max_num_rows") or INT_MAX) - len(vectors)
-                        )
-                        max_hit = True
-                    self.update_vectors(vectors, vector_column_name, df)
-                    self.update_metadata(metadata, vector_column_names, df)
-                    if max_hit:
+                    for record_batch in self.iter_batches(parquet_file_path):
+                        df = record_batch.to_pandas()
+                        self.update_vectors(vectors, vector_column_name, df)
+                        self.update_metadata(metadata, vector_column_names, df)
+                    if self.max_rows_reached():
                         break
                 self.total_imported_count += self.flush_to_db(
                     vectors, metadata, collection, via_cql=via_cql
@@ -222,52 +211,22 @@ class ImportAstraDB(ImportVDB):
                 [metadata.get(k, {}) for k in keys],
             )
 
-        def flush_batch_to_db(collection, keys, vectors, metadata):
-            documents = [
-                {"_id": id, "$vector": vector, **metadata}
-                for id, vector, metadata in zip(keys, vectors, metadata)
-            ]
+        def flush_batch_to_db(documents):
             # replace nan with None
             clean_documents(documents)
-            try:
-                response = collection.upsert_many(documents=documents)
-                return response
-            except Exception as e:
-                tqdm.write(f"Error upserting batch: {e}")
-                return
+            collection.upsert_many(documents=documents)
 
         BATCH_SIZE = 20
-        num_parallel_threads = self.args.get("parallel", 5) or 5
-        total_points = len(keys)
-        batches = [
-            (
-                keys[i : i + BATCH_SIZE],
-                [vectors.get(k) for k in keys[i : i + BATCH_SIZE]],
-                [metadata.get(k, {}) for k in keys[i : i + BATCH_SIZE]],
-            )
-            for i in range(0, total_points, BATCH_SIZE)
-        ]
-
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=num_parallel_threads
-        ) as executor, tqdm(
-            total=total_points,
-            desc=f"Flushing to DB in batches of {BATCH_SIZE} in {num_parallel_threads} threads",
-        ) as pbar:
-            future_to_batch = {
-                executor.submit(flush_batch_to_db, collection, *batch): batch
-                for batch in batches
-            }
-
-            for future in concurrent.futures.as_completed(future_to_batch):
-                batch = future_to_batch[future]
-                try:
-                    future.result()
-                    pbar.update(len(batch[0]))
-                except Exception as e:
-                    tqdm.write(f"Batch upsert failed with error: {e}")
-
-        return total_points
+        documents = (
+            {"_id": id, "$vector": vectors.get(id), **metadata.get(id, {})}
+            for id in keys
+        )
+        uploader = self.make_uploader(
+            flush_batch_to_db,
+            BATCH_SIZE,
+            desc=f"Flushing to DB in batches of {BATCH_SIZE}",
+        )
+        return uploader.upload(documents, total=len(keys))
 
     def compliant_name(self, name):
         return re.sub(r"[- ./]", "_", name)
@@ -4,12 +4,12 @@ from tqdm import tqdm
 
 import chromadb
 
-from vdf_io.constants import DEFAULT_BATCH_SIZE, INT_MAX
+from vdf_io.constants import DEFAULT_BATCH_SIZE
 from vdf_io.meta_types import NamespaceMeta
 from vdf_io.names import DBNames
 from vdf_io.util import (
     cleanup_df,
-    divide_into_batches,
+    metadata_payloads,
     expand_shorthand_path,
     set_arg_from_input,
 )
@@ -144,22 +144,13 @@ class ImportChroma(ImportVDB):
                     tqdm.write(f"Skipping the rest : {vector_column_names[1:]}")
                 for file in tqdm(parquet_files, desc="Iterating parquet files"):
                     file_path = self.get_file_path(final_data_path, file)
-                    df = self.read_parquet_progress(
-                        file_path,
-                        max_num_rows=(
-                            (self.args.get("max_num_rows") or INT_MAX)
-                            - self.total_imported_count
-                        ),
-                    )
-                    df = cleanup_df(df)
-                    # if there are additional columns in the parquet file, add them to the table
-                    # split in batches
+                    # read the file in batches instead of loading it whole
                     BATCH_SIZE = self.args.get("batch_size") or DEFAULT_BATCH_SIZE
-                    for batch in tqdm(
-                        divide_into_batches(df, BATCH_SIZE),
+                    for record_batch in tqdm(
+                        self.iter_batches(file_path, batch_size=BATCH_SIZE),
                         desc="Importing batches",
-                        total=len(df) // BATCH_SIZE,
                     ):
+                        batch = cleanup_df(record_batch.to_pandas())
                         model_map = namespace_meta.get("model_map", {})
 
                         # filter out rows with empty or None vector column
@@ -193,18 +184,17 @@ class ImportChroma(ImportVDB):
                             )
                             .tolist()
                         )
-                        metadatas = []
-                        for _, row in batch.iterrows():
-                            metadata = row.to_dict()
-                            metadata.pop(vector_column_name)
-                            metadata.pop(self.id_column)
-                            # remove values from metadata which are not str, int, float, bool
-                            metadata = {
+                        # remove values from metadata which are not str, int, float, bool
+                        metadatas = [
+                            {
                                 k: v
                                 for k, v in metadata.items()
                                 if isinstance(v, (str, int, float, bool))
                             }
-                            metadatas.append(metadata)
+                            for metadata in metadata_payloads(
+                                batch, [vector_column_name, self.id_column]
+                            )
+                        ]
 
                         collection.upsert(
                             ids=ids,
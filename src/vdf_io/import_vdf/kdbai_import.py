@@ -5,9 +5,8 @@ import pyarrow.parquet as pq
 
 import kdbai_client as kdbai
 
-from vdf_io.constants import INT_MAX
 from vdf_io.names import DBNames
-from vdf_io.import_vdf.vdf_import_cls import ImportVDB
+from vdf_io.import_vdf.vdf_import_cls import DEFAULT_PARALLEL, ImportVDB
 from vdf_io.meta_types import NamespaceMeta
 from vdf_io.util import (
     set_arg_from_input,
@@ -60,6 +59,7 @@ class ImportKDBAI(ImportVDB):
         parser_kdbai.add_argument(
             "-i", "--index", type=str, help="Index used", default="hnsw"
         )
+        cls.add_upload_options(parser_kdbai)
 
     def __init__(self, args):
         super().__init__(args)
@@ -115,30 +115,14 @@ class ImportKDBAI(ImportVDB):
                         final_data_path, parquet_file
                     )
 
-                    if self.abnormal_vector_format:
-                        pandas_table = self.read_parquet_progress(parquet_file_path)
-                        pandas_table[vector_column_name] = pandas_table[
-                            vector_column_name
-                        ].apply(lambda x: self.extract_vector(x))
-                        # TODO: use save_vectors_to_parquet
-                        pandas_table.to_parquet(parquet_file_path)
-
-                    parquet_table = pq.read_table(parquet_file_path)
+                    parquet_schema = pq.read_schema(parquet_file_path)
                     # rename columns by replacing "-" with "_"
-                    old_column_name_to_new = {
-                        col: self.compliant_name(col)
-                        for col in parquet_table.column_names
-                    }
-                    parquet_table = parquet_table.rename_columns(
-                        [
-                            old_column_name_to_new[col]
-                            for col in parquet_table.column_names
-                        ]
-                    )
-                    parquet_schema = parquet_table.schema
+                    new_column_names = [
+                        self.compliant_name(col) for col in parquet_schema.names
+                    ]
                     parquet_columns = [
-                        {"name": field.name, "type": str(field.type)}
-                        for field in parquet_schema
+                        {"name": name, "type": str(field.type)}
+                        for name, field in zip(new_column_names, parquet_schema)
                     ]
 
                     # Extract information from JSON
@@ -198,42 +182,45 @@ class ImportKDBAI(ImportVDB):
 
                     # insert data
                     # Set the batch size
-                    df = parquet_table.to_pandas().drop(columns=cols_to_be_dropped)
-                    if self.total_imported_count + len(df) >= (
-                        self.args.get("max_num_rows") or INT_MAX
+                    batch_size = self.args.get("batch_size", 10_000) or 10_000
+                    # enough rows per read to keep every --parallel worker busy
+                    read_batch_size = batch_size * (
+                        self.args.get("parallel") or DEFAULT_PARALLEL
+                    )
+                    for record_batch in self.iter_batches(
+                        parquet_file_path, batch_size=read_batch_size
                     ):
+                        df = (
+                            record_batch.rename_columns(new_column_names)
+                            .to_pandas()
+                            .drop(columns=cols_to_be_dropped)
+                        )
+                        if self.abnormal_vector_format:
+                            df[vector_column_name] = df[vector_column_name].apply(
+                                lambda x: self.extract_vector(x)
+                            )
+                        # convert pytype double to float64
+                        for col in df.columns:
+                            if df[col].dtype == "double":
+                                df[col] = df[col].astype("float64")
+                                tqdm.write(f"Converting column {col} to float64")
+
+                        def insert_rows(row_positions, df=df, table=table):
+                            # batches of row positions are contiguous
+                            chunk = df[row_positions[0] : row_positions[-1] + 1]
+                            table.insert(chunk.reset_index(drop=True))
+
+                        uploader = self.make_uploader(
+                            insert_rows, batch_size, desc="Inserting data"
+                        )
+                        uploader.upload(range(df.shape[0]), total=df.shape[0])
+                        if uploader.failed_count > 0:
+                            raise RuntimeError(
+                                f"Error inserting {uploader.failed_count} rows into '{new_index_name}'"
+                            )
+                        self.total_imported_count += len(df)
+                    if self.max_rows_reached():
                         max_hit = True
-                        # Take a subset of df
-                        df = df.iloc[
-                            : (self.args.get("max_num_rows") or INT_MAX)
-                            - self.total_imported_count
-                        ]
-                    i = 0
-                    # convert pytype double to float64
-                    for col in df.columns:
-                        if df[col].dtype == "double":
-                            df[col] = df[col].astype("float64")
-                            tqdm.write(f"Converting column {col} to float64")
-                    batch_size = self.args.get("batch_size", 10_000) or 10_000
-                    pbar = tqdm(total=df.shape[0], desc="Inserting data")
-                    while i < df.shape[0]:
-                        chunk = df[i : i + batch_size].reset_index(drop=True)
-                        # Assuming 'table' has an 'insert' method
-                        try:
-                            table.insert(chunk)
-                            pbar.update(chunk.shape[0])
-                            i += batch_size
-                        except kdbai.KDBAIException as e:
-                            if "smaller batches" in str(e):
-                                tqdm.write(
-                                    f"Reducing batch size to {batch_size * 2 // 3}"
-                                )
-                                batch_size = batch_size * 2 // 3
-                            else:
-                                raise RuntimeError(f"Error inserting chunk: {e}")
-                            continue
-                    self.total_imported_count += len(df)
-                    if max_hit:
                         break
                 if max_hit:
                     break
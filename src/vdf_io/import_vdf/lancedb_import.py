@@ -6,12 +6,11 @@ import pyarrow.parquet as pq
 
 import lancedb
 
-from vdf_io.constants import DEFAULT_BATCH_SIZE, INT_MAX
+from vdf_io.constants import DEFAULT_BATCH_SIZE
 from vdf_io.meta_types import NamespaceMeta
 from vdf_io.names import DBNames
 from vdf_io.util import (
     cleanup_df,
-    divide_into_batches,
     set_arg_from_input,
     set_arg_from_password,
 )
@@ -103,48 +102,33 @@ class ImportLanceDB(ImportVDB):
                     table = self.db.open_table(new_index_name)
                     tqdm.write(f"Opened table {new_index_name}")
 
+                BATCH_SIZE = self.args.get("batch_size") or DEFAULT_BATCH_SIZE
                 for file in tqdm(parquet_files, desc="Iterating parquet files"):
                     file_path = self.get_file_path(final_data_path, file)
-                    df = self.read_parquet_progress(
-                        file_path,
-                        max_num_rows=(
-                            (self.args.get("max_num_rows") or INT_MAX)
-                            - self.total_imported_count
-                        ),
-                    )
-                    df = cleanup_df(df)
-                    # if there are additional columns in the parquet file, add them to the table
-                    for col in df.columns:
-                        if col not in [field.name for field in table.schema]:
-                            col_type = df[col].dtype
-                            tqdm.write(
-                                f"Adding column {col} of type {col_type} to {new_index_name}"
-                            )
-                            table.add_columns(
-                                {
-                                    col: get_default_value(col_type),
-                                }
-                            )
-                    # split in batches
-                    BATCH_SIZE = self.args.get("batch_size") or DEFAULT_BATCH_SIZE
-                    for batch in tqdm(
-                        divide_into_batches(df, BATCH_SIZE),
+                    table_columns = {field.name for field in table.schema}
+                    for record_batch in tqdm(
+                        self.iter_batches(file_path, batch_size=BATCH_SIZE),
                         desc="Importing batches",
-                        total=len(df) // BATCH_SIZE,
                     ):
-                        if self.total_imported_count + len(batch) >= (
-                            self.args.get("max_num_rows") or INT_MAX
-                        ):
-                            batch = batch[
-                                : (self.args.get("max_num_rows") or INT_MAX)
-                                - self.total_imported_count
-                            ]
-                            max_hit = True
-                        # convert df into list of dicts
+                        batch = cleanup_df(record_batch.to_pandas())
+                        # if there are additional columns in the parquet file, add them to the table
+                        for col in batch.columns:
+                            if col not in table_columns:
+                                col_type = batch[col].dtype
+                                tqdm.write(
+                                    f"Adding column {col} of type {col_type} to {new_index_name}"
+                                )
+                                table.add_columns(
+                                    {
+                                        col: get_default_value(col_type),
+                                    }
+                                )
+                                table_columns.add(col)
                         table.add(batch)
                         self.total_imported_count += len(batch)
-                        if max_hit:
-                            break
+                    max_hit = self.max_rows_reached()
+                    if max_hit:
+                        break
                 tqdm.write(f"Imported {self.total_imported_count} rows")
                 tqdm.write(f"New table size: {table.count_rows()}")
                 if max_hit:
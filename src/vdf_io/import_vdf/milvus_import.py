@@ -1,19 +1,30 @@
+import argparse
+import base64
+import datetime
+import decimal
+import json
+import os
+import time
 from dotenv import load_dotenv
 from tqdm import tqdm
-import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
 from pymilvus import (
     connections,
     utility,
+    BulkInsertState,
     Collection,
     CollectionSchema,
     FieldSchema,
     DataType,
 )
 
-from vdf_io.constants import INT_MAX
 from vdf_io.names import DBNames
 from vdf_io.util import (
+    resolve_parquet_file_path,
     set_arg_from_input,
     set_arg_from_password,
     standardize_metric_reverse,
@@ -23,9 +34,15 @@ from vdf_io.import_vdf.vdf_import_cls import ImportVDB
 
 load_dotenv()
 
+# namespaces with fewer rows are upserted even with --bulk_insert
+BULK_INSERT_MIN_ROWS = 100_000
+BULK_INSERT_POLL_INTERVAL = 5  # in seconds
+DYNAMIC_FIELD_COLUMN = "$meta"
+
 
 class ImportMilvus(ImportVDB):
     DB_NAME_SLUG = DBNames.MILVUS
+    SUPPORTS_WORKERS = True
 
     @classmethod
     def import_vdb(cls, args):
@@ -58,6 +75,37 @@ class ImportMilvus(ImportVDB):
             "-u", "--uri", type=str, help="URI of Milvus instance"
         )
         parser_milvus.add_argument("-t", "--token", type=str, help="Milvus token")
+        cls.add_upload_options(parser_milvus)
+        parser_milvus.add_argument(
+            "--bulk_insert",
+            type=bool,
+            help=(
+                "Rewrite the parquet files into --bulk_insert_dir and load them with"
+                " Milvus bulk insert instead of upserts (default: False)"
+            ),
+            default=False,
+            action=argparse.BooleanOptionalAction,
+        )
+        parser_milvus.add_argument(
+            "--bulk_insert_dir",
+            type=str,
+            help="Directory readable by Milvus as its storage bucket, e.g. a mounted bucket",
+        )
+        parser_milvus.add_argument(
+            "--bulk_insert_prefix",
+            type=str,
+            help="Path of --bulk_insert_dir inside the Milvus storage bucket (default: '')",
+            default="",
+        )
+        parser_milvus.add_argument(
+            "--bulk_insert_min_rows",
+            type=int,
+            help=(
+                "Namespaces with fewer rows are upserted instead"
+                f" (default: {BULK_INSERT_MIN_ROWS})"
+            ),
+            default=BULK_INSERT_MIN_ROWS,
+        )
 
     def __init__(self, args):
         # call super class constructor
@@ -72,17 +120,24 @@ class ImportMilvus(ImportVDB):
         connections.connect(uri=uri, token=token)
 
     def upsert_data(self):
-        max_hit = False
         self.total_imported_count = 0
         # we know that the self.vdf_meta["indexes"] is a list
         for collection_name, index_meta in self.vdf_meta["indexes"].items():
+            if self.max_rows_reached():
+                break
             # load data
             print(f'Importing data for collection "{collection_name}"')
             for namespace_meta in tqdm(index_meta, desc="Importing namespaces"):
+                # don't create empty collections once --max_num_rows was read
+                if self.max_rows_reached():
+                    tqdm.write(
+                        f"Max rows to be imported {self.args['max_num_rows']} hit. Exiting"
+                    )
+                    break
                 self.set_dims(namespace_meta, collection_name)
                 data_path = namespace_meta["data_path"]
                 index_name = collection_name + (
-                    f'_{namespace_meta["namespace"]}'
+                    f"_{namespace_meta['namespace']}"
                     if namespace_meta["namespace"]
                     else ""
                 )
@@ -96,7 +151,8 @@ class ImportMilvus(ImportVDB):
                 print(f"Index name: {index_name}")
 
                 # check if collection exists
-                if utility.has_collection(index_name):
+                fresh_collection = not utility.has_collection(index_name)
+                if not fresh_collection:
                     collection = Collection(index_name)
                     f_vector = None
                     f_pk = None
@@ -128,27 +184,6 @@ class ImportMilvus(ImportVDB):
                         print(f'Failed to create collection "{index_name}"', e)
                         raise RuntimeError("Failed to create collection.") from e
 
-                # check if index exists
-                if index_name in [index.index_name for index in collection.indexes]:
-                    print(f"Using existed index: {index_name}")
-                else:
-                    # create index
-                    try:
-                        index_params = {
-                            "metric_type": standardize_metric_reverse(
-                                namespace_meta.get("metric"), self.DB_NAME_SLUG
-                            ),
-                            "index_type": "AUTOINDEX",
-                        }
-                        collection.create_index(
-                            field_name=f_vector.name, index_params=index_params
-                        )
-                    except Exception as e:
-                        print(
-                            f"Faild to create index {index_name} for collection {index_name}."
-                        )
-                        raise RuntimeError("Failed to create index.") from e
-
                 prev_vector_count = collection.num_entities
                 if prev_vector_count > 0:
                     print(
@@ -157,64 +192,390 @@ class ImportMilvus(ImportVDB):
 
                 # Load the data from the parquet files
                 final_data_path = self.get_final_data_path(data_path)
-                parquet_files = self.get_parquet_files(final_data_path)
-
-                num_inserted = 0
-                for file in tqdm(parquet_files, desc="Iterating parquet files"):
-                    file_path = self.get_file_path(final_data_path, file)
-                    df = self.read_parquet_progress(file_path)
-                    df[self.id_column] = df[self.id_column].apply(lambda x: str(x))
-                    data_rows = []
-
-                    for _, row in df.iterrows():
-                        row[old_vector_column_name] = self.extract_vector(
-                            row[old_vector_column_name]
-                        )
-                        row = json.loads(row.to_json())
-                        # replace old_vector_column_name with vector_column_name
-                        if old_vector_column_name != vector_column_name:
-                            row[vector_column_name] = row[old_vector_column_name]
-                            del row[old_vector_column_name]
-                        assert isinstance(row[f_pk.name], str), row[f_pk.name]
-                        assert isinstance(row[f_vector.name][0], float), type(
-                            row[f_vector.name][0]
-                        )
-                        data_rows.append(row)
-                    BATCH_SIZE = self.args.get("batch_size", 1000) or 1000
-                    current_batch_size = BATCH_SIZE
-                    tqdm.write(
-                        f"Inserting {len(data_rows)} rows in batches of {BATCH_SIZE}"
+                if self.use_bulk_insert(final_data_path):
+                    num_inserted = self.bulk_insert_files(
+                        final_data_path,
+                        index_name,
+                        old_vector_column_name,
+                        vector_column_name,
+                        f_pk.name,
+                    )
+                else:
+                    num_inserted = self.import_files(
+                        final_data_path,
+                        "upsert_file",
+                        index_name=index_name,
+                        old_vector_column_name=old_vector_column_name,
+                        vector_column_name=vector_column_name,
+                        pk_name=f_pk.name,
+                        use_insert=fresh_collection,
                     )
-                    if self.total_imported_count + BATCH_SIZE >= (
-                        self.args.get("max_num_rows") or INT_MAX
-                    ):
-                        data_rows = data_rows[
-                            : (self.args.get("max_num_rows") or INT_MAX)
-                            - self.total_imported_count
-                        ]
-                        max_hit = True
-                    i = 0
-                    pbar = tqdm(total=len(data_rows), desc="Upserting data in batches")
-                    while i < len(data_rows):
-                        try:
-                            mr = collection.upsert(
-                                data_rows[i : i + current_batch_size]
-                            )
-                            num_inserted += mr.upsert_count
-                            self.total_imported_count += mr.upsert_count
-                            i += current_batch_size
-                            pbar.update(current_batch_size)
-                        except Exception as e:
-                            tqdm.write(f"Error inserting data: {e}")
-                            # reduce batch size
-                            current_batch_size = current_batch_size * 2 // 3
-                            tqdm.write(f"Reducing batch size to {current_batch_size}")
-                            continue
-                    if max_hit:
-                        break
+                self.total_imported_count += num_inserted
                 collection.flush()
+                # the index is built once over the loaded data
+                if f_vector.name in [index.field_name for index in collection.indexes]:
+                    print(f"Using existed index of field '{f_vector.name}'")
+                else:
+                    self.build_index(
+                        collection, index_name, f_vector.name, namespace_meta
+                    )
                 vector_count = collection.num_entities
                 print(f"Index '{index_name}' has {vector_count} vectors after import")
                 print(f"{num_inserted} vectors were imported")
         print("Data import completed successfully.")
         self.args["imported_count"] = self.total_imported_count
+
+    def build_index(self, collection, index_name, vector_field_name, namespace_meta):
+        """
+        Create the AUTOINDEX of a loaded collection and wait until it is built
+        """
+        start_time = time.time()
+        try:
+            index_params = {
+                "metric_type": standardize_metric_reverse(
+                    namespace_meta.get("metric"), self.DB_NAME_SLUG
+                ),
+                "index_type": "AUTOINDEX",
+            }
+            collection.create_index(
+                field_name=vector_field_name,
+                index_params=index_params,
+                index_name=index_name,
+            )
+            utility.wait_for_index_building_complete(index_name, index_name)
+        except Exception as e:
+            print(f"Faild to create index {index_name} for collection {index_name}.")
+            raise RuntimeError("Failed to create index.") from e
+        index_build_time = time.time() - start_time
+        self.args["index_build_time"] = (
+            self.args.get("index_build_time") or 0
+        ) + index_build_time
+        tqdm.write(f"Index of '{index_name}' built in {index_build_time:.2f} seconds")
+
+    def upsert_file(
+        self,
+        file_path,
+        index_name,
+        old_vector_column_name,
+        vector_column_name,
+        pk_name,
+        use_insert=False,
+        max_num_rows=None,
+    ):
+        collection = Collection(index_name)
+        field_names = [
+            field.name
+            for field in collection.schema.fields
+            if not getattr(field, "auto_id", False)
+        ]
+
+        # a collection created by this import has no rows to replace
+        inserting = use_insert
+
+        def upsert_batch(batch):
+            nonlocal inserting
+            if batch and isinstance(batch[0], tuple):
+                # rows of schema fields go to Milvus as one list per field
+                batch = [list(column) for column in zip(*batch)]
+            if not inserting:
+                return collection.upsert(batch).upsert_count
+            try:
+                return collection.insert(batch).insert_count
+            except Exception:
+                # a failed insert may still have been applied, so retries of
+                # this file upsert to avoid duplicate primary keys
+                inserting = False
+                raise
+
+        # decode and convert the next batches while the current ones are upserted
+        tracker = self.journal_tracker(index_name, file_path)
+        data_rows = tracker.track(
+            self.pipelined(
+                tracker.skip_done(
+                    self.iter_batches(file_path, max_num_rows=max_num_rows)
+                ),
+                transform=lambda record_batch: self.entities_from_batch(
+                    record_batch,
+                    old_vector_column_name,
+                    vector_column_name,
+                    pk_name,
+                    field_names,
+                ),
+            )
+        )
+        BATCH_SIZE = self.args.get("batch_size", 1000) or 1000
+        uploader = self.make_uploader(
+            upsert_batch,
+            BATCH_SIZE,
+            desc=f"Upserting data in batches of {BATCH_SIZE}",
+        )
+        num_upserted = uploader.upload(data_rows, on_acked=tracker.acked)
+        tracker.acked(uploader.acked_count)
+        if tracker.num_skipped:
+            tqdm.write(
+                f"Skipped {tracker.num_skipped} rows of {file_path} imported by an earlier run"
+            )
+        return num_upserted
+
+    def use_bulk_insert(self, final_data_path):
+        if not self.args.get("bulk_insert"):
+            return False
+        if not self.args.get("bulk_insert_dir"):
+            raise ValueError("--bulk_insert requires --bulk_insert_dir")
+        num_rows = sum(
+            max_num_rows
+            if max_num_rows is not None
+            else pq.read_metadata(resolve_parquet_file_path(file_path)).num_rows
+            for file_path, max_num_rows in self.file_row_budgets(final_data_path)
+        )
+        min_rows = self.args.get("bulk_insert_min_rows")
+        if min_rows is None:
+            min_rows = BULK_INSERT_MIN_ROWS
+        if num_rows < min_rows:
+            tqdm.write(
+                f"Upserting {num_rows} rows, bulk insert is used from {min_rows} rows"
+            )
+            return False
+        return True
+
+    def bulk_insert_files(
+        self,
+        final_data_path,
+        index_name,
+        old_vector_column_name,
+        vector_column_name,
+        pk_name,
+    ):
+        """
+        Rewrite the parquet files of a namespace into the Milvus bulk insert
+        layout, submit one bulk insert task per file and wait for all of them.
+        Returns the number of rows imported.
+        """
+        field_names = [field.name for field in Collection(index_name).schema.fields]
+        staging_dir = os.path.join(self.args["bulk_insert_dir"], index_name)
+        os.makedirs(staging_dir, exist_ok=True)
+        tasks = {}
+        for file_path, max_num_rows in tqdm(
+            self.file_row_budgets(final_data_path), desc="Submitting bulk inserts"
+        ):
+            tracker = self.journal_tracker(index_name, file_path)
+            num_rows = (
+                max_num_rows
+                if max_num_rows is not None
+                else pq.read_metadata(resolve_parquet_file_path(file_path)).num_rows
+            )
+            if tracker.covers(0, num_rows):
+                tqdm.write(f"Skipping {file_path}, imported by an earlier run")
+                self.num_rows_read += num_rows
+                continue
+            bulk_file = os.path.join(staging_dir, f"{len(tasks)}.parquet")
+            written = self.write_bulk_insert_file(
+                file_path,
+                bulk_file,
+                max_num_rows,
+                old_vector_column_name,
+                vector_column_name,
+                pk_name,
+                field_names,
+            )
+            if not written:
+                continue
+            task_id = utility.do_bulk_insert(
+                collection_name=index_name,
+                files=[
+                    os.path.join(
+                        self.args.get("bulk_insert_prefix") or "",
+                        os.path.relpath(bulk_file, self.args["bulk_insert_dir"]),
+                    )
+                ],
+            )
+            tasks[task_id] = tracker, num_rows
+        return self.wait_for_bulk_inserts(tasks)
+
+    def wait_for_bulk_inserts(self, tasks):
+        """
+        Poll the states of bulk insert tasks until all of them completed
+        """
+        imported_count = 0
+        failed_states = (
+            BulkInsertState.ImportFailed,
+            BulkInsertState.ImportFailedAndCleaned,
+        )
+        with tqdm(total=len(tasks), desc="Waiting for bulk inserts") as pbar:
+            while tasks:
+                for task_id in list(tasks):
+                    state = utility.get_bulk_insert_state(task_id=task_id)
+                    if state.state in failed_states:
+                        raise RuntimeError(
+                            f"Bulk insert task {task_id} failed: {state.failed_reason}"
+                        )
+                    if state.state != BulkInsertState.ImportCompleted:
+                        continue
+                    tracker, num_rows = tasks.pop(task_id)
+                    tracker.record(0, num_rows)
+                    imported_count += state.row_count
+                    pbar.update(1)
+                if tasks:
+                    time.sleep(BULK_INSERT_POLL_INTERVAL)
+        return imported_count
+
+    def write_bulk_insert_file(
+        self,
+        file_path,
+        bulk_file,
+        max_num_rows,
+        old_vector_column_name,
+        vector_column_name,
+        pk_name,
+        field_names,
+    ):
+        """
+        Stream a parquet file into bulk_file, one record batch at a time.
+        Returns False if the file had no rows to write.
+        """
+        writer = None
+        try:
+            for record_batch in self.iter_batches(file_path, max_num_rows=max_num_rows):
+                bulk_batch = self.bulk_insert_batch(
+                    record_batch,
+                    old_vector_column_name,
+                    vector_column_name,
+                    pk_name,
+                    field_names,
+                )
+                if writer is None:
+                    writer = pq.ParquetWriter(bulk_file, bulk_batch.schema)
+                writer.write_batch(bulk_batch)
+        finally:
+            if writer is not None:
+                writer.close()
+        return writer is not None
+
+    def bulk_insert_batch(
+        self,
+        record_batch,
+        old_vector_column_name,
+        vector_column_name,
+        pk_name,
+        field_names,
+    ):
+        """
+        Convert a record batch to the bulk insert layout: the primary key as
+        strings, the vectors as float32 lists, the columns of other schema fields
+        as they are and the remaining ones as JSON in the dynamic field
+        """
+        matrix, valid = self.extract_vectors(
+            record_batch.column(old_vector_column_name)
+        )
+        if not valid.all():
+            record_batch = record_batch.filter(pa.array(valid))
+        dims = matrix.shape[1]
+        columns = {
+            pk_name: pc.cast(record_batch.column(self.id_column), pa.string()),
+            vector_column_name: pa.ListArray.from_arrays(
+                pa.array(np.arange(0, len(matrix) * dims + 1, dims, dtype=np.int32)),
+                pa.array(matrix.ravel()),
+            ),
+        }
+        exclude_columns = {self.id_column, old_vector_column_name}
+        for name in record_batch.schema.names:
+            if name in field_names and name not in exclude_columns:
+                columns[name] = record_batch.column(name)
+                exclude_columns.add(name)
+        dynamic_columns = json_compatible_columns(record_batch, exclude_columns)
+        if dynamic_columns:
+            names = list(dynamic_columns)
+            columns[DYNAMIC_FIELD_COLUMN] = pa.array(
+                [
+                    json.dumps(dict(zip(names, values)), default=json_default)
+                    for values in zip(*dynamic_columns.values())
+                ],
+                pa.string(),
+            )
+        return pa.record_batch(list(columns.values()), names=list(columns))
+
+    def entities_from_batch(
+        self,
+        record_batch,
+        old_vector_column_name,
+        vector_column_name,
+        pk_name,
+        field_names,
+    ):
+        """
+        Convert a record batch to Milvus entities column by column.
+
+        Ids are cast to strings and vectors to a float32 matrix once per batch.
+        When the columns are exactly the schema fields, entities are tuples in
+        field order (to be sent as one list per field), otherwise dicts that
+        also carry the dynamic fields.
+        """
+        matrix, valid = self.extract_vectors(
+            record_batch.column(old_vector_column_name)
+        )
+        if not valid.all():
+            record_batch = record_batch.filter(pa.array(valid))
+        columns = {
+            pk_name: pc.cast(
+                record_batch.column(self.id_column), pa.string()
+            ).to_pylist(),
+            vector_column_name: matrix.tolist(),
+        }
+        columns.update(
+            json_compatible_columns(
+                record_batch, exclude_columns=(self.id_column, old_vector_column_name)
+            )
+        )
+        if set(columns) == set(field_names):
+            return list(zip(*(columns[name] for name in field_names)))
+        names = list(columns)
+        return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def json_compatible_columns(record_batch, exclude_columns=()):
+    """
+    Return {column_name: list of python values} for the columns of a record
+    batch, with NaN as None and timestamps and dates as epoch milliseconds, the
+    way DataFrame.to_json writes them
+    """
+    columns = {}
+    for name, column in zip(record_batch.schema.names, record_batch.columns):
+        if name in exclude_columns:
+            continue
+        if pa.types.is_floating(column.type):
+            column = pc.if_else(pc.is_nan(column), pa.scalar(None, column.type), column)
+        elif pa.types.is_timestamp(column.type):
+            column = column.cast(pa.timestamp("ms", column.type.tz)).cast(pa.int64())
+        elif pa.types.is_date(column.type):
+            column = column.cast(pa.timestamp("ms")).cast(pa.int64())
+        columns[name] = column.to_pylist()
+    return columns
+
+
+def json_default(value):
+    """
+    JSON value of what json.dumps cannot serialize itself, e.g. nested in list
+    or struct columns: numpy scalars, bytes (as UTF-8 text, else base64),
+    decimals, durations (in seconds), times and dates and timestamps (as epoch
+    milliseconds, like json_compatible_columns)
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, bytes):
+        try:
+            return value.decode("utf-8")
+        except UnicodeDecodeError:
+            return base64.b64encode(value).decode("ascii")
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, datetime.time):
+        return value.isoformat()
+    if isinstance(value, datetime.date):
+        if not isinstance(value, datetime.datetime):
+            value = datetime.datetime.combine(value, datetime.time())
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return int(value.timestamp() * 1000)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -1,13 +1,11 @@
 import argparse
 import pandas as pd
 from tqdm import tqdm
-import os
 from dotenv import load_dotenv
 
 from pinecone.grpc import PineconeGRPC as Pinecone
 from pinecone import ServerlessSpec, PodSpec, Vector
 
-from vdf_io.constants import INT_MAX
 from vdf_io.names import DBNames
 from vdf_io.util import (
     set_arg_from_input,
@@ -18,9 +16,13 @@ from vdf_io.import_vdf.vdf_import_cls import ImportVDB
 
 load_dotenv()
 
+# Pinecone takes at most 1000 vectors per upsert
+MAX_UPSERT_BATCH_SIZE = 1000
+
 
 class ImportPinecone(ImportVDB):
     DB_NAME_SLUG = DBNames.PINECONE
+    SUPPORTS_WORKERS = True
 
     @classmethod
     def import_vdb(cls, args):
@@ -100,17 +102,20 @@ class ImportPinecone(ImportVDB):
         parser_pinecone.add_argument(
             "-r", "--region", type=str, help="Pinecone Serverless region"
         )
+        cls.add_upload_options(parser_pinecone)
 
     def __init__(self, args):
         super().__init__(args)
         self.pc = Pinecone(api_key=self.args["pinecone_api_key"])
+        self.indexes = {}
+        self.subset_id_list = None
 
     def compliant_name(self, name: str) -> str:
         new_name = name.lower().replace("_", "-")
         return new_name
 
     def upsert_data(self):
-        max_hit = False
+        self.total_imported_count = 0
         # Iterate over the indexes and import the data
         for index_name, index_meta in tqdm(
             self.vdf_meta["indexes"].items(), desc="Importing indexes"
@@ -159,122 +164,122 @@ class ImportPinecone(ImportVDB):
                 except Exception as e:
                     tqdm.write(f"{e}")
                     raise Exception(f"Invalid index name '{compliant_index_name}'", e)
-            index = self.pc.Index(compliant_index_name)
-            BATCH_SIZE = self.args.get("batch_size", 1000) or 1000
-            current_batch_size = BATCH_SIZE
-            for namespace_meta in tqdm(index_meta, desc="Importing namespaces"):
-                tqdm.write(
-                    f"Importing data for namespace '{namespace_meta['namespace']}'"
+            namespaces = []
+            for namespace_meta in index_meta:
+                vector_column_names, vector_column_name = self.get_vector_column_name(
+                    index_name, namespace_meta
                 )
-                namespace = namespace_meta["namespace"]
-                data_path = namespace_meta["data_path"]
+                namespaces.append(
+                    (
+                        self.get_final_data_path(namespace_meta["data_path"]),
+                        dict(
+                            index_name=compliant_index_name,
+                            namespace=namespace_meta["namespace"],
+                            vector_column_name=vector_column_name,
+                            vector_column_names=vector_column_names,
+                        ),
+                    )
+                )
+            # the files of all namespaces share the --workers
+            self.total_imported_count += self.import_namespaces(
+                namespaces, "upsert_file"
+            )
+        tqdm.write(
+            f"Data import completed successfully. Imported {self.total_imported_count} vectors"
+        )
+        self.args["imported_count"] = self.total_imported_count
 
-                # Check if the data path exists
-                final_data_path = self.get_final_data_path(data_path)
+    def get_index(self, index_name):
+        if index_name not in self.indexes:
+            self.indexes[index_name] = self.pc.Index(index_name)
+        return self.indexes[index_name]
 
-                # Load the data from the parquet files
-                parquet_files = self.get_parquet_files(final_data_path)
+    def upsert_file(
+        self,
+        file_path,
+        index_name,
+        namespace,
+        vector_column_name,
+        vector_column_names,
+        max_num_rows=None,
+    ):
+        """
+        Upsert the vectors of one parquet file, one record batch at a time
+        """
+        index = self.get_index(index_name)
+        tracker = self.journal_tracker(f"{index_name}/{namespace}", file_path)
+        batch_vectors = tracker.track(
+            self.pipelined(
+                tracker.skip_done(
+                    self.iter_batches(file_path, max_num_rows=max_num_rows)
+                ),
+                transform=lambda record_batch: self.vectors_from_batch(
+                    record_batch, vector_column_name, vector_column_names
+                ),
+            )
+        )
+        BATCH_SIZE = self.args.get("batch_size", 1000) or 1000
 
-                vectors = {}
-                metadata = {}
-                vector_column_names, vector_column_name = self.get_vector_column_name(
-                    index_name, namespace_meta
-                )
+        def upsert_batch(batch):
+            resp = index.upsert(vectors=batch, namespace=namespace)
+            return resp.upserted_count
 
-                for file in tqdm(parquet_files, desc="Loading data from parquet files"):
-                    file_path = os.path.join(final_data_path, file)
-                    df = self.read_parquet_progress(file_path)
+        uploader = self.make_uploader(
+            upsert_batch,
+            BATCH_SIZE,
+            min_batch_size=max(1, BATCH_SIZE // 100),
+            max_batch_size=max(BATCH_SIZE, MAX_UPSERT_BATCH_SIZE),
+            desc=f"Upserting vectors to namespace '{namespace}'",
+        )
+        num_upserted = uploader.upload(batch_vectors, on_acked=tracker.acked)
+        tracker.acked(uploader.acked_count)
+        return num_upserted
 
-                    if self.args["subset"] is True:
-                        if (
-                            "id_list_file" in self.args
-                            and self.args["id_list_file"] is not None
-                        ):
-                            id_list = pd.read_csv(
-                                self.args["id_list_file"], header=None
-                            )[0].tolist()
-                            df = df[df[self.id_column].isin(id_list)]
-                        elif (
-                            "id_range_start" in self.args
-                            and self.args["id_range_start"] is not None
-                            and "id_range_end" in self.args
-                            and self.args["id_range_end"] is not None
-                        ):
-                            # convert id to int before comparison
-                            df = df[
-                                (
-                                    df[self.id_column].astype(int)
-                                    >= self.args["id_range_start"]
-                                )
-                                & (
-                                    df[self.id_column].astype(int)
-                                    <= self.args["id_range_end"]
-                                )
-                            ]
-                        else:
-                            raise Exception(
-                                "Invalid arguments for subset export. "
-                                "Please provide either id_list_file or id_range_start and id_range_end"
-                            )
-                    if len(vectors) > (self.args.get("max_num_rows") or INT_MAX):
-                        max_hit = True
-                        break
-                    if len(vectors) + len(df) > (
-                        self.args.get("max_num_rows") or INT_MAX
-                    ):
-                        df = df.head(
-                            (self.args.get("max_num_rows") or INT_MAX) - len(vectors)
-                        )
-                        max_hit = True
-                    self.update_vectors(vectors, vector_column_name, df)
-                    self.update_metadata(metadata, vector_column_names, df)
-                    if max_hit:
-                        break
-                tqdm.write(
-                    f"Loaded {len(vectors)} vectors from {len(parquet_files)} parquet files"
+    def vectors_from_batch(self, record_batch, vector_column_name, vector_column_names):
+        df = self.filter_subset(record_batch.to_pandas())
+        vectors = {}
+        metadata = {}
+        self.update_vectors(vectors, vector_column_name, df)
+        self.update_metadata(metadata, vector_column_names, df)
+        return [
+            (
+                Vector(
+                    id=str(id),
+                    values=vector,
+                    metadata={
+                        k: v for k, v in metadata.get(id, {}).items() if v is not None
+                    },
+                )
+                if len(metadata.get(id, {}).keys()) > 0
+                else Vector(
+                    id=str(id),
+                    values=vector,
                 )
-                # Upsert the vectors and metadata to the Pinecone index in batches
-                self.total_imported_count = 0
-                start_idx = 0
-                pbar = tqdm(total=len(vectors), desc="Upserting vectors")
-                while start_idx < len(vectors):
-                    end_idx = min(start_idx + current_batch_size, len(vectors))
+            )
+            for id, vector in vectors.items()
+        ]
 
-                    batch_vectors = [
-                        (
-                            Vector(
-                                id=str(id),
-                                values=vector,
-                                metadata={
-                                    k: v
-                                    for k, v in metadata.get(id, {}).items()
-                                    if v is not None
-                                },
-                            )
-                            if len(metadata.get(id, {}).keys()) > 0
-                            else Vector(
-                                id=str(id),
-                                values=vector,
-                            )
-                        )
-                        for id, vector in list(vectors.items())[start_idx:end_idx]
-                    ]
-                    try:
-                        resp = index.upsert(vectors=batch_vectors, namespace=namespace)
-                        self.total_imported_count += resp.upserted_count
-                        pbar.update(resp.upserted_count)
-                        start_idx += resp.upserted_count
-                    except Exception as e:
-                        tqdm.write(
-                            f"Error upserting vectors for index '{compliant_index_name}', {e}"
-                        )
-                        if current_batch_size < BATCH_SIZE / 100:
-                            tqdm.write("Batch size is not the issue. Aborting import")
-                            raise e
-                        current_batch_size = int(2 * current_batch_size / 3)
-                        tqdm.write(f"Reducing batch size to {current_batch_size}")
-                        continue
-        tqdm.write(
-            f"Data import completed successfully. Imported {self.total_imported_count} vectors"
+    def filter_subset(self, df):
+        if self.args["subset"] is not True:
+            return df
+        if "id_list_file" in self.args and self.args["id_list_file"] is not None:
+            if self.subset_id_list is None:
+                self.subset_id_list = pd.read_csv(
+                    self.args["id_list_file"], header=None
+                )[0].tolist()
+            return df[df[self.id_column].isin(self.subset_id_list)]
+        if (
+            "id_range_start" in self.args
+            and self.args["id_range_start"] is not None
+            and "id_range_end" in self.args
+            and self.args["id_range_end"] is not None
+        ):
+            # convert id to int before comparison
+            return df[
+                (df[self.id_column].astype(int) >= self.args["id_range_start"])
+                & (df[self.id_column].astype(int) <= self.args["id_range_end"])
+            ]
+        raise Exception(
+            "Invalid arguments for subset export. "
+            "Please provide either id_list_file or id_range_start and id_range_end"
         )
-        self.args["imported_count"] = self.total_imported_count
@@ -1,23 +1,32 @@
+import argparse
+import itertools
 import json
+import time
+from collections import deque
 from dotenv import load_dotenv
+from halo import Halo
 import numpy as np
 from tqdm import tqdm
 from grpc import RpcError
 from typing import Any, Dict, List
 from PIL import Image
-from halo import Halo
-
-import concurrent.futures
 
 from qdrant_client import QdrantClient
 from qdrant_client.http.exceptions import UnexpectedResponse
-from qdrant_client.http.models import VectorParams, Distance, PointStruct
+from qdrant_client.http.models import (
+    CollectionStatus,
+    VectorParams,
+    Distance,
+    OptimizersConfigDiff,
+    PointStruct,
+)
 
-from vdf_io.constants import INT_MAX
 from vdf_io.names import DBNames
+from vdf_io.constants import DEFAULT_BATCH_SIZE
 from vdf_io.util import (
     expand_shorthand_path,
     get_qdrant_id_from_id,
+    metadata_payloads,
     set_arg_from_input,
     set_arg_from_password,
 )
@@ -26,9 +35,15 @@ from vdf_io.meta_types import NamespaceMeta
 
 load_dotenv()
 
+# Qdrant's default optimizers_config.indexing_threshold (in KB)
+DEFAULT_INDEXING_THRESHOLD = 20_000
+# batches queued per upload process by qdrant-client (MAX_INTERNAL_BATCH_SIZE)
+CLIENT_QUEUE_SIZE = 200
+
 
 class ImportQdrant(ImportVDB):
     DB_NAME_SLUG = DBNames.QDRANT
+    SUPPORTS_WORKERS = True
 
     @classmethod
     def import_vdb(cls, args):
@@ -107,17 +122,26 @@ class ImportQdrant(ImportVDB):
             help="Path to the local persist directory (default: None)",
             default=None,
         )
+        cls.add_upload_options(parser_qdrant)
         parser_qdrant.add_argument(
-            "--parallel",
-            type=int,
-            help="Number of parallel processes of upload (default: 5).",
-            default=5,
+            "--bulk",
+            type=bool,
+            help=(
+                "Upload float32 matrices with QdrantClient.upload_collection, using"
+                " --parallel client processes and no wait for each batch (default: False)"
+            ),
+            default=False,
+            action=argparse.BooleanOptionalAction,
         )
         parser_qdrant.add_argument(
-            "--max_retries",
-            type=int,
-            help="Maximum number of retries in case of a failure (default: 3).",
-            default=3,
+            "--bulk_load",
+            type=bool,
+            help=(
+                "Create the collection with indexing disabled and build the index"
+                " once all points are uploaded (default: False)"
+            ),
+            default=False,
+            action=argparse.BooleanOptionalAction,
         )
         parser_qdrant.add_argument(
             "--shard_key_selector",
@@ -129,6 +153,7 @@ class ImportQdrant(ImportVDB):
     def __init__(self, args):
         # call super class constructor
         super().__init__(args)
+        self.metadata_notices = set()
         url, api_key, prefer_grpc, path = (
             self.args.get("url", None),
             self.args.get("qdrant_api_key", None),
@@ -147,7 +172,6 @@ class ImportQdrant(ImportVDB):
         )
 
     def upsert_data(self):
-        max_hit = False
         self.total_imported_count = 0
         # we know that the self.vdf_meta["indexes"] is a list
         index_meta: Dict[str, List[NamespaceMeta]] = {}
@@ -175,6 +199,7 @@ class ImportQdrant(ImportVDB):
                 vector_column_names, _ = self.get_vector_column_name(
                     new_collection_name, namespace_meta, multi_vector_supported=True
                 )
+                deferred_indexing_threshold = None
                 if new_collection_name not in collections:
                     # create index
                     try:
@@ -225,6 +250,15 @@ class ImportQdrant(ImportVDB):
                             get_nested_config(index_config, [config], None)
                             for config in configs
                         ]
+                        if self.args.get("bulk_load"):
+                            # build the index once after the upload instead of
+                            # rebuilding segments while points stream in
+                            optimizers_config = dict(optimizers_config or {})
+                            deferred_indexing_threshold = (
+                                optimizers_config.get("indexing_threshold")
+                                or DEFAULT_INDEXING_THRESHOLD
+                            )
+                            optimizers_config["indexing_threshold"] = 0
                         distance = (
                             namespace_meta.get("metric", Distance.COSINE)
                             or Distance.COSINE
@@ -253,6 +287,13 @@ class ImportQdrant(ImportVDB):
                             f"Failed to create index '{new_collection_name}' {e}"
                         )
                         return
+                elif self.args.get("bulk_load"):
+                    # the threshold of a collection that may be serving
+                    # queries is left alone
+                    tqdm.write(
+                        f"Warning: collection '{new_collection_name}' already exists,"
+                        " --bulk_load only defers indexing of new collections"
+                    )
                 prev_vector_count = self.client.get_collection(
                     collection_name=new_collection_name
                 ).vectors_count
@@ -260,111 +301,41 @@ class ImportQdrant(ImportVDB):
                     tqdm.write(
                         f"Index '{new_collection_name}' has {prev_vector_count} vectors before import"
                     )
-                # Load the data from the parquet files
-                parquet_files = self.get_parquet_files(final_data_path)
-
-                vectors_all = {}
-                for vec_col in namespace_meta.get("vector_columns", []):
-                    vectors_all[vec_col] = {}
-                metadata = {}
-                for file in tqdm(parquet_files, desc="Iterating parquet files"):
-                    file_path = self.get_file_path(final_data_path, file)
-                    df = self.read_parquet_progress(
-                        file_path,
-                        max_num_rows=(
-                            (self.args.get("max_num_rows") or INT_MAX)
-                            - self.total_imported_count
-                        ),
+                # Stream the parquet files batch by batch to the collection
+                upload_finished = False
+                try:
+                    self.total_imported_count += self.import_files(
+                        final_data_path,
+                        "bulk_upload_file" if self.args.get("bulk") else "upsert_file",
+                        collection_name=new_collection_name,
+                        vector_column_names=vector_column_names,
                     )
-                    with Halo(text="Processing vectors", spinner="dots"):
-                        for vec_col in namespace_meta.get("vector_columns", []):
-                            self.update_vectors(vectors_all[vec_col], vec_col, df)
-                    with Halo(text="Processing metadata", spinner="dots"):
-                        self.update_metadata(metadata, vector_column_names, df)
-                    self.make_metadata_qdrant_compliant(metadata)
-                    # union of all keys in vectors_all
-                    keys = set().union(
-                        *[vectors_all[vec_col].keys() for vec_col in vectors_all.keys()]
+                    upload_finished = True
+                except (UnexpectedResponse, RpcError, ValueError) as e:
+                    upload_finished = True
+                    tqdm.write(
+                        f"Failed to upsert data for collection '{new_collection_name}', {e}"
                     )
-                    points = [
-                        PointStruct(
-                            id=get_qdrant_id_from_id(idx),
-                            vector={
-                                vec_col: vectors_all[vec_col].get(idx, [])
-                                for vec_col in vectors_all.keys()
-                            },
-                            payload=metadata.get(idx, {}),
+                finally:
+                    # never leave a --bulk_load collection unindexed, but only
+                    # wait for the index when the import goes on
+                    if deferred_indexing_threshold is not None:
+                        self.build_deferred_index(
+                            new_collection_name,
+                            deferred_indexing_threshold,
+                            wait=upload_finished,
                         )
-                        for idx in keys
-                    ]
-
-                    if self.total_imported_count + len(points) >= (
-                        self.args.get("max_num_rows") or INT_MAX
-                    ):
-                        max_hit = True
-                        points = points[
-                            : (self.args.get("max_num_rows") or INT_MAX)
-                            - self.total_imported_count
-                        ]
-                        tqdm.write("Truncating data to limit to max rows")
-                    try:
-                        BATCH_SIZE = self.args.get("batch_size", 64) or 64
-                        batches = list(divide_into_batches(points, BATCH_SIZE))
-                        total_points = len(points)
-
-                        num_parallel_threads = self.args.get("parallel", 5) or 5
-                        with concurrent.futures.ThreadPoolExecutor(
-                            max_workers=num_parallel_threads
-                        ) as executor, tqdm(
-                            total=total_points,
-                            desc=f"Uploading points in batches of {BATCH_SIZE} in {num_parallel_threads} threads",
-                        ) as pbar:
-                            # Create a future to batch mapping to update progress bar correctly after each batch completion
-                            future_to_batch = {
-                                executor.submit(
-                                    self.upsert_batch, batch, new_collection_name
-                                ): batch
-                                for batch in batches
-                            }
-
-                            for future in concurrent.futures.as_completed(
-                                future_to_batch
-                            ):
-                                batch = future_to_batch[future]
-                                try:
-                                    # Attempt to get the result, which will re-raise any exceptions
-                                    future.result()
-                                    # Update the progress bar by the size of the successfully processed batch
-                                    pbar.update(len(batch))
-                                except Exception as e:
-                                    tqdm.write(
-                                        f"Batch upsert failed with error: {e} "  # {batch}
-                                    )
-                                    # Optionally, you might want to handle failed batches differently
-                        self.total_imported_count += len(points)
-                        if self.total_imported_count >= (
-                            self.args.get("max_num_rows") or INT_MAX
-                        ):
-                            max_hit = True
-                    except (UnexpectedResponse, RpcError, ValueError) as e:
-                        tqdm.write(
-                            f"Failed to upsert data for collection '{new_collection_name}', {e}"
-                        )
-                        continue
-                    vector_count = self.client.get_collection(
-                        collection_name=new_collection_name
-                    ).vectors_count
-                    if max_hit:
-                        break
-                    # END parquet file loop
+                vector_count = self.client.get_collection(
+                    collection_name=new_collection_name
+                ).vectors_count
                 tqdm.write(
                     f"Index '{new_collection_name}' has {vector_count} vectors after import"
                 )
                 tqdm.write(f"{vector_count - prev_vector_count} vectors were imported")
-                if max_hit:
+                if self.max_rows_reached():
                     break
                 # END namespace loop
-            if max_hit:
+            if self.max_rows_reached():
                 tqdm.write(
                     f"Max rows to be imported {self.args['max_num_rows']} hit. Exiting"
                 )
@@ -373,19 +344,210 @@ class ImportQdrant(ImportVDB):
         tqdm.write("Data import completed successfully.")
         self.args["imported_count"] = self.total_imported_count
 
+    def build_deferred_index(self, collection_name, indexing_threshold, wait=True):
+        """
+        Restore the indexing threshold of a --bulk_load collection and, if wait
+        is set, wait until Qdrant has finished building its index
+        """
+        start_time = time.time()
+        self.client.update_collection(
+            collection_name=collection_name,
+            optimizers_config=OptimizersConfigDiff(
+                indexing_threshold=indexing_threshold
+            ),
+        )
+        if not wait:
+            tqdm.write(
+                f"Restored the indexing threshold of '{collection_name}', its index is built in the background"
+            )
+            return
+        with Halo(text=f"Building index of '{collection_name}'", spinner="dots"):
+            while True:
+                status = self.client.get_collection(collection_name).status
+                if status == CollectionStatus.GREEN:
+                    break
+                if status == CollectionStatus.RED:
+                    raise RuntimeError(
+                        f"Failed to build index of collection '{collection_name}'"
+                    )
+                time.sleep(1)
+        index_build_time = time.time() - start_time
+        self.args["index_build_time"] = index_build_time
+        tqdm.write(
+            f"Index of '{collection_name}' built in {index_build_time:.2f} seconds"
+        )
+
+    def upsert_file(
+        self, file_path, collection_name, vector_column_names, max_num_rows=None
+    ):
+        """
+        Upload the points of one parquet file, one record batch at a time
+        """
+        tracker = self.journal_tracker(collection_name, file_path)
+        points = tracker.track(
+            self.pipelined(
+                tracker.skip_done(
+                    self.iter_batches(file_path, max_num_rows=max_num_rows)
+                ),
+                transform=lambda record_batch: self.points_from_batch(
+                    record_batch, vector_column_names
+                ),
+            )
+        )
+        BATCH_SIZE = self.args.get("batch_size", 64) or 64
+        uploader = self.make_uploader(
+            lambda batch: self.upsert_batch(batch, collection_name),
+            BATCH_SIZE,
+            desc=f"Uploading points in batches of {BATCH_SIZE}",
+        )
+        num_uploaded = uploader.upload(points, on_acked=tracker.acked)
+        tracker.acked(uploader.acked_count)
+        return num_uploaded
+
+    def bulk_upload_file(
+        self, file_path, collection_name, vector_column_names, max_num_rows=None
+    ):
+        """
+        Upload one parquet file as column chunks of ids, float32 vector matrices
+        and payloads with a single QdrantClient.upload_collection call
+        """
+        BATCH_SIZE = self.args.get("batch_size", 64) or 64
+        parallel = self.args.get("parallel") or 1
+        # large enough chunks to keep all client processes busy
+        chunk_size = max(DEFAULT_BATCH_SIZE, BATCH_SIZE * parallel * 16)
+        tracker = self.journal_tracker(collection_name, file_path)
+        chunks = tracker.track(
+            self.pipelined(
+                tracker.skip_done(
+                    self.iter_batches(
+                        file_path, batch_size=chunk_size, max_num_rows=max_num_rows
+                    )
+                ),
+                transform=lambda record_batch: [
+                    self.columns_from_batch(record_batch, vector_column_names)
+                ],
+            )
+        )
+        # batches the client may hold before sending them: the one being filled,
+        # or with processes, their queue and the batch each process is sending
+        max_unsent = BATCH_SIZE * (
+            1 if parallel == 1 else parallel * (CLIENT_QUEUE_SIZE + 1) + 2
+        )
+        # one call for the whole file, so the client's processes start once;
+        # ids, vectors and payloads are consumed in lockstep, batch by batch
+        chunks_for_ids, chunks_for_vectors, chunks_for_payloads = itertools.tee(
+            chunks, 3
+        )
+        sent_chunks = deque()
+        num_uploaded = 0
+        pbar = tqdm(desc=f"Uploading points in batches of {BATCH_SIZE}")
+
+        def ids_with_progress():
+            nonlocal num_uploaded
+            for num_chunks, (ids, _, _) in enumerate(chunks_for_ids, 1):
+                for id in ids:
+                    # journal the chunks whose points all left the client
+                    while (
+                        sent_chunks and sent_chunks[0][0] + max_unsent <= num_uploaded
+                    ):
+                        tracker.acked(sent_chunks.popleft()[1])
+                    yield id
+                    num_uploaded += 1
+                sent_chunks.append((num_uploaded, num_chunks))
+                pbar.update(len(ids))
+
+        self.client.upload_collection(
+            collection_name=collection_name,
+            vectors=(
+                {vec_col: matrix[i].tolist() for vec_col, matrix in vectors.items()}
+                for ids, vectors, _ in chunks_for_vectors
+                for i in range(len(ids))
+            ),
+            payload=(
+                payload
+                for _, _, payloads in chunks_for_payloads
+                for payload in payloads
+            ),
+            ids=ids_with_progress(),
+            batch_size=BATCH_SIZE,
+            parallel=parallel,
+            max_retries=self.args.get("max_retries") or 3,
+            wait=False,
+            shard_key_selector=self.args.get("shard_key_selector", None),
+        )
+        # upload_collection returns once every batch was sent
+        if sent_chunks:
+            tracker.acked(sent_chunks[-1][1])
+        pbar.close()
+        return num_uploaded
+
+    def columns_from_batch(self, record_batch, vector_column_names):
+        """
+        Convert a record batch to (ids, {vector column: float32 matrix}, payloads),
+        keeping the rows that have all vectors
+        """
+        df = record_batch.to_pandas()
+        valid = np.ones(len(df), dtype=bool)
+        matrices = {}
+        for vec_col in vector_column_names:
+            if vec_col not in df.columns:
+                continue
+            matrices[vec_col] = self.extract_vectors(df[vec_col])
+            valid &= matrices[vec_col][1]
+        vectors = {
+            vec_col: matrix[valid[vec_valid]]
+            for vec_col, (matrix, vec_valid) in matrices.items()
+        }
+        df = df[valid]
+        ids = [get_qdrant_id_from_id(idx) for idx in df[self.id_column].tolist()]
+        payloads = list(metadata_payloads(df, vector_column_names))
+        self.make_metadata_qdrant_compliant(dict(enumerate(payloads)))
+        return ids, vectors, payloads
+
+    def points_from_batch(self, record_batch, vector_column_names):
+        df = record_batch.to_pandas()
+        vectors_all = {}
+        for vec_col in vector_column_names:
+            vectors_all[vec_col] = {}
+            self.update_vectors(vectors_all[vec_col], vec_col, df)
+        metadata = {}
+        self.update_metadata(metadata, vector_column_names, df)
+        self.make_metadata_qdrant_compliant(metadata)
+        # ids that have at least one vector, in file order
+        keys = [
+            idx
+            for idx in dict.fromkeys(df[self.id_column].tolist())
+            if any(idx in vectors for vectors in vectors_all.values())
+        ]
+        return [
+            PointStruct(
+                id=get_qdrant_id_from_id(idx),
+                vector={
+                    vec_col: vectors_all[vec_col].get(idx, [])
+                    for vec_col in vectors_all.keys()
+                },
+                payload=metadata.get(idx, {}),
+            )
+            for idx in keys
+        ]
+
     def make_metadata_qdrant_compliant(self, metadata):
         deleted_images = False
         parsed_json = False
+        zeroed_nan = False
         for k, v in metadata.items():
             deleted_images, parsed_json, zeroed_nan = self.normalize_dict(
                 metadata, k, v
             )
-        if deleted_images:
-            tqdm.write("Images were deleted from metadata")
-        if parsed_json:
-            tqdm.write("Metadata was parsed to JSON")
-        if zeroed_nan:
-            tqdm.write("NaN values were replaced with 0 in metadata")
+        # report each kind of change once, not for every batch
+        for changed, notice in (
+            (deleted_images, "Images were deleted from metadata"),
+            (parsed_json, "Metadata was parsed to JSON"),
+            (zeroed_nan, "NaN values were replaced with 0 in metadata"),
+        ):
+            if changed and notice not in self.metadata_notices:
+                self.metadata_notices.add(notice)
+                tqdm.write(notice)
 
     def replace_nan_with_zero(self, data, zeroed_nan=False):
         if isinstance(data, dict):
@@ -446,25 +608,11 @@ class ImportQdrant(ImportVDB):
         return deleted_images, parsed_json, zeroed_nan
 
     def upsert_batch(self, batch, new_collection_name):
-        RETRIES = self.args.get("max_retries", 3)
-        for attempt in range(RETRIES):
-            try:
-                self.client.upsert(
-                    collection_name=new_collection_name,
-                    points=batch,
-                    shard_key_selector=self.args.get("shard_key_selector", None),
-                    wait=True,
-                )
-                break  # Break the loop on success
-            except Exception:
-                if attempt == RETRIES - 1:
-                    raise  # Re-raise the last exception if all retries fail
-                else:
-                    continue
+        # retries are handled by the uploader
+        self.client.upsert(
+            collection_name=new_collection_name,
+            points=batch,
+            shard_key_selector=self.args.get("shard_key_selector", None),
+            wait=True,
+        )
         return len(batch)
-
-
-# Function to divide your points into batches
-def divide_into_batches(points, batch_size):
-    for i in range(0, len(points), batch_size):
-        yield points[i : i + batch_size]
@@ -3,14 +3,14 @@ from tqdm import tqdm
 
 import turbopuffer as tpuf
 
-from vdf_io.constants import DEFAULT_BATCH_SIZE, INT_MAX
+from vdf_io.constants import DEFAULT_BATCH_SIZE
 from vdf_io.import_vdf.vdf_import_cls import ImportVDB
 from vdf_io.meta_types import NamespaceMeta
 from vdf_io.names import DBNames
 from vdf_io.util import (
     clean_value,
     cleanup_df,
-    divide_into_batches,
+    metadata_payloads,
     set_arg_from_password,
 )
 
@@ -89,25 +89,17 @@ class ImportTurbopuffer(ImportVDB):
                     tqdm.write(f"Skipping the rest : {vector_column_names[1:]}")
                 for file in tqdm(parquet_files, desc="Iterating parquet files"):
                     file_path = self.get_file_path(final_data_path, file)
-                    df = self.read_parquet_progress(
-                        file_path,
-                        max_num_rows=(
-                            (self.args.get("max_num_rows") or INT_MAX)
-                            - self.total_imported_count
-                        ),
-                    )
-                    df = cleanup_df(df)
                     BATCH_SIZE = min(
                         self.args.get("batch_size") or DEFAULT_BATCH_SIZE, 10_000
                     )
 
                     # keeping track of updated keys
                     updated_keys = set()
-                    for batch in tqdm(
-                        divide_into_batches(df, BATCH_SIZE),
+                    for record_batch in tqdm(
+                        self.iter_batches(file_path, batch_size=BATCH_SIZE),
                         desc="Importing batches",
-                        total=len(df) // BATCH_SIZE,
                     ):
+                        batch = cleanup_df(record_batch.to_pandas())
                         # filter out rows with empty or None vector column
                         prev_count = len(batch)
                         batch = batch.dropna(subset=[vector_column_name])
@@ -117,9 +109,11 @@ class ImportTurbopuffer(ImportVDB):
                                 f"Skipped {prev_count - non_empty_count} rows with empty vector column"
                             )
                         # Attributes are key/value mappings. Keys are strings, and values can be strings, unsigned integers, or arrays of either.
-                        metadata = batch.drop(
-                            columns=[self.id_column] + vector_column_names
-                        ).to_dict(orient="records")
+                        metadata = list(
+                            metadata_payloads(
+                                batch, [self.id_column] + vector_column_names
+                            )
+                        )
                         for i in range(len(metadata)):
                             for key, val in metadata[i].items():
                                 if isinstance(val, list):
@@ -148,11 +142,15 @@ class ImportTurbopuffer(ImportVDB):
                             ns.upsert(
                                 data=[
                                     {
-                                        "id": row[self.id_column],
-                                        "vector": row[vector_column_name],
-                                        "attributes": metadata[idx],
+                                        "id": idx,
+                                        "vector": vector,
+                                        "attributes": attributes,
                                     }
-                                    for idx, row in batch.iterrows()
+                                    for idx, vector, attributes in zip(
+                                        batch[self.id_column].tolist(),
+                                        batch[vector_column_name].tolist(),
+                                        metadata,
+                                    )
                                 ],
                             )
                         except Exception as e:
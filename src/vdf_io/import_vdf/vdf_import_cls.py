@@ -1,8 +1,16 @@
 import ast
+import bisect
+from collections import defaultdict, deque
+import concurrent.futures
 import datetime
-from functools import lru_cache
+from functools import lru_cache, partial
+from itertools import islice
 import json
+import multiprocessing
 import os
+import random
+import threading
+import time
 import numpy as np
 from packaging.version import Version
 import abc
@@ -12,18 +20,57 @@ from halo import Halo
 from qdrant_client.http.models import Distance
 
 import vdf_io
-from vdf_io.constants import ID_COLUMN
+from vdf_io.constants import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_PREFETCH,
+    ID_COLUMN,
+    IMPORT_JOURNAL_FILE,
+    INT_MAX,
+)
 from vdf_io.meta_types import NamespaceMeta, VDFMeta
 from vdf_io.util import (
     expand_shorthand_path,
     extract_data_hash,
     get_final_data_path,
     get_parquet_files,
-    read_parquet_progress,
+    iter_parquet_batches,
+    metadata_payloads,
+    prefetch,
+    resolve_parquet_file_path,
+    vector_column_to_numpy,
+)
+
+DEFAULT_PARALLEL = 5
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_WORKERS = 1
+WORKER_MODES = ("thread", "process")
+# errors that only go away with a smaller batch
+SIZE_ERROR_MARKERS = (
+    "413",
+    "too large",
+    "too big",
+    "message larger than max",
+    "larger than allowed",
+    "maximum supported size",
+    "smaller batch",
+)
+# errors of a throttled client, retried with backoff more often than others
+THROTTLING_ERROR_MARKERS = (
+    "429",
+    "rate limit",
+    "too many requests",
+    "throttl",
+    "quota",
 )
+MAX_THROTTLED_RETRIES = 10
+# without a max_batch_size, batches grow up to this multiple of batch_size
+MAX_BATCH_GROWTH = 4
 
 
 class ImportVDB(abc.ABC):
+    # importers that stream their files through import_files/import_namespaces
+    SUPPORTS_WORKERS = False
+
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
         if not hasattr(cls, "DB_NAME_SLUG"):
@@ -37,6 +84,14 @@ class ImportVDB(abc.ABC):
         self.hash_value = extract_data_hash(args)
         self.temp_file_paths = []
         self.abnormal_vector_format = False
+        self.num_rows_read = 0
+        self.journal = None
+        num_workers = self.args.get("workers") or DEFAULT_WORKERS
+        if num_workers > 1 and not self.SUPPORTS_WORKERS:
+            tqdm.write(
+                f"Warning: --workers is not supported for {self.DB_NAME_SLUG}, importing with a single worker"
+            )
+            self.args["workers"] = DEFAULT_WORKERS
         if self.args.get("hf_dataset", None) is None:
             self.args["dir"] = expand_shorthand_path(self.args["dir"])
             if not os.path.isdir(self.args["dir"]):
@@ -107,6 +162,68 @@ class ImportVDB(abc.ABC):
             )
         print("ImportVDB initialized successfully.")
 
+    @staticmethod
+    def add_upload_options(parser, default_parallel=DEFAULT_PARALLEL):
+        parser.add_argument(
+            "--parallel",
+            type=int,
+            help=f"Number of batches uploaded concurrently (default: {default_parallel}).",
+            default=default_parallel,
+        )
+        parser.add_argument(
+            "--max_retries",
+            type=int,
+            help=f"Maximum number of retries in case of a failure (default: {DEFAULT_MAX_RETRIES}).",
+            default=DEFAULT_MAX_RETRIES,
+        )
+        parser.add_argument(
+            "--prefetch",
+            type=int,
+            help=f"Number of batches read and transformed ahead of the upload (default: {DEFAULT_PREFETCH}).",
+            default=DEFAULT_PREFETCH,
+        )
+
+    def open_journal(self):
+        """
+        Open the --resume journal, kept in the VDF directory (or in the working
+        directory for HuggingFace datasets)
+        """
+        if not self.args.get("resume"):
+            return None
+        if self.journal is None:
+            journal_dir = (
+                self.args["cwd"] if self.args.get("hf_dataset") else self.args["dir"]
+            )
+            self.journal = ImportJournal(os.path.join(journal_dir, IMPORT_JOURNAL_FILE))
+            if self.journal.num_ranges:
+                tqdm.write(
+                    f"Resuming import: {self.journal.num_ranges} imported batch ranges found in {self.journal.path}"
+                )
+        return self.journal
+
+    def journal_tracker(self, target, file_path):
+        """
+        Track which batches of file_path were acknowledged by target (e.g. an
+        index or collection name). Without --resume nothing is skipped or written.
+        """
+        if self.args.get("hf_dataset") or file_path.startswith("hf://"):
+            file_key = file_path
+        else:
+            file_key = os.path.relpath(file_path, self.args["dir"])
+        return JournalTracker(
+            self.open_journal(), f"{self.DB_NAME_SLUG}/{target}", file_key
+        )
+
+    def make_uploader(self, send_batch, batch_size, **kwargs):
+        """
+        Create a BatchUploader configured from --parallel and --max_retries
+        """
+        kwargs.setdefault("max_workers", self.args.get("parallel") or DEFAULT_PARALLEL)
+        kwargs.setdefault(
+            "max_retries", self.args.get("max_retries") or DEFAULT_MAX_RETRIES
+        )
+        return BatchUploader(send_batch, batch_size, **kwargs)
+
     @abc.abstractmethod
     def upsert_data():
         """
@@ -170,14 +287,15 @@ class ImportVDB(abc.ABC):
         found = False
         for file in tqdm(parquet_files, desc="Iterating parquet files"):
             file_path = self.get_file_path(final_data_path, file)
-            df = self.read_parquet_progress(file_path, columns=[vector_column_name])
-            i = 0
-            while i < len(df[vector_column_name]):
-                first_el = df[vector_column_name].iloc[i]
-                tqdm.write(f"First element: {first_el}")
-                if first_el is None:
-                    i += 1
+            # read only until the first non-null vector
+            for batch in iter_parquet_batches(
+                file_path, self.id_column, columns=[vector_column_name]
+            ):
+                vector_column = batch.column(vector_column_name).drop_null()
+                if len(vector_column) == 0:
                     continue
+                first_el = vector_column[0].as_py()
+                tqdm.write(f"First element: {first_el}")
                 dims = len(self.extract_vector(first_el))
                 tqdm.write(f"Dimensions: {dims}")
                 found = True
@@ -211,28 +329,180 @@ class ImportVDB(abc.ABC):
             ret_v = [float(x) for x in ret_v]
         return ret_v
 
+    def extract_vectors(self, column, dims=None):
+        """
+        Column-level counterpart of extract_vector.
+
+        Returns a (num_valid_rows, dims) float32 matrix and a boolean mask of the
+        input rows that hold a well-formed vector.
+        """
+        matrix, valid, abnormal_format = vector_column_to_numpy(column, dims)
+        if abnormal_format:
+            self.abnormal_vector_format = True
+        num_invalid = len(valid) - int(valid.sum())
+        if num_invalid > 0:
+            tqdm.write(
+                f"Warning: Skipping {num_invalid} rows with missing or malformed vectors"
+            )
+        return matrix, valid
+
     def update_metadata(self, metadata, vector_column_names, df):
+        if self.id_column not in df.columns:
+            return
         metadata.update(
-            {
-                row[self.id_column]: {
-                    key: value
-                    for key, value in row.items()
-                    if key not in vector_column_names
-                }
-                for _, row in df.iterrows()
-                if self.id_column in row
-            }
+            zip(
+                df[self.id_column].tolist(),
+                metadata_payloads(df, vector_column_names),
+            )
         )
 
     def update_vectors(self, vectors, vector_column_name, df):
-        for _, row in tqdm(df.iterrows(), desc="Extracting vectors", total=len(df)):
-            if self.id_column in row:
-                vectors[row[self.id_column]] = self.extract_vector(
-                    row[vector_column_name]
+        if self.id_column not in df.columns or vector_column_name not in df.columns:
+            return
+        matrix, valid = self.extract_vectors(df[vector_column_name])
+        vectors.update(zip(df[self.id_column][valid].tolist(), matrix.tolist()))
+
+    def max_rows_reached(self):
+        return self.num_rows_read >= (self.args.get("max_num_rows") or INT_MAX)
+
+    def iter_batches(
+        self,
+        file_path,
+        columns=None,
+        batch_size=DEFAULT_BATCH_SIZE,
+        max_num_rows=None,
+    ):
+        """
+        Yield bounded pyarrow RecordBatches from a parquet file.
+
+        --max_num_rows is enforced here across all files read by this importer,
+        unless the caller passes the row budget of this file as max_num_rows.
+        """
+        if max_num_rows is None:
+            max_num_rows = (
+                self.args.get("max_num_rows") or INT_MAX
+            ) - self.num_rows_read
+        for batch in iter_parquet_batches(
+            file_path,
+            self.id_column,
+            columns=columns,
+            batch_size=batch_size,
+            max_num_rows=max_num_rows,
+        ):
+            self.num_rows_read += batch.num_rows
+            yield batch
+
+    def pipelined(self, batches, transform=None):
+        """
+        Read batches (and apply transform to them) ahead of the consumer
+        """
+        depth = self.args.get("prefetch") or DEFAULT_PREFETCH
+        batches = prefetch(batches, depth)
+        if transform is None:
+            return batches
+        return prefetch(map(transform, batches), depth)
+
+    def file_row_budgets(self, final_data_path, num_rows_claimed=0):
+        """
+        Pair every parquet file of a namespace with the number of rows that may
+        be imported from it, so that --max_num_rows holds however the files are
+        spread over workers. Files past the limit are left out.
+
+        num_rows_claimed rows of the limit are already budgeted to other files.
+        """
+        from pyarrow import parquet as pq
+
+        file_paths = [
+            self.get_file_path(final_data_path, file)
+            for file in self.get_parquet_files(final_data_path)
+        ]
+        max_num_rows = self.args.get("max_num_rows")
+        if not max_num_rows:
+            return [(file_path, None) for file_path in file_paths]
+        budgets = []
+        remaining = max_num_rows - self.num_rows_read - num_rows_claimed
+        for file_path in file_paths:
+            if remaining <= 0:
+                break
+            num_rows = pq.read_metadata(resolve_parquet_file_path(file_path)).num_rows
+            budgets.append((file_path, min(num_rows, remaining)))
+            remaining -= budgets[-1][1]
+        return budgets
+
+    def import_files(self, final_data_path, method_name, **kwargs):
+        """
+        Import all parquet files of a namespace with the importer method
+        method_name(file_path, max_num_rows=..., **kwargs), which returns the
+        number of rows it imported. Returns the total.
+
+        With --workers N the files are handed out one by one, largest first,
+        from a shared queue: a worker takes the next file as soon as it is done
+        with its current one, which balances files of skewed sizes. In process
+        mode every worker builds its own importer (and DB client) from
+        self.args, so kwargs have to be picklable.
+        """
+        return self.import_namespaces([(final_data_path, kwargs)], method_name)
+
+    def import_namespaces(self, namespaces, method_name):
+        """
+        Like import_files, for a list of (final_data_path, kwargs) namespaces
+        whose files share the --workers, so that namespaces are imported in
+        parallel.
+        """
+        budgets = []
+        num_rows_claimed = 0
+        for final_data_path, kwargs in namespaces:
+            for file_path, max_num_rows in self.file_row_budgets(
+                final_data_path, num_rows_claimed
+            ):
+                budgets.append((file_path, max_num_rows, kwargs))
+                num_rows_claimed += max_num_rows or 0
+        num_workers = min(self.args.get("workers") or DEFAULT_WORKERS, len(budgets))
+        imported_count = 0
+        if num_workers <= 1:
+            for file_path, max_num_rows, kwargs in tqdm(
+                budgets, desc="Iterating parquet files"
+            ):
+                imported_count += getattr(self, method_name)(
+                    file_path, max_num_rows=max_num_rows, **kwargs
                 )
+            return imported_count
 
-    def read_parquet_progress(self, file_path, **kwargs):
-        return read_parquet_progress(file_path, self.id_column, **kwargs)
+        budgets.sort(key=lambda budget: file_size(budget[0]), reverse=True)
+        worker_mode = self.args.get("worker_mode") or "process"
+        if worker_mode == "process":
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_import_worker,
+                initargs=(type(self), self.args),
+            )
+            run_task = run_import_worker_task
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=num_workers)
+            run_task = partial(run_import_task, self)
+        tqdm.write(
+            f"Importing {len(budgets)} files with {num_workers} {worker_mode} workers"
+        )
+        try:
+            futures = [
+                executor.submit(run_task, method_name, file_path, max_num_rows, kwargs)
+                for file_path, max_num_rows, kwargs in budgets
+            ]
+            with tqdm(total=len(futures), desc="Importing parquet files") as pbar:
+                for future in concurrent.futures.as_completed(futures):
+                    file_path, num_rows_read, file_imported_count = future.result()
+                    if worker_mode == "process":
+                        # thread workers count the rows read on self directly
+                        self.num_rows_read += num_rows_read
+                    imported_count += file_imported_count
+                    pbar.update(1)
+                    pbar.set_postfix(imported=imported_count)
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+        return imported_count
 
     def create_new_name(self, index_name, indexes, delimiter="-"):
         if not self.args.get("create_new", False):
@@ -266,3 +536,310 @@ class ImportVDB(abc.ABC):
         for temp_file_path in self.temp_file_paths:
             if os.path.isfile(temp_file_path):
                 os.remove(temp_file_path)
+
+
+def file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def run_import_task(importer, method_name, file_path, max_num_rows, kwargs):
+    """
+    Import one parquet file and report (file_path, rows read, rows imported)
+    """
+    num_rows_read = importer.num_rows_read
+    imported_count = getattr(importer, method_name)(
+        file_path, max_num_rows=max_num_rows, **kwargs
+    )
+    return file_path, importer.num_rows_read - num_rows_read, imported_count
+
+
+# importer owned by the current worker process of ImportVDB.import_files
+worker_importer = None
+
+
+def init_import_worker(importer_cls, args):
+    global worker_importer
+    worker_importer = importer_cls(dict(args, workers=1))
+
+
+def run_import_worker_task(method_name, file_path, max_num_rows, kwargs):
+    return run_import_task(
+        worker_importer, method_name, file_path, max_num_rows, kwargs
+    )
+
+
+class ImportJournal:
+    """
+    Append-only log of the row ranges of parquet files that a target has
+    acknowledged, one JSON object per line, so that an interrupted import can
+    skip them when it is restarted with --resume.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # (target, file) -> sorted, disjoint [start, end) row ranges
+        self.ranges = defaultdict(list)
+        self.num_ranges = 0
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.add_range(
+                            entry["target"], entry["file"], entry["start"], entry["end"]
+                        )
+                    except (ValueError, KeyError):
+                        # last line of a journal cut short by a crash
+                        continue
+
+    def add_range(self, target, file_key, start, end):
+        ranges = self.ranges[(target, file_key)]
+        i = bisect.bisect_left(ranges, [start, end])
+        ranges.insert(i, [start, end])
+        # merge with overlapping or adjacent neighbours
+        merged = []
+        for r in ranges[max(0, i - 1) : i + 2]:
+            if merged and r[0] <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], r[1])
+            else:
+                merged.append(r)
+        ranges[max(0, i - 1) : i + 2] = merged
+        self.num_ranges += 1
+
+    def covers(self, target, file_key, start, end):
+        ranges = self.ranges.get((target, file_key))
+        if not ranges:
+            return False
+        i = bisect.bisect_right(ranges, [start, INT_MAX]) - 1
+        return i >= 0 and ranges[i][0] <= start and end <= ranges[i][1]
+
+    def record(self, target, file_key, start, end):
+        line = json.dumps(
+            {"target": target, "file": file_key, "start": start, "end": end}
+        )
+        with self.lock:
+            self.add_range(target, file_key, start, end)
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+class JournalTracker:
+    """
+    Connects the record batches of one parquet file to the --resume journal.
+
+    skip_done() drops the batches imported by an earlier run and remembers the
+    row range of every other batch. track() takes the items produced from those
+    batches, in the same order and as one list per batch, and passed as the
+    on_acked callback of BatchUploader.upload, acked() journals a batch once
+    all its items (and all items before them) have been acknowledged.
+    """
+
+    def __init__(self, journal, target, file_key):
+        self.journal = journal
+        self.target = target
+        self.file_key = file_key
+        self.pending_ranges = deque()
+        self.boundaries = deque()
+        self.num_items = 0
+        self.num_skipped = 0
+
+    def skip_done(self, batches):
+        start = 0
+        for batch in batches:
+            end = start + batch.num_rows
+            if self.covers(start, end):
+                self.num_skipped += batch.num_rows
+            else:
+                self.pending_ranges.append((start, end))
+                yield batch
+            start = end
+
+    def track(self, item_lists):
+        for items in item_lists:
+            start, end = self.pending_ranges.popleft()
+            self.num_items += len(items)
+            self.boundaries.append((self.num_items, start, end))
+            yield from items
+
+    def acked(self, num_acked_items):
+        while self.boundaries and self.boundaries[0][0] <= num_acked_items:
+            _, start, end = self.boundaries.popleft()
+            self.record(start, end)
+
+    def covers(self, start, end):
+        return self.journal is not None and self.journal.covers(
+            self.target, self.file_key, start, end
+        )
+
+    def record(self, start, end):
+        if self.journal is not None:
+            self.journal.record(self.target, self.file_key, start, end)
+
+
+def is_size_error(e):
+    """
+    Whether an upload error is caused by the batch being too big
+    """
+    message = str(e).lower()
+    return any(marker in message for marker in SIZE_ERROR_MARKERS)
+
+
+def is_throttling_error(e):
+    """
+    Whether an upload error is caused by rate limits or quotas
+    """
+    message = str(e).lower()
+    return any(marker in message for marker in THROTTLING_ERROR_MARKERS)
+
+
+class BatchUploader:
+    """
+    Upload engine shared by the importers.
+
+    Items are grouped into batches and handed to send_batch(batch) on a thread
+    pool, with at most max_in_flight batches pending. send_batch returns the
+    number of items written (None means all of them).
+
+    The batch size is adapted AIMD-style: it grows by a fixed step after every
+    successful batch, up to max_batch_size (MAX_BATCH_GROWTH times batch_size by
+    default), and is cut to 2/3 when a batch fails with a size error, in which
+    case the batch is split and re-queued. Other errors are retried with
+    jittered exponential backoff, throttling errors up to MAX_THROTTLED_RETRIES
+    times, and logged once retries run out.
+
+    acked_count is the number of leading items that were all written; it stops
+    at the first batch that failed for good.
+    """
+
+    def __init__(
+        self,
+        send_batch,
+        batch_size,
+        max_workers=DEFAULT_PARALLEL,
+        max_in_flight=None,
+        min_batch_size=1,
+        max_batch_size=None,
+        max_retries=DEFAULT_MAX_RETRIES,
+        backoff_base=0.5,
+        backoff_max=30.0,
+        size_error=is_size_error,
+        desc="Uploading batches",
+    ):
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.max_workers = max(1, max_workers)
+        self.max_in_flight = max_in_flight or 2 * self.max_workers
+        self.min_batch_size = max(1, min_batch_size)
+        self.max_batch_size = max_batch_size or batch_size * MAX_BATCH_GROWTH
+        self.batch_size_step = max(1, batch_size // 10)
+        self.max_retries = max(1, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.size_error = size_error
+        self.desc = desc
+        self.uploaded_count = 0
+        self.failed_count = 0
+        self.num_items = 0
+        self.acked_count = 0
+        self.acked_ranges = {}
+
+    def send_with_retries(self, batch):
+        attempt = 0
+        throttled = 0
+        while True:
+            try:
+                sent = self.send_batch(batch)
+                return len(batch) if sent is None else sent
+            except Exception as e:
+                if self.size_error(e) and len(batch) > self.min_batch_size:
+                    # resized by the caller instead of retried as is
+                    raise
+                if is_throttling_error(e) and throttled < MAX_THROTTLED_RETRIES:
+                    throttled += 1
+                    delay = self.backoff_base * 2**throttled
+                else:
+                    attempt += 1
+                    if attempt == self.max_retries:
+                        raise
+                    delay = self.backoff_base * 2 ** (attempt - 1)
+                time.sleep(random.uniform(0, min(self.backoff_max, delay)))
+
+    def next_batch(self, items, retry_queue):
+        """
+        Return the next batch and the position of its first item in items
+        """
+        if retry_queue:
+            return retry_queue.popleft()
+        batch = list(islice(items, self.batch_size))
+        self.num_items += len(batch)
+        return self.num_items - len(batch), batch
+
+    def upload(self, items, total=None, on_acked=None):
+        """
+        Upload all items and return the number of items written.
+
+        on_acked(acked_count) is called whenever acked_count moves forward.
+        """
+        items = iter(items)
+        retry_queue = deque()
+        in_flight = {}
+        exhausted = False
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers
+        ) as executor, tqdm(total=total, desc=self.desc) as pbar:
+            try:
+                while True:
+                    while len(in_flight) < self.max_in_flight and (
+                        retry_queue or not exhausted
+                    ):
+                        start, batch = self.next_batch(items, retry_queue)
+                        if not batch:
+                            exhausted = True
+                            break
+                        future = executor.submit(self.send_with_retries, batch)
+                        in_flight[future] = start, batch
+                    if not in_flight:
+                        break
+                    done, _ = concurrent.futures.wait(
+                        in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    acked_count = self.acked_count
+                    for future in done:
+                        start, batch = in_flight.pop(future)
+                        self.handle_result(future, start, batch, retry_queue, pbar)
+                    if on_acked is not None and self.acked_count > acked_count:
+                        on_acked(self.acked_count)
+            except BaseException:
+                for future in in_flight:
+                    future.cancel()
+                raise
+        return self.uploaded_count
+
+    def handle_result(self, future, start, batch, retry_queue, pbar):
+        try:
+            sent = future.result()
+        except Exception as e:
+            if self.size_error(e) and len(batch) > self.min_batch_size:
+                self.batch_size = max(self.min_batch_size, self.batch_size * 2 // 3)
+                tqdm.write(f"Error: {e}. Reducing batch size to {self.batch_size}")
+                half = len(batch) // 2
+                retry_queue.append((start, batch[:half]))
+                retry_queue.append((start + half, batch[half:]))
+                return
+            tqdm.write(f"Batch upsert failed with error: {e}")
+            self.failed_count += len(batch)
+            return
+        self.uploaded_count += sent
+        self.acked_ranges[start] = start + len(batch)
+        while self.acked_count in self.acked_ranges:
+            self.acked_count = self.acked_ranges.pop(self.acked_count)
+        pbar.update(len(batch))
+        self.batch_size = min(
+            self.max_batch_size, self.batch_size + self.batch_size_step
+        )
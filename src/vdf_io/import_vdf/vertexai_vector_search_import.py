@@ -28,7 +28,7 @@ import google.api_core.exceptions as google_exceptions
 
 from vdf_io.names import DBNames
 from vdf_io.import_vdf.vdf_import_cls import ImportVDB
-from vdf_io.util import read_parquet_progress, set_arg_from_input
+from vdf_io.util import iter_parquet_batches, set_arg_from_input
 from vdf_io.constants import ID_COLUMN, INT_MAX
 
 
@@ -901,117 +901,137 @@ class ImportVertexAIVectorSearch(ImportVDB):
                 total_ids = []
                 for file in tqdm(parquet_files, desc="Iterating over parquet files"):
                     file_path = self.get_file_path(final_data_path, file)
-                    df = read_parquet_progress(file_path, self.id_column)
-                    df[ID_COLUMN] = df[ID_COLUMN].apply(lambda x: str(x))
+                    tracker = self.journal_tracker(new_index_name, file_path)
+                    batch_start = 0
+                    num_rows = 0
 
                     insert_datapoints_payload = []
 
-                    for idx, row in tqdm(
-                        df.iterrows(), desc="Iterating over rows", total=len(df)
-                    ):
-                        row = json.loads(row.to_json())
+                    for record_batch in iter_parquet_batches(file_path, self.id_column):
+                        df = record_batch.to_pandas()
+                        df[ID_COLUMN] = df[ID_COLUMN].apply(lambda x: str(x))
+                        # index rows by their position in the file for the journal
+                        df.index += num_rows
+                        num_rows += len(df)
+                        for idx, row in tqdm(
+                            df.iterrows(), desc="Iterating over rows", total=len(df)
+                        ):
+                            if tracker.covers(idx, idx + 1):
+                                # imported by an earlier run
+                                continue
+                            row = json.loads(row.to_json())
+
+                            total_ids.append(row[ID_COLUMN])
+                            row[vector_column_name] = self.extract_vector(
+                                row[vector_column_name]
+                            )
+                            numeric_restrict_entry_list = []
+                            restrict_entry_list = []
+                            allow_values = []
+                            deny_values = []
+                            crowding_tag_val = None
 
-                        total_ids.append(row[ID_COLUMN])
-                        row[vector_column_name] = self.extract_vector(
-                            row[vector_column_name]
-                        )
-                        numeric_restrict_entry_list = []
-                        restrict_entry_list = []
-                        allow_values = []
-                        deny_values = []
-                        crowding_tag_val = None
-
-                        # if idx == 10:
-                        #     # sanity check
-                        #     print(f"row['id'] : {row['id']}")
-
-                        if self.list_restrict_entries:
-                            for entry in self.list_restrict_entries:
-                                restrict_entry = {}
-
-                                restrict_entry["namespace"] = entry.get("namespace")
-
-                                if entry.get("allow_list"):
-                                    for col in entry.get("allow_list"):
-                                        allow_values.append(row[col])
-                                        restrict_entry["allow_list"] = [
-                                            str(a) for a in allow_values
-                                        ]
-
-                                if entry.get("deny_list"):
-                                    for col in entry.get("deny_list"):
-                                        deny_values.append(row[col])
-                                        restrict_entry["deny_list"] = [
-                                            str(d) for d in deny_values
-                                        ]
-
-                                restrict_entry_list.append(restrict_entry)
+                            # if idx == 10:
+                            #     # sanity check
+                            #     print(f"row['id'] : {row['id']}")
+
+                            if self.list_restrict_entries:
+                                for entry in self.list_restrict_entries:
+                                    restrict_entry = {}
+
+                                    restrict_entry["namespace"] = entry.get("namespace")
+
+                                    if entry.get("allow_list"):
+                                        for col in entry.get("allow_list"):
+                                            allow_values.append(row[col])
+                                            restrict_entry["allow_list"] = [
+                                                str(a) for a in allow_values
+                                            ]
+
+                                    if entry.get("deny_list"):
+                                        for col in entry.get("deny_list"):
+                                            deny_values.append(row[col])
+                                            restrict_entry["deny_list"] = [
+                                                str(d) for d in deny_values
+                                            ]
+
+                                    restrict_entry_list.append(restrict_entry)
+
+                                    # if idx == 10:
+                                    #     print(f"restrict_entry_list : {restrict_entry_list}")
+
+                            if self.list_of_numeric_entries:
+                                # numeric_restrict_entry_list = []
+                                for entry in self.list_of_numeric_entries:
+                                    numeric_restrict_entry = {}
+
+                                    data_type = entry.get("data_type")
+                                    col_name = entry.get("namespace")
+                                    numeric_restrict_entry["namespace"] = entry.get(
+                                        "namespace"
+                                    )
+                                    numeric_restrict_entry[data_type] = row[col_name]
+                                    numeric_restrict_entry_list.append(
+                                        numeric_restrict_entry
+                                    )
 
                                 # if idx == 10:
-                                #     print(f"restrict_entry_list : {restrict_entry_list}")
+                                #     # sanity check
+                                #     print(f"numeric_restrict_entry_list : {numeric_restrict_entry_list}")
 
-                        if self.list_of_numeric_entries:
-                            # numeric_restrict_entry_list = []
-                            for entry in self.list_of_numeric_entries:
-                                numeric_restrict_entry = {}
+                            if self.args["crowding_tag"]:
+                                crowding_tag_col = self.args["crowding_tag"]
+                                crowding_tag_val = str(row[crowding_tag_col])
 
-                                data_type = entry.get("data_type")
-                                col_name = entry.get("namespace")
-                                numeric_restrict_entry["namespace"] = entry.get(
-                                    "namespace"
-                                )
-                                numeric_restrict_entry[data_type] = row[col_name]
-                                numeric_restrict_entry_list.append(
-                                    numeric_restrict_entry
+                                # if idx == 10:
+                                #     # sanity check
+                                #     print(f"crowding_tag_col : {crowding_tag_col}")
+                                #     print(f"crowding_tag_val : {crowding_tag_val}")
+
+                            insert_datapoints_payload.append(
+                                aipv1.IndexDatapoint(
+                                    datapoint_id=row[ID_COLUMN],
+                                    feature_vector=row[vector_column_name],
+                                    restricts=restrict_entry_list,
+                                    numeric_restricts=numeric_restrict_entry_list,
+                                    crowding_tag=aipv1.IndexDatapoint.CrowdingTag(
+                                        crowding_attribute=crowding_tag_val
+                                    ),
                                 )
-
-                            # if idx == 10:
-                            #     # sanity check
-                            #     print(f"numeric_restrict_entry_list : {numeric_restrict_entry_list}")
-
-                        if self.args["crowding_tag"]:
-                            crowding_tag_col = self.args["crowding_tag"]
-                            crowding_tag_val = str(row[crowding_tag_col])
-
-                            # if idx == 10:
-                            #     # sanity check
-                            #     print(f"crowding_tag_col : {crowding_tag_col}")
-                            #     print(f"crowding_tag_val : {crowding_tag_val}")
-
-                        insert_datapoints_payload.append(
-                            aipv1.IndexDatapoint(
-                                datapoint_id=row[ID_COLUMN],
-                                feature_vector=row[vector_column_name],
-                                restricts=restrict_entry_list,
-                                numeric_restricts=numeric_restrict_entry_list,
-                                crowding_tag=aipv1.IndexDatapoint.CrowdingTag(
-                                    crowding_attribute=crowding_tag_val
-                                ),
                             )
-                        )
 
-                        if idx % self.batch_size == 0:
-                            upsert_request = aipv1.UpsertDatapointsRequest(
-                                index=self.target_vertexai_index.resource_name,
-                                datapoints=insert_datapoints_payload,
-                            )
-                            if self.total_imported_count + len(
-                                upsert_request.datapoints
-                            ) >= (self.args.get("max_num_rows") or INT_MAX):
+                            if idx % self.batch_size == 0:
                                 upsert_request = aipv1.UpsertDatapointsRequest(
                                     index=self.target_vertexai_index.resource_name,
-                                    datapoints=insert_datapoints_payload[
-                                        : (
-                                            (self.args.get("max_num_rows") or INT_MAX)
-                                            - self.total_imported_count
-                                        )
-                                    ],
+                                    datapoints=insert_datapoints_payload,
+                                )
+                                if self.total_imported_count + len(
+                                    upsert_request.datapoints
+                                ) >= (self.args.get("max_num_rows") or INT_MAX):
+                                    upsert_request = aipv1.UpsertDatapointsRequest(
+                                        index=self.target_vertexai_index.resource_name,
+                                        datapoints=insert_datapoints_payload[
+                                            : (
+                                                (
+                                                    self.args.get("max_num_rows")
+                                                    or INT_MAX
+                                                )
+                                                - self.total_imported_count
+                                            )
+                                        ],
+                                    )
+                                    max_hit = True
+                                # self.index_client.upsert_datapoints(request=upsert_request)
+                                upsert_in_rate(self, upsert_request=upsert_request)
+                                self.total_imported_count += len(
+                                    upsert_request.datapoints
                                 )
-                                max_hit = True
-                            # self.index_client.upsert_datapoints(request=upsert_request)
-                            upsert_in_rate(self, upsert_request=upsert_request)
-                            self.total_imported_count += len(upsert_request.datapoints)
-                            insert_datapoints_payload = []
+                                if not max_hit:
+                                    tracker.record(batch_start, idx + 1)
+                                    batch_start = idx + 1
+                                insert_datapoints_payload = []
+                                if max_hit:
+                                    break
                             if max_hit:
                                 break
                         if max_hit:
@@ -1038,6 +1058,8 @@ class ImportVertexAIVectorSearch(ImportVDB):
                         # self.index_client.upsert_datapoints(request=upsert_request)
                         upsert_in_rate(self, upsert_request=upsert_request)
                         self.total_imported_count += len(upsert_request.datapoints)
+                        if not max_hit:
+                            tracker.record(batch_start, num_rows)
                     if max_hit:
                         tqdm.write(
                             f"Max rows to be imported {self.args['max_num_rows']} hit. Exiting"
@@ -19,7 +19,7 @@ import vdf_io
 from vdf_io.constants import ID_COLUMN
 from vdf_io.scripts.check_for_updates import check_for_updates
 from vdf_io.util import set_arg_from_input
-from vdf_io.import_vdf.vdf_import_cls import ImportVDB
+from vdf_io.import_vdf.vdf_import_cls import DEFAULT_WORKERS, WORKER_MODES, ImportVDB
 
 
 load_dotenv(find_dotenv(), override=True)
@@ -208,6 +208,33 @@ def make_common_options(parser):
         type=int,
         help="Batch size for import (default: based on DB)",
     )
+    parser.add_argument(
+        "--resume",
+        type=bool,
+        help=(
+            "Journal the batches acknowledged by the target in the VDF directory"
+            " and skip the ones already imported by an earlier run (default: False)"
+        ),
+        default=False,
+        action=argparse.BooleanOptionalAction,
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help=(
+            "Number of workers importing parquet files concurrently,"
+            " supported for Milvus, Pinecone and Qdrant (default: 1)"
+        ),
+        default=DEFAULT_WORKERS,
+    )
+    parser.add_argument(
+        "--worker_mode",
+        "--worker-mode",
+        type=str,
+        choices=WORKER_MODES,
+        help="Run the --workers as threads or as processes, each with its own DB client (default: 'process')",
+        default="process",
+    )
 
 
 if __name__ == "__main__":
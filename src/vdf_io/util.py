@@ -1,9 +1,12 @@
+import ast
 from pathlib import Path
 from collections import OrderedDict
 from getpass import getpass
 import hashlib
 import json
 import os
+import queue
+import threading
 import time
 from typing import Dict
 from uuid import UUID
@@ -17,7 +20,7 @@ from halo import Halo
 
 from qdrant_client.http.models import Distance
 
-from vdf_io.constants import ID_COLUMN, INT_MAX
+from vdf_io.constants import DEFAULT_BATCH_SIZE, DEFAULT_PREFETCH, ID_COLUMN, INT_MAX
 from vdf_io.names import DBNames
 
 
@@ -420,22 +423,63 @@ def get_qdrant_id_from_id(idx):
         return str(UUID(idx))
 
 
-def read_parquet_progress(file_path, id_column, **kwargs):
+def resolve_parquet_file_path(file_path):
+    """
+    Return a local path for a parquet file, downloading it first if it is on HuggingFace Hub
+    """
     if file_path.startswith("hf://"):
         from huggingface_hub import HfFileSystem
         from huggingface_hub import hf_hub_download
 
         fs = HfFileSystem()
         resolved_path = fs.resolve_path(file_path)
-        cache_path = hf_hub_download(
+        return hf_hub_download(
             repo_id=resolved_path.repo_id,
             filename=resolved_path.path_in_repo,
             repo_type=resolved_path.repo_type,
         )
-        file_path_to_be_read = cache_path
-    else:
-        file_path = os.path.abspath(file_path)
-        file_path_to_be_read = file_path
+    return os.path.abspath(file_path)
+
+
+def iter_parquet_batches(
+    file_path,
+    id_column,
+    columns=None,
+    batch_size=DEFAULT_BATCH_SIZE,
+    max_num_rows=None,
+):
+    """
+    Yield pyarrow RecordBatches of at most batch_size rows from a parquet file.
+
+    Only the id column and the requested columns are decoded, one row group at a
+    time, and at most max_num_rows rows are yielded in total.
+    """
+    from pyarrow import parquet as pq
+
+    file_path_to_be_read = resolve_parquet_file_path(file_path)
+    pf = pq.ParquetFile(file_path_to_be_read)
+    if columns is not None:
+        missing_columns = [col for col in columns if col not in pf.schema_arrow.names]
+        if missing_columns:
+            tqdm.write(
+                f"Column(s) {missing_columns} not found in parquet file '{file_path_to_be_read}'. Skipping file."
+            )
+            return
+        columns = list(dict.fromkeys([id_column, *columns]))
+    remaining = INT_MAX if max_num_rows is None else max_num_rows
+    if remaining <= 0:
+        return
+    for batch in pf.iter_batches(batch_size=batch_size, columns=columns):
+        if batch.num_rows > remaining:
+            batch = batch.slice(0, remaining)
+        remaining -= batch.num_rows
+        yield batch
+        if remaining <= 0:
+            return
+
+
+def read_parquet_progress(file_path, id_column, **kwargs):
+    file_path_to_be_read = resolve_parquet_file_path(file_path)
     # read schema of the parquet file to check if columns are present
     from pyarrow import parquet as pq
 
@@ -473,6 +517,146 @@ def read_parquet_progress(file_path, id_column, **kwargs):
     return df
 
 
+def vector_column_to_numpy(column, dims=None):
+    """
+    Convert a vector column into a contiguous (num_valid_rows, dims) float32 matrix.
+
+    column can be a pyarrow Array/ChunkedArray or a pandas Series holding lists,
+    fixed size lists, numpy arrays, or string/bytes encoded lists ("[0.1, 0.2]").
+    Returns (matrix, valid, abnormal_format): valid is a boolean mask over the
+    input rows, False for null or malformed vectors (wrong length, unparsable text),
+    and abnormal_format is True if vectors had to be parsed from text or unwrapped.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if isinstance(column, pd.Series):
+        try:
+            column = pa.Array.from_pandas(column)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            column = pa.array(
+                [x.tolist() if isinstance(x, np.ndarray) else x for x in column]
+            )
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    num_rows = len(column)
+    abnormal_format = False
+    if pa.types.is_binary(column.type) or pa.types.is_large_binary(column.type):
+        column = column.cast(pa.string())
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        column = parse_vector_strings(column)
+        abnormal_format = True
+    if not (
+        pa.types.is_list(column.type)
+        or pa.types.is_large_list(column.type)
+        or pa.types.is_fixed_size_list(column.type)
+    ):
+        return (
+            np.empty((0, dims or 0), dtype=np.float32),
+            np.zeros(num_rows, bool),
+            False,
+        )
+    lengths = pc.list_value_length(column)
+    # vectors stored as [[...]] are unwrapped one level
+    value_type = column.type.value_type
+    if (
+        pa.types.is_list(value_type)
+        or pa.types.is_large_list(value_type)
+        or pa.types.is_fixed_size_list(value_type)
+    ) and pc.all(pc.equal(pc.fill_null(lengths, 1), 1)).as_py():
+        column = pc.list_element(column, 0)
+        abnormal_format = True
+        lengths = pc.list_value_length(column)
+    if dims is None:
+        non_null_lengths = lengths.drop_null()
+        if len(non_null_lengths) == 0:
+            return np.empty((0, 0), dtype=np.float32), np.zeros(num_rows, bool), False
+        dims = pc.mode(non_null_lengths)[0]["mode"].as_py()
+    valid = pc.fill_null(pc.equal(lengths, dims), False)
+    if not pc.all(valid).as_py():
+        column = column.filter(valid)
+    values = pc.list_flatten(column)
+    if values.null_count > 0:
+        # a null inside a vector can't be represented, drop the affected rows
+        row_has_null = np.zeros(len(column), bool)
+        row_has_null[
+            pc.list_parent_indices(column).to_numpy()[
+                values.is_null().to_numpy(zero_copy_only=False)
+            ]
+        ] = True
+        valid_idx = np.flatnonzero(valid.to_numpy(zero_copy_only=False))
+        valid = np.zeros(num_rows, bool)
+        valid[valid_idx[~row_has_null]] = True
+        column = column.filter(pa.array(~row_has_null))
+        values = pc.list_flatten(column)
+    else:
+        valid = valid.to_numpy(zero_copy_only=False)
+    try:
+        if values.type != pa.float32():
+            values = values.cast(pa.float32())
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return np.empty((0, dims), dtype=np.float32), np.zeros(num_rows, bool), False
+    if dims == 0:
+        # only empty vectors, reshape(-1, 0) can't infer the row count
+        return np.empty((len(column), 0), dtype=np.float32), valid, abnormal_format
+    # zero-copy when the parquet column is already float32
+    matrix = values.to_numpy(zero_copy_only=False).reshape(-1, dims)
+    return matrix, valid, abnormal_format
+
+
+def parse_vector_strings(column):
+    """
+    Parse a string array of encoded lists like "[0.1, 0.2]" into a list<float32> array,
+    nulling the rows that cannot be parsed.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    stripped = pc.utf8_trim(column, characters="[]() \n\t")
+    split = pc.split_pattern(stripped, pattern=",")
+    try:
+        values = pc.utf8_trim_whitespace(pc.list_flatten(split)).cast(pa.float32())
+        return pa.ListArray.from_arrays(split.offsets, values, mask=split.is_null())
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        pass
+    # some rows are malformed, parse them one by one
+    parsed = []
+    for v in column.to_pylist():
+        try:
+            parsed.append([float(x) for x in ast.literal_eval(v)])
+        except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+            parsed.append(None)
+    return pa.array(parsed, type=pa.list_(pa.float32()))
+
+
+def metadata_columns(data, exclude_columns=()):
+    """
+    Return {column_name: list of python values} for the metadata columns of a
+    pyarrow RecordBatch/Table or pandas DataFrame, skipping exclude_columns.
+    """
+    if isinstance(data, pd.DataFrame):
+        return {
+            col: data[col].tolist()
+            for col in data.columns
+            if col not in exclude_columns
+        }
+    return {
+        name: data.column(name).to_pylist()
+        for name in data.column_names
+        if name not in exclude_columns
+    }
+
+
+def metadata_payloads(data, exclude_columns=()):
+    """
+    Lazily yield one {column_name: value} payload dict per row, built column-wise
+    """
+    columns = metadata_columns(data, exclude_columns)
+    names = list(columns.keys())
+    for values in zip(*columns.values()):
+        yield dict(zip(names, values))
+
+
 def get_author_name():
     return (os.environ.get("USER", os.environ.get("USERNAME"))) or "unknown"
 
@@ -536,3 +720,66 @@ def create_turbopuffer_index_class(index_name, schema):
 
     index_class = type(class_name, (object,), class_attrs)
     return index_class
+
+
+def prefetch(iterable, depth=DEFAULT_PREFETCH):
+    """
+    Iterate over iterable in a background thread, keeping up to depth items ready.
+
+    Exceptions raised by the producer are re-raised in the consumer, and
+    closing the returned generator stops the producer.
+    """
+    yield from prefetch_chain([iterable], depth=depth)
+
+
+def prefetch_chain(iterables, workers=1, depth=DEFAULT_PREFETCH):
+    """
+    Chain iterables, iterating up to workers of them at a time in background
+    threads that keep up to depth items ready each.
+
+    Iterables are started in order, so the one being consumed always has a
+    thread and the chain cannot stall on the queues of later ones.
+    """
+    iterables = list(iterables)
+    queues = [queue.Queue(maxsize=max(1, depth)) for _ in iterables]
+    pending = iter(range(len(iterables)))
+    lock = threading.Lock()
+    stop = threading.Event()
+    done = object()
+
+    def put(items, item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        while not stop.is_set():
+            with lock:
+                k = next(pending, None)
+            if k is None:
+                return
+            try:
+                for item in iterables[k]:
+                    if not put(queues[k], (item, None)):
+                        return
+                put(queues[k], (done, None))
+            except BaseException as e:
+                put(queues[k], (done, e))
+
+    for _ in range(max(1, min(workers, len(iterables)))):
+        threading.Thread(target=produce, daemon=True).start()
+    try:
+        for items in queues:
+            while True:
+                item, error = items.get()
+                if error is not None:
+                    raise error
+                if item is done:
+                    break
+                yield item
+    finally:
+        stop.set()
@@ -0,0 +1,120 @@
+import glob
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+
+from vdf_io.export_vdf import chroma_export  # noqa: E402
+from vdf_io.export_vdf.chroma_export import ExportChroma  # noqa: E402
+
+NUM_ROWS = 1234
+DIMS = 4
+
+
+def make_store(path):
+    """
+    A persistent store whose index was flushed several times, with rows
+    still in the embeddings queue and deleted and updated rows
+    """
+    client = chromadb.PersistentClient(path=str(path))
+    col = client.create_collection(
+        "docs",
+        metadata={
+            "hnsw:space": "ip",
+            "hnsw:sync_threshold": 100,
+            "hnsw:batch_size": 50,
+        },
+    )
+    rng = np.random.default_rng(0)
+    ids = [f"id{i}" for i in range(NUM_ROWS)]
+    col.add(
+        ids=ids,
+        embeddings=rng.random((NUM_ROWS, DIMS)).tolist(),
+        metadatas=[{"n": i, "even": i % 2 == 0, "x": i / 3} for i in range(NUM_ROWS)],
+        documents=[f"document {i}" for i in range(NUM_ROWS)],
+    )
+    col.delete(ids=ids[::50])
+    updated = ids[1::70]
+    col.update(
+        ids=updated,
+        embeddings=rng.random((len(updated), DIMS)).tolist(),
+        metadatas=[{"n": -1} for _ in updated],
+    )
+    return col
+
+
+def read_export(export, collection_name):
+    files = glob.glob(os.path.join(export.vdf_directory, collection_name, "*.parquet"))
+    return pa.concat_tables(pq.read_table(file) for file in files).to_pylist()
+
+
+def assert_export_matches(export, col):
+    expected = col.get(include=["embeddings", "metadatas", "documents"])
+    rows = {row["id"]: row for row in read_export(export, "docs")}
+    assert len(rows) == len(expected["ids"]) == col.count()
+    for id, embedding, metadata, document in zip(
+        expected["ids"],
+        expected["embeddings"],
+        expected["metadatas"],
+        expected["documents"],
+    ):
+        row = rows[id]
+        np.testing.assert_allclose(row["vector"], embedding, rtol=1e-6)
+        assert row["document"] == document
+        for key, value in metadata.items():
+            assert row[key] == value
+
+
+@pytest.mark.parametrize("direct_read", [True, False])
+def test_export_matches_collection(tmp_path, monkeypatch, direct_read):
+    col = make_store(tmp_path / "store")
+    monkeypatch.chdir(tmp_path)
+    # list the ids in several pages
+    monkeypatch.setattr(chroma_export, "ID_PAGE_SIZE", 300)
+
+    export = ExportChroma(
+        {
+            "persistent_path": str(tmp_path / "store"),
+            "direct_read": direct_read,
+            "collections": "docs",
+            "batch_size": 100,
+            "library_version": "test",
+        }
+    )
+    assert export.direct_read is direct_read
+    export.get_data()
+    assert_export_matches(export, col)
+
+
+def test_persistent_ids_are_keyset_paged(tmp_path, monkeypatch):
+    col = make_store(tmp_path / "store")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(chroma_export, "ID_PAGE_SIZE", 300)
+    get_calls = []
+    collection_get = type(col).get
+
+    def recording_get(self, *args, **kwargs):
+        get_calls.append(kwargs)
+        return collection_get(self, *args, **kwargs)
+
+    monkeypatch.setattr(type(col), "get", recording_get)
+
+    export = ExportChroma(
+        {
+            "persistent_path": str(tmp_path / "store"),
+            "collections": "docs",
+            "batch_size": 100,
+            "library_version": "test",
+        }
+    )
+    assert not export.direct_read
+    export.get_data()
+    # every page is fetched by its ids, none by offset
+    assert get_calls
+    assert all(call.get("ids") for call in get_calls)
+    assert not any(call.get("offset") for call in get_calls)
+    assert_export_matches(export, col)
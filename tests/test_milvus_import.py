@@ -0,0 +1,196 @@
+import datetime
+import decimal
+import json
+import os
+from types import SimpleNamespace
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+pytest.importorskip("pymilvus")
+
+from vdf_io.import_vdf import milvus_import  # noqa: E402
+from vdf_io.import_vdf.milvus_import import ImportMilvus  # noqa: E402
+
+NUM_FILES = 2
+ROWS_PER_FILE = 150
+
+
+class BulkInsertStandIn:
+    """
+    Stands in for pymilvus.utility: a bulk insert task reads its staged file
+    and completes once it was polled a second time
+    """
+
+    def __init__(self, bulk_insert_dir):
+        self.bulk_insert_dir = bulk_insert_dir
+        self.tables = []
+        self.polls = {}
+
+    def do_bulk_insert(self, collection_name, files):
+        assert len(files) == 1
+        self.tables.append(pq.read_table(os.path.join(self.bulk_insert_dir, files[0])))
+        return len(self.tables) - 1
+
+    def get_bulk_insert_state(self, task_id):
+        self.polls[task_id] = self.polls.get(task_id, 0) + 1
+        return SimpleNamespace(
+            state=(
+                milvus_import.BulkInsertState.ImportCompleted
+                if self.polls[task_id] > 1
+                else milvus_import.BulkInsertState.ImportPending
+            ),
+            row_count=self.tables[task_id].num_rows,
+            failed_reason="",
+        )
+
+
+class CollectionStandIn:
+    """
+    Stands in for pymilvus.Collection, remembering the collections created
+    """
+
+    created = []
+
+    def __init__(self, name, schema=None):
+        fields = [SimpleNamespace(name=name) for name in ("id", "vector", "title")]
+        self.schema = schema or SimpleNamespace(fields=fields)
+        if schema is not None:
+            CollectionStandIn.created.append(name)
+        self.num_entities = 0
+        self.indexes = []
+
+    def flush(self):
+        pass
+
+    def create_index(self, field_name, index_params, index_name):
+        self.indexes.append(SimpleNamespace(field_name=field_name))
+
+
+def write_vdf(vdf_dir, namespaces=("",)):
+    data_dir = vdf_dir / "data"
+    data_dir.mkdir(parents=True)
+    for i in range(NUM_FILES):
+        ids = range(i * ROWS_PER_FILE, (i + 1) * ROWS_PER_FILE)
+        table = pa.table(
+            {
+                "id": pa.array(ids, pa.int64()),
+                "vector": pa.array([[float(j), 1.0, 2.0] for j in ids]),
+                "title": pa.array([f"title {j}" for j in ids]),
+                "score": pa.array([float("nan") if j % 2 else j / 2 for j in ids]),
+                "raw": pa.array([b"\xff\x00" if j % 3 else b"text" for j in ids]),
+                "created": pa.array(
+                    [datetime.datetime(2024, 1, 1, 0, 0, j % 60) for j in ids],
+                    pa.timestamp("us"),
+                ),
+                "price": pa.array(
+                    [decimal.Decimal("1.25") for _ in ids], pa.decimal128(5, 2)
+                ),
+                "events": pa.array(
+                    [[{"at": datetime.date(2024, 1, 2), "tag": b"x"}] for _ in ids]
+                ),
+            }
+        )
+        pq.write_table(table, data_dir / f"{i}.parquet")
+    with open(vdf_dir / "VDF_META.json", "w") as f:
+        json.dump(
+            {
+                "version": "0.1.0",
+                "indexes": {
+                    "col": [
+                        {
+                            "namespace": namespace,
+                            "data_path": "data",
+                            "dimensions": 3,
+                            "vector_columns": ["vector"],
+                        }
+                        for namespace in namespaces
+                    ]
+                },
+            },
+            f,
+        )
+
+
+@pytest.fixture
+def bulk_importer(tmp_path, monkeypatch):
+    write_vdf(tmp_path / "vdf", namespaces=("a", "b"))
+    bulk_insert_dir = tmp_path / "bulk"
+    stand_in = BulkInsertStandIn(str(bulk_insert_dir))
+    monkeypatch.setattr(milvus_import, "utility", stand_in)
+    monkeypatch.setattr(CollectionStandIn, "created", [])
+    monkeypatch.setattr(milvus_import, "Collection", CollectionStandIn)
+    monkeypatch.setattr(
+        milvus_import, "connections", SimpleNamespace(connect=lambda **kwargs: None)
+    )
+    monkeypatch.setattr(milvus_import, "BULK_INSERT_POLL_INTERVAL", 0)
+
+    def make_importer(**args):
+        return ImportMilvus(
+            {
+                "dir": str(tmp_path / "vdf"),
+                "cwd": str(tmp_path),
+                "library_version": "0.1.0",
+                "bulk_insert": True,
+                "bulk_insert_dir": str(bulk_insert_dir),
+                "resume": True,
+                **args,
+            }
+        )
+
+    return make_importer, stand_in
+
+
+def bulk_insert(importer):
+    return importer.bulk_insert_files(
+        importer.get_final_data_path("data"), "col", "vector", "vector", "id"
+    )
+
+
+def test_bulk_insert_files(bulk_importer):
+    make_importer, stand_in = bulk_importer
+    assert bulk_insert(make_importer()) == NUM_FILES * ROWS_PER_FILE
+    assert len(stand_in.tables) == NUM_FILES
+    # every task was polled until it completed
+    assert all(polls == 2 for polls in stand_in.polls.values())
+
+    rows = sorted(
+        pa.concat_tables(stand_in.tables).to_pylist(), key=lambda row: int(row["id"])
+    )
+    assert [row["id"] for row in rows] == [
+        str(j) for j in range(NUM_FILES * ROWS_PER_FILE)
+    ]
+    assert stand_in.tables[0].schema.field("vector").type == pa.list_(pa.float32())
+    assert rows[1]["vector"] == [1.0, 1.0, 2.0]
+    assert rows[1]["title"] == "title 1"
+
+    meta = json.loads(rows[1]["$meta"])
+    assert meta["score"] is None
+    assert meta["raw"] == "/wA="
+    assert meta["created"] == 1704067201000
+    assert meta["price"] == 1.25
+    assert meta["events"] == [{"at": 1704153600000, "tag": "x"}]
+    assert json.loads(rows[0]["$meta"])["raw"] == "text"
+    assert "title" not in meta
+
+
+def test_bulk_insert_files_resume(bulk_importer):
+    make_importer, stand_in = bulk_importer
+    bulk_insert(make_importer())
+    # the journal of the first run covers all files
+    assert bulk_insert(make_importer()) == 0
+    assert len(stand_in.tables) == NUM_FILES
+
+
+def test_max_num_rows_stops_before_next_namespace(bulk_importer):
+    make_importer, stand_in = bulk_importer
+    stand_in.has_collection = lambda name: False
+    stand_in.wait_for_index_building_complete = lambda *args: None
+    importer = make_importer(
+        max_num_rows=NUM_FILES * ROWS_PER_FILE, bulk_insert_min_rows=0
+    )
+    importer.upsert_data()
+    assert importer.total_imported_count == NUM_FILES * ROWS_PER_FILE
+    # the second namespace has no rows left and gets no empty collection
+    assert CollectionStandIn.created == ["col_a"]